@@ -112,7 +112,9 @@ doctype_js = {
 scheduler_events = {
 	"all": [],
 	"daily": [],
-	"daily_long": [],
+	"daily_long": [
+		"itec_integrations.itec_integrations.stylus.retention.run_scheduled_retention",
+	],
 	"hourly": [
 	"itec_integrations.itec_integrations.doctype.stylus_sync_stock_setting.stylus_sync_stock_setting.run_sync",
 	],
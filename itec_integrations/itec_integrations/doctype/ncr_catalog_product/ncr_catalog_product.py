@@ -0,0 +1,19 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class NCRCatalogProduct(Document):
+	pass
+
+
+def on_doctype_update():
+	# `name` is the product reference, so reference lookups already hit the
+	# primary key.
+	frappe.db.add_index("NCR Catalog Product", ["brand"])
+	frappe.db.add_index("NCR Catalog Product", ["category"])
+	# Small Text column: index the leading characters only.
+	frappe.db.add_index("NCR Catalog Product", ["product_name(140)"])
+	frappe.db.add_index("NCR Catalog Product", ["price"])
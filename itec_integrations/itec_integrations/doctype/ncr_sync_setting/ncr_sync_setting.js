@@ -20,6 +20,18 @@ frappe.ui.form.on('NCR Sync Setting', {
 				}
 			}
 		});
+	},
+
+	reset_circuit_breaker: function (frm) {
+		frappe.call({
+			method: 'itec_integrations.itec_integrations.doctype.ncr_sync_setting.ncr_sync_setting.reset_circuit_breaker',
+			callback: function () {
+				frappe.show_alert({
+					message: __('Circuit breaker reset'),
+					indicator: 'green'
+				});
+				frm.reload_doc();
+			}
+		});
 	}
 });
-
@@ -2,7 +2,208 @@
 # See license.txt
 
 # import frappe
+import json
+import threading
+import time
 import unittest
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from itec_integrations.itec_integrations.ncr.api import NCR_HEADERS, build_payload, fetch_products
+from itec_integrations.itec_integrations.ncr.crawler import MAX_WINDOW_SIZE, NCRCrawler, TokenBucket
+from itec_integrations.itec_integrations.utils import AIMDController, HTTPClient, RetryBudget
+
+CATALOG = {category: 50 for category in ("Informática", "Telemóveis", "Televisores")}
+LATENCY = 0.05
+
+
+class _NCRStandIn(BaseHTTPRequestHandler):
+	"""Answers productSearchV3 from a fixed catalog after `LATENCY` seconds,
+	with recordsFiltered unless `totals` is off; every `throttle_every`-th
+	request gets a 429 instead."""
+
+	def do_POST(self):
+		payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+		with self.server.lock:
+			self.server.requests += 1
+			self.server.active += 1
+			self.server.peak = max(self.server.peak, self.server.active)
+			throttled = self.server.throttle_every and self.server.requests % self.server.throttle_every == 0
+		try:
+			time.sleep(LATENCY)
+			if throttled:
+				self.send_response(429)
+				self.end_headers()
+				return
+			variables = payload["variables"]
+			category = variables["query"]
+			# VTEX reads `from` and `to` as inclusive positions.
+			references = range(CATALOG[category])[variables["from"] : variables["to"] + 1]
+			with self.server.lock:
+				self.server.windows.append((category, variables["from"], variables["to"]))
+			search = {"recordsFiltered": CATALOG[category]} if self.server.totals else {}
+			body = json.dumps(
+				{
+					"data": {
+						"productSearch": {
+							**search,
+							"products": [
+								{
+									"productReference": f"{category}-{reference}",
+									"productName": f"Product {reference}",
+									"brand": "Brand",
+									"priceRange": {"sellingPrice": {"lowPrice": 100 + reference}},
+								}
+								for reference in references
+							]
+						}
+					}
+				}
+			).encode()
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		finally:
+			with self.server.lock:
+				self.server.active -= 1
+
+	def log_message(self, *args):
+		pass
+
 
 class TestNCRSyncSetting(unittest.TestCase):
-	pass
+	def serve(self, throttle_every=0, totals=True):
+		server = ThreadingHTTPServer(("127.0.0.1", 0), _NCRStandIn)
+		server.lock = threading.Lock()
+		server.requests = server.active = server.peak = 0
+		server.windows = []
+		server.throttle_every = throttle_every
+		server.totals = totals
+		thread = threading.Thread(target=server.serve_forever, daemon=True)
+		thread.start()
+		self.addCleanup(server.server_close)
+		self.addCleanup(server.shutdown)
+		return server, f"http://127.0.0.1:{server.server_port}/_v/segment/graphql/v1"
+
+	def crawl(self, url, **kwargs):
+		kwargs = {"rate": 200, "pause": 0, "backoff": 0.01, **kwargs}
+		crawler = NCRCrawler(partial(fetch_products, url, NCR_HEADERS, "hash"), url, **kwargs)
+		return crawler.run(list(CATALOG))
+
+	def assert_windows_tile_catalog(self, windows):
+		"""Every product is asked for by exactly one window."""
+		for category, count in CATALOG.items():
+			covered = sorted((start, end) for name, start, end in windows if name == category)
+			self.assertEqual(covered[0][0], 0)
+			self.assertEqual(covered[-1][1], count - 1)
+			for (_start, end), (start, _end) in zip(covered, covered[1:]):
+				self.assertEqual(start, end + 1)
+
+	def assert_complete(self, result):
+		for category, count in CATALOG.items():
+			references = [product["productReference"] for product in result.category_products(category)]
+			self.assertEqual(references, [f"{category}-{reference}" for reference in range(count)])
+		self.assertFalse(result.failed_windows)
+		self.assertFalse(result.incomplete)
+
+	def test_concurrent_crawl_is_complete_and_faster(self):
+		server, url = self.serve()
+		sequential = self.crawl(url, max_workers=1, per_host=1, lookahead=1)
+		concurrent = self.crawl(url, max_workers=8, per_host=6, lookahead=3)
+
+		self.assert_complete(sequential)
+		self.assert_complete(concurrent)
+		self.assertLessEqual(server.peak, 6)
+		self.assertLess(concurrent.elapsed * 2.5, sequential.elapsed)
+
+	def test_planned_crawl_needs_no_probing(self):
+		server, url = self.serve()
+		result = self.crawl(url, max_workers=4, per_host=4)
+
+		self.assert_complete(result)
+		self.assertEqual(result.totals, CATALOG)
+		# Every window after the first is planned from the total: none asks
+		# for products past the end of its category, and none overlap.
+		self.assertTrue(all(end < 50 for _category, _start, end in server.windows))
+		self.assert_windows_tile_catalog(server.windows)
+		self.assertEqual(result.requests, len(server.windows))
+
+	def test_defaults_keep_baseline_load(self):
+		server, url = self.serve()
+		started = time.monotonic()
+		result = NCRCrawler(partial(fetch_products, url, NCR_HEADERS, "hash"), url).run(list(CATALOG))
+
+		self.assert_complete(result)
+		self.assert_windows_tile_catalog(server.windows)
+		self.assertEqual(server.peak, 1)
+		self.assertTrue(all(end - start + 1 <= MAX_WINDOW_SIZE for _category, start, end in server.windows))
+		# Each request is followed by the pause before the next one.
+		self.assertGreaterEqual(time.monotonic() - started, len(server.windows) * (LATENCY + 0.1))
+
+	def test_crawl_without_totals_stops_at_short_page(self):
+		_server, url = self.serve(totals=False)
+		result = self.crawl(url, max_workers=4, per_host=4, lookahead=2)
+
+		self.assert_complete(result)
+		self.assertEqual(result.totals, {})
+
+	def test_throttled_windows_are_retried(self):
+		_server, url = self.serve(throttle_every=4)
+		result = self.crawl(url, max_workers=4, per_host=4, lookahead=2)
+
+		self.assert_complete(result)
+		self.assertTrue(result.errors)
+		self.assertTrue(all(error.status == 429 for error in result.errors))
+
+	def test_retries_stop_when_budget_is_spent(self):
+		_server, url = self.serve(throttle_every=2)
+		budget = RetryBudget(ratio=0, minimum=1)
+		result = self.crawl(url, max_workers=2, per_host=2, lookahead=1, allow_retry=budget.try_spend)
+
+		# Only one throttled window was re-queued; the others were given up on.
+		self.assertTrue(result.failed_windows)
+		self.assertEqual(len(result.errors) - len(result.failed_windows), 1)
+
+	def test_http_client_retries_within_budget(self):
+		server, url = self.serve(throttle_every=2)
+		client = HTTPClient(backoff=0.01, budget=RetryBudget(ratio=0, minimum=1))
+		payload = build_payload("Informática", 0, 12, "hash")
+
+		# The 2nd request is throttled and retried; the 4th would need a
+		# second retry, which the budget no longer allows.
+		self.assertEqual(client.post(url, json=payload).status_code, 200)
+		self.assertEqual(client.post(url, json=payload).status_code, 200)
+		self.assertEqual(client.post(url, json=payload).status_code, 429)
+
+		metrics = client.get_metrics()[f"127.0.0.1:{server.server_port}"]
+		self.assertEqual((metrics["requests"], metrics["retries"], metrics["errors"]), (4, 1, 2))
+		self.assertGreaterEqual(metrics["max_ms"], LATENCY * 1000)
+
+	def test_aimd_controller(self):
+		clock = [0.0]
+		controller = AIMDController(12, 3, 50, target_latency=1.0, clock=lambda: clock[0])
+
+		self.assertEqual(controller.record(0.2, started=0.0), 13)
+		self.assertEqual(controller.record(2.0, started=0.0), 6)
+		# Requests sent before the decrease do not shrink the size again.
+		self.assertEqual(controller.record(None, ok=False, started=-1.0), 6)
+		clock[0] = 1.0
+		self.assertEqual(controller.record(None, ok=False, started=0.5), 3)
+		self.assertEqual(controller.record(None, ok=False, started=2.0), 3)
+		for _ in range(100):
+			controller.record(0.1)
+		self.assertEqual(controller.value, 50)
+
+	def test_token_bucket_rate(self):
+		clock = [0.0]
+
+		def sleep(seconds):
+			clock[0] += seconds
+
+		bucket = TokenBucket(rate=5, capacity=5, clock=lambda: clock[0], sleep=sleep)
+		for _ in range(25):
+			bucket.acquire()
+		# The burst of 5 is free, the other 20 come at 5 per second.
+		self.assertAlmostEqual(clock[0], 4.0, places=6)
@@ -0,0 +1,15 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StylusCurrentStock(Document):
+	pass
+
+
+def on_doctype_update():
+	# `name` is the code, so code lookups already hit the primary key.
+	frappe.db.add_index("Stylus Current Stock", ["brand"])
+	frappe.db.add_index("Stylus Current Stock", ["main_category"])
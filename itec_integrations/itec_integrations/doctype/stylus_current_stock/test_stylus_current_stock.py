@@ -0,0 +1,8 @@
+# Copyright (c) 2026, Abbass Chokor and Contributors
+# See license.txt
+
+# import frappe
+import unittest
+
+class TestStylusCurrentStock(unittest.TestCase):
+	pass
@@ -1,8 +1,18 @@
 # Copyright (c) 2026, Abbass Chokor and contributors
 # For license information, please see license.txt
 
+import frappe
 from frappe.model.document import Document
 
 
 class StylusPriceChangeLog(Document):
 	pass
+
+
+def on_doctype_update():
+	# One log per code per history keeps the backfill idempotent with INSERT IGNORE.
+	frappe.db.add_unique(
+		"Stylus Price Change Log", ["stock_history", "code"], constraint_name="unique_stock_history_code"
+	)
+	# Price change stats are refreshed one day of sync_datetime at a time.
+	frappe.db.add_index("Stylus Price Change Log", ["sync_datetime"])
@@ -0,0 +1,17 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StylusPriceChangeStat(Document):
+	pass
+
+
+def on_doctype_update():
+	# Rows are named "<dimension>|<value>|<day>"; the analytics API reads one
+	# dimension over a range of days.
+	frappe.db.add_index(
+		"Stylus Price Change Stat", ["dimension", "day", "dimension_value"], index_name="dimension_day_index"
+	)
@@ -0,0 +1,97 @@
+# Copyright (c) 2026, Abbass Chokor and Contributors
+# See license.txt
+
+import unittest
+
+import frappe
+from frappe.utils import flt
+
+from itec_integrations.itec_integrations.stylus.price_stats import (
+	get_repricing_summary,
+	get_top_movers,
+	refresh_price_change_stats,
+)
+
+FIRST_DAY = "2099-03-01"
+SECOND_DAY = "2099-03-02"
+
+
+class TestStylusPriceChangeStat(unittest.TestCase):
+	def setUp(self):
+		self.addCleanup(frappe.db.rollback)
+		# (code, brand, main category, day, old price, new price); the days
+		# are far in the future so the site's own logs never count.
+		for code, brand, main_category, day, old_price, new_price in (
+			("_TEST-A", "_Test Brand X", "_Test Category 1", FIRST_DAY, 10, 12),
+			("_TEST-A", "_Test Brand X", "_Test Category 1", SECOND_DAY, 12, 9),
+			("_TEST-B", "_Test Brand X", "_Test Category 2", FIRST_DAY, 100, 110),
+			("_TEST-C", "_Test Brand Y", "_Test Category 1", FIRST_DAY, 50, 45),
+		):
+			frappe.get_doc(
+				{
+					"doctype": "Stylus Price Change Log",
+					"code": code,
+					"brand": brand,
+					"main_category": main_category,
+					"sync_datetime": f"{day} 08:00:00",
+					"old_price": old_price,
+					"new_price": new_price,
+					"change_amount": new_price - old_price,
+					"change_pct": (new_price - old_price) / old_price * 100,
+					"direction": "Increase" if new_price > old_price else "Decrease",
+				}
+			).insert(ignore_permissions=True)
+		refresh_price_change_stats([FIRST_DAY, SECOND_DAY])
+
+	def counts(self, rows):
+		return {
+			row.value: (
+				flt(row.change_count),
+				flt(row.increase_count),
+				flt(row.decrease_count),
+				row.avg_change_pct,
+				flt(row.sum_change_amount),
+			)
+			for row in rows
+		}
+
+	def test_top_movers(self):
+		movers = get_top_movers(FIRST_DAY, SECOND_DAY)
+		self.assertEqual(movers[0].value, "_TEST-A")
+		self.assertEqual(
+			self.counts(movers),
+			{
+				"_TEST-A": (2, 1, 1, -2.5, -1),
+				"_TEST-B": (1, 1, 0, 10.0, 10),
+				"_TEST-C": (1, 0, 1, -10.0, -5),
+			},
+		)
+
+		by_amount = get_top_movers(FIRST_DAY, SECOND_DAY, order_by="change_amount", limit=1)
+		self.assertEqual([row.value for row in by_amount], ["_TEST-B"])
+
+		of_brand = get_top_movers(FIRST_DAY, SECOND_DAY, brand="_Test Brand X")
+		self.assertEqual({row.value for row in of_brand}, {"_TEST-A", "_TEST-B"})
+
+		second_day = get_top_movers(SECOND_DAY, SECOND_DAY)
+		self.assertEqual(self.counts(second_day), {"_TEST-A": (1, 0, 1, -25.0, -3)})
+
+	def test_repricing_summary(self):
+		by_brand = get_repricing_summary(FIRST_DAY, SECOND_DAY, dimension="brand")
+		self.assertEqual([row.value for row in by_brand], ["_Test Brand X", "_Test Brand Y"])
+		self.assertEqual(
+			self.counts(by_brand),
+			{"_Test Brand X": (3, 2, 1, 1.667, 9), "_Test Brand Y": (1, 0, 1, -10.0, -5)},
+		)
+
+		by_category = get_repricing_summary(FIRST_DAY, SECOND_DAY)
+		self.assertEqual(
+			self.counts(by_category),
+			{"_Test Category 1": (3, 1, 2, -5.0, -6), "_Test Category 2": (1, 1, 0, 10.0, 10)},
+		)
+
+	def test_refresh_does_not_double_count(self):
+		refresh_price_change_stats([FIRST_DAY, SECOND_DAY])
+
+		by_brand = get_repricing_summary(FIRST_DAY, SECOND_DAY, dimension="brand")
+		self.assertEqual(self.counts(by_brand)["_Test Brand X"][0], 3)
@@ -0,0 +1,15 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StylusSearchTrigram(Document):
+	pass
+
+
+def on_doctype_update():
+	# Lookups resolve (field, trigram) to codes; removals go by code.
+	frappe.db.add_index("Stylus Search Trigram", ["field", "trigram", "code"], index_name="field_trigram_code")
+	frappe.db.add_index("Stylus Search Trigram", ["code"])
@@ -0,0 +1,18 @@
+# Copyright (c) 2026, Abbass Chokor and Contributors
+# See license.txt
+
+import unicodedata
+import unittest
+
+from itec_integrations.itec_integrations.stylus.search import normalize_text, trigrams
+
+
+class TestStylusSearchTrigram(unittest.TestCase):
+	def test_trigrams_ignore_case_and_accents(self):
+		self.assertEqual(trigrams(" Câble Ação "), {"cab", "abl", "ble", "le ", "e a", " ac", "aca", "cao"})
+		# Composed and decomposed accents index the same way.
+		decomposed = unicodedata.normalize("NFD", "Pré-Venda")
+		self.assertEqual(trigrams(decomposed), trigrams("PRÉ-VENDA"))
+		self.assertEqual(trigrams("pre-venda"), trigrams("PRÉ-VENDA"))
+		self.assertEqual(normalize_text("Straße"), "strasse")
+		self.assertEqual(trigrams("ab"), set())
@@ -0,0 +1,14 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StylusStockDaily(Document):
+	pass
+
+
+def on_doctype_update():
+	# Rows are named "<code>@<day>"; the pivot reads whole days across codes.
+	frappe.db.add_index("Stylus Stock Daily", ["day", "code"], index_name="day_code_index")
@@ -1,8 +1,232 @@
 # Copyright (c) 2025, Abbass Chokor and Contributors
 # See license.txt
 
-# import frappe
 import unittest
+from datetime import date
+from functools import partial
+from unittest.mock import patch
+
+import frappe
+
+from itec_integrations.itec_integrations.stylus import sync
+from itec_integrations.itec_integrations.stylus.ingest import insert_history_items, normalize_item
+from itec_integrations.itec_integrations.stylus.retention import plan_retention
+from itec_integrations.itec_integrations.stylus.snapshots import (
+	DELTA,
+	FULL,
+	fold_histories,
+	get_chain,
+	get_state,
+	row_fingerprint,
+)
+from itec_integrations.itec_integrations.utils import chunked
+
+
+def catalog_rows(*items):
+	"""Normalized catalog rows from (code, stock, price) tuples."""
+	return [
+		normalize_item(
+			{
+				"CODE": code,
+				"DESIGNATION": f"Test item {code}",
+				"PRICE": price,
+				"STOCK": stock,
+				"CATEGORIA_PRINCIPAL": "Test",
+				"MARCA": "Test",
+			}
+		)
+		for code, stock, price in items
+	]
+
+
+def removal(code, price):
+	return {"code": code, "price": price, "stock": 0, "is_removed": 1}
+
 
 class TestStylusStockHistory(unittest.TestCase):
-	pass
+	def setUp(self):
+		self.addCleanup(frappe.db.rollback)
+
+	def make_history(self, snapshot_type, creation, rows):
+		"""A history stored at `creation` holding exactly `rows`. Dates are far
+		in the future so the site's own histories never join the chain."""
+		doc = frappe.get_doc({"doctype": "Stylus Stock History", "snapshot_type": snapshot_type})
+		doc.insert(ignore_permissions=True)
+		frappe.db.set_value(
+			"Stylus Stock History",
+			doc.name,
+			{"creation": creation, "modified": creation, "item_count": len(rows), "stored_count": len(rows)},
+			update_modified=False,
+		)
+		doc.creation = doc.modified = frappe.utils.get_datetime(creation)
+		for row in rows:
+			row.setdefault("is_removed", 0)
+			row["row_hash"] = row_fingerprint(row)
+		insert_history_items(doc, rows)
+		return doc.name
+
+	def state(self, history):
+		return {row.code: (row.stock, row.price) for row in get_state(history, fields=("code", "stock", "price"))}
+
+	def retention_groups(self, histories, **kwargs):
+		"""plan_retention's groups among `histories` (creation -> name), as
+		(kept creation, [removed creations])."""
+		creations = {name: creation for creation, name in histories.items()}
+		return [
+			(creations[keep], [creations[name] for name in remove_names])
+			for keep, remove_names in plan_retention(**kwargs)
+			if keep in creations
+		]
+
+	def delete_histories(self, names):
+		frappe.db.delete("Stylus Stock History Item", {"parent": ["in", names]})
+		frappe.db.delete("Stylus Stock History", {"name": ["in", names]})
+
+	def test_state_overlays_deltas_on_keyframe(self):
+		keyframe = self.make_history(
+			FULL, "2099-01-01 08:00:00", catalog_rows(("_TEST-A", 1, 10), ("_TEST-B", 2, 20), ("_TEST-C", 3, 30))
+		)
+		# Adds D, changes A and removes B.
+		first = self.make_history(
+			DELTA,
+			"2099-01-02 08:00:00",
+			catalog_rows(("_TEST-A", 5, 10), ("_TEST-D", 4, 40)) + [removal("_TEST-B", 20)],
+		)
+		# Changes A again and brings B back.
+		second = self.make_history(
+			DELTA, "2099-01-03 08:00:00", catalog_rows(("_TEST-A", 6, 12), ("_TEST-B", 7, 21))
+		)
+
+		self.assertEqual(
+			self.state(keyframe), {"_TEST-A": (1, 10), "_TEST-B": (2, 20), "_TEST-C": (3, 30)}
+		)
+		self.assertEqual(
+			self.state(first), {"_TEST-A": (5, 10), "_TEST-C": (3, 30), "_TEST-D": (4, 40)}
+		)
+		self.assertEqual(
+			self.state(second),
+			{"_TEST-A": (6, 12), "_TEST-B": (7, 21), "_TEST-C": (3, 30), "_TEST-D": (4, 40)},
+		)
+
+	def test_chain_starts_at_latest_keyframe(self):
+		first_keyframe = self.make_history(
+			FULL, "2099-01-01 08:00:00", catalog_rows(("_TEST-A", 1, 10), ("_TEST-B", 2, 20))
+		)
+		delta = self.make_history(DELTA, "2099-01-02 08:00:00", catalog_rows(("_TEST-B", 3, 20)))
+		# B is missing from the new keyframe, so it left the catalog even though
+		# no removal marker was stored.
+		second_keyframe = self.make_history(FULL, "2099-01-03 08:00:00", catalog_rows(("_TEST-A", 4, 10)))
+		last = self.make_history(DELTA, "2099-01-04 08:00:00", catalog_rows(("_TEST-C", 5, 50)))
+
+		self.assertEqual(get_chain(delta), [first_keyframe, delta])
+		self.assertEqual(get_chain(last), [second_keyframe, last])
+		self.assertEqual(self.state(delta), {"_TEST-A": (1, 10), "_TEST-B": (3, 20)})
+		self.assertEqual(self.state(last), {"_TEST-A": (4, 10), "_TEST-C": (5, 50)})
+
+	def test_fold_keeps_state_of_delta_survivor(self):
+		self.make_history(FULL, "2099-01-01 08:00:00", catalog_rows(("_TEST-A", 1, 10), ("_TEST-B", 2, 20)))
+		first = self.make_history(
+			DELTA, "2099-01-02 08:00:00", catalog_rows(("_TEST-A", 3, 10), ("_TEST-C", 4, 40))
+		)
+		second = self.make_history(
+			DELTA, "2099-01-02 12:00:00", catalog_rows(("_TEST-A", 5, 11)) + [removal("_TEST-B", 20)]
+		)
+		keep = self.make_history(DELTA, "2099-01-02 18:00:00", catalog_rows(("_TEST-C", 6, 40)))
+		expected = self.state(keep)
+
+		fold_histories(keep, [first, second])
+		self.delete_histories([first, second])
+
+		self.assertEqual(self.state(keep), expected)
+		self.assertEqual(expected, {"_TEST-A": (5, 11), "_TEST-C": (6, 40)})
+		self.assertEqual(frappe.db.get_value("Stylus Stock History", keep, "snapshot_type"), DELTA)
+
+	def test_fold_across_keyframe_makes_survivor_a_keyframe(self):
+		self.make_history(FULL, "2099-01-01 08:00:00", catalog_rows(("_TEST-A", 1, 10), ("_TEST-Z", 9, 90)))
+		first = self.make_history(DELTA, "2099-01-02 08:00:00", catalog_rows(("_TEST-Z", 8, 90)))
+		keyframe = self.make_history(
+			FULL, "2099-01-02 10:00:00", catalog_rows(("_TEST-A", 2, 10), ("_TEST-B", 3, 30))
+		)
+		second = self.make_history(DELTA, "2099-01-02 12:00:00", catalog_rows(("_TEST-B", 4, 30)))
+		keep = self.make_history(DELTA, "2099-01-02 18:00:00", catalog_rows(("_TEST-A", 5, 10)))
+		expected = self.state(keep)
+
+		fold_histories(keep, [first, keyframe, second])
+		self.delete_histories([first, keyframe, second])
+
+		# Z only appears before the folded keyframe and must not come back.
+		self.assertEqual(expected, {"_TEST-A": (5, 10), "_TEST-B": (4, 30)})
+		self.assertEqual(frappe.db.get_value("Stylus Stock History", keep, "snapshot_type"), FULL)
+		self.assertEqual(get_chain(keep), [keep])
+		self.assertEqual(self.state(keep), expected)
+
+	def test_insert_snapshot_numbers_rows_across_chunks(self):
+		rows = catalog_rows(*((f"_TEST-{n}", n, 10 + n) for n in range(5)))
+		# Chunks of two put the boundaries after the 2nd and 4th rows.
+		with patch.object(sync, "chunked", partial(chunked, size=2)):
+			name = sync.insert_snapshot(frappe._dict(storage_mode=FULL), rows)
+
+		history = frappe.db.get_value(
+			"Stylus Stock History", name, ["creation", "item_count", "stored_count"], as_dict=True
+		)
+		items = frappe.get_all(
+			"Stylus Stock History Item",
+			filters={"parent": name},
+			fields=["code", "idx", "parenttype", "parentfield", "creation", "stock"],
+			order_by="idx asc",
+		)
+		self.assertEqual([item.code for item in items], [f"_TEST-{n}" for n in range(5)])
+		self.assertEqual([item.idx for item in items], [1, 2, 3, 4, 5])
+		self.assertEqual([item.stock for item in items], [0, 1, 2, 3, 4])
+		for item in items:
+			self.assertEqual((item.parenttype, item.parentfield), ("Stylus Stock History", "items"))
+			self.assertEqual(item.creation, history.creation)
+		self.assertEqual((history.item_count, history.stored_count), (5, 5))
+
+	def test_retention_tiers_at_window_boundaries(self):
+		creations = (
+			# Inside the full-detail window (30 days before 2099-09-01).
+			"2099-08-02 00:00:00",
+			"2099-08-02 10:00:00",
+			# Last day before it: one history per day.
+			"2099-08-01 09:00:00",
+			"2099-08-01 23:59:59",
+			# The daily window (60 days) starts on Monday 2099-06-29, the
+			# week holding 2099-07-03.
+			"2099-06-29 08:00:00",
+			"2099-06-29 12:00:00",
+			# The week before it is collapsed to its last history.
+			"2099-06-22 10:00:00",
+			"2099-06-28 08:00:00",
+			"2099-06-28 12:00:00",
+		)
+		histories = {creation: self.make_history(FULL, creation, []) for creation in creations}
+
+		self.assertEqual(
+			self.retention_groups(histories, full_days=30, daily_days=60, today="2099-09-01"),
+			[
+				("2099-06-28 12:00:00", ["2099-06-22 10:00:00", "2099-06-28 08:00:00"]),
+				("2099-06-29 12:00:00", ["2099-06-29 08:00:00"]),
+				("2099-08-01 23:59:59", ["2099-08-01 09:00:00"]),
+			],
+		)
+
+	def test_retention_weeks_across_year_end(self):
+		# ISO week 1 of 2099 runs from Monday 2098-12-29 to Sunday 2099-01-04.
+		creations = (
+			"2098-12-22 08:00:00",
+			"2098-12-28 08:00:00",
+			"2098-12-29 08:00:00",
+			"2099-01-01 08:00:00",
+			"2099-01-04 08:00:00",
+			"2099-01-05 08:00:00",
+		)
+		histories = {creation: self.make_history(FULL, creation, []) for creation in creations}
+
+		self.assertEqual(
+			self.retention_groups(histories, full_days=30, daily_days=60, today=date(2099, 9, 1)),
+			[
+				("2098-12-28 08:00:00", ["2098-12-22 08:00:00"]),
+				("2099-01-04 08:00:00", ["2098-12-29 08:00:00", "2099-01-01 08:00:00"]),
+			],
+		)
@@ -1,8 +1,12 @@
 # Copyright (c) 2025, Abbass Chokor and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 class StylusStockHistoryItem(Document):
 	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Stylus Stock History Item", ["creation"])
@@ -0,0 +1,16 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class StylusStockSeries(Document):
+	pass
+
+
+def on_doctype_update():
+	# Rows are named "<code>@<ts>", so the primary key already clusters them
+	# by code then time; the composite index serves the (code, ts) range reads.
+	frappe.db.add_index("Stylus Stock Series", ["code", "ts"], index_name="code_ts_index")
+	frappe.db.add_index("Stylus Stock Series", ["ts"])
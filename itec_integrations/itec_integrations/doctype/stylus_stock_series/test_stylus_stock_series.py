@@ -0,0 +1,258 @@
+# Copyright (c) 2026, Abbass Chokor and Contributors
+# See license.txt
+
+import math
+import unittest
+from datetime import datetime, timezone
+
+import numpy as np
+
+import frappe
+
+from itec_integrations.itec_integrations.page.stylus_stock_variance.stylus_stock_variance import (
+	_build_compact_items,
+	_build_items,
+)
+from itec_integrations.itec_integrations.stylus.variance import VarianceColumns
+
+
+def columns_from(points, opening, opening_price=None):
+	"""VarianceColumns over (code, ts, stock, price) tuples sorted by (code, ts)."""
+	return VarianceColumns(
+		np.array([point[0] for point in points], dtype=object),
+		[point[1] for point in points],
+		np.array([point[2] for point in points], dtype=float),
+		np.array([point[3] for point in points], dtype=float),
+		opening,
+		opening_price,
+	)
+
+
+def catalog(*codes):
+	return [frappe._dict(code=code, designation=f"Test item {code}", price=0) for code in codes]
+
+
+def reference_item(points, opening_balance):
+	"""Differences, totals and compressed history of one code as the per-row
+	dict code computed them before the columnar engine."""
+	label = lambda ts: ts.strftime("%Y-%m-%d %H:%M")
+	date = lambda ts: ts.strftime("%d-%m-%Y")
+	differences = []
+	totals = {"positive": 0.0, "negative": 0.0}
+	previous_stock, previous_label = opening_balance, "Opening"
+	for _code, ts, stock, price in points:
+		diff = round(stock - previous_stock, 3)
+		if diff:
+			differences.append(
+				{
+					"period": f"{previous_label} → {label(ts)}",
+					"date": date(ts),
+					"difference": diff,
+					"stock": round(stock, 3),
+					"price": price,
+				}
+			)
+			totals["positive" if diff > 0 else "negative"] = round(
+				totals["positive" if diff > 0 else "negative"] + diff, 3
+			)
+		previous_stock, previous_label = stock, label(ts)
+
+	history = [{"label": "Opening", "date": "Opening", "stock": round(opening_balance, 3), "price": None}]
+	last_stock, last_price = round(opening_balance, 3), None
+	for _code, ts, stock, price in points:
+		if round(stock, 3) != last_stock or price != last_price:
+			history.append({"label": label(ts), "date": date(ts), "stock": round(stock, 3), "price": price})
+			last_stock, last_price = round(stock, 3), price
+
+	return {
+		"differences": differences,
+		"totals": totals,
+		"history": history,
+		"last_updated": label(points[-1][1]) if points else None,
+	}
+
+
+def decode_compact(message):
+	"""Python port of the page's `decode_compact`, which turns the compact
+	payload back into the verbose items."""
+	scale = message.get("scale") or 1
+	points = []
+	for seconds in message.get("axis") or []:
+		moment = datetime.fromtimestamp(seconds, timezone.utc)
+		points.append({"label": moment.strftime("%Y-%m-%d %H:%M"), "date": moment.strftime("%d-%m-%Y")})
+
+	items = []
+	for item in message.get("items") or []:
+		stock = item.get("o") or 0
+		history = [{"label": "Opening", "date": "Opening", "stock": stock / scale, "price": None}]
+		differences = []
+		for i, axis_index in enumerate(item.get("t") or []):
+			previous = stock
+			point = points[axis_index]
+			price = item["p"][i]
+			stock += item["s"][i]
+			history.append({"label": point["label"], "date": point["date"], "stock": stock / scale, "price": price})
+			if stock != previous:
+				start = "Opening" if item["q"][i] < 0 else points[item["q"][i]]["label"]
+				differences.append(
+					{
+						"period": f"{start} → {point['label']}",
+						"date": point["date"],
+						"difference": (stock - previous) / scale,
+						"stock": stock / scale,
+						"price": price,
+					}
+				)
+		items.append(
+			{
+				"code": item.get("code"),
+				"designation": item.get("designation"),
+				"main_category": item.get("main_category"),
+				"brand": item.get("brand"),
+				"price": item.get("price"),
+				"history": history,
+				"differences": differences,
+				"totals": {"positive": item["totals"][0], "negative": item["totals"][1]},
+				"last_updated": points[item["u"]]["label"] if item.get("u", -1) >= 0 else None,
+				"opening_balance": (item.get("o") or 0) / scale,
+				"description_hash": item.get("description_hash"),
+			}
+		)
+	return items
+
+
+def plain(value):
+	"""`value` with NaN replaced so that equal structures compare equal."""
+	if isinstance(value, dict):
+		return {key: plain(item) for key, item in value.items()}
+	if isinstance(value, list):
+		return [plain(item) for item in value]
+	if isinstance(value, float) and math.isnan(value):
+		return "NaN"
+	return value
+
+
+class TestStylusStockSeries(unittest.TestCase):
+	def test_variance_matches_per_row_computation(self):
+		points = [
+			# Unchanged from its opening balance, then a price change only.
+			("A", datetime(2026, 3, 1, 8), 5, 10),
+			("A", datetime(2026, 3, 2, 8), 5, 12),
+			# New code: no opening balance, so its first point counts in full.
+			("B", datetime(2026, 3, 1, 9), 3, 20),
+			("B", datetime(2026, 3, 1, 18), 7, 20),
+			("B", datetime(2026, 3, 3, 8), 2.5, 20),
+			# Removed from stock: the last point drops to zero.
+			("C", datetime(2026, 3, 2, 9), 4, 30),
+			("C", datetime(2026, 3, 4, 9), 0, 30),
+		]
+		opening = {"A": 5.0, "C": 6.0}
+		columns = columns_from(points, opening)
+		items = _build_items(columns, catalog("A", "B", "C"))
+
+		for item in items:
+			own = [point for point in points if point[0] == item["code"]]
+			expected = reference_item(own, opening.get(item["code"], 0.0))
+			self.assertEqual({key: item[key] for key in expected}, expected)
+
+		self.assertEqual([item["totals"] for item in items], [
+			{"positive": 0.0, "negative": 0.0},
+			{"positive": 7.0, "negative": -4.5},
+			{"positive": 0.0, "negative": -6.0},
+		])
+
+	def test_summary_counts_new_removed_and_unchanged_codes(self):
+		points = [
+			("A", datetime(2026, 3, 1, 8), 5, 10),
+			("B", datetime(2026, 3, 1, 9), 3, 20),
+			("B", datetime(2026, 3, 2, 9), 8, 20),
+			("C", datetime(2026, 3, 2, 9), 0, 30),
+		]
+		summary = columns_from(points, {"A": 5.0, "C": 6.0}).summary()
+
+		self.assertEqual([row["code"] for row in summary], ["A", "B", "C"])
+		self.assertEqual(
+			[(row["opening"], row["closing"], row["positive"], row["negative"], row["net"]) for row in summary],
+			[(5.0, 5.0, 0.0, 0.0, 0.0), (0.0, 8.0, 8.0, 0.0, 8.0), (6.0, 0.0, 0.0, -6.0, -6.0)],
+		)
+		self.assertEqual([row["changes"] for row in summary], [0, 2, 1])
+		self.assertEqual(
+			[row["last_change"] for row in summary], [None, datetime(2026, 3, 2, 9), datetime(2026, 3, 2, 9)]
+		)
+
+	def test_zero_and_nan_prices(self):
+		points = [
+			("A", datetime(2026, 3, 1, 8), 1, 0),
+			("A", datetime(2026, 3, 2, 8), 1, 0),
+			("A", datetime(2026, 3, 3, 8), 2, 15),
+			("B", datetime(2026, 3, 1, 8), 1, math.nan),
+			("B", datetime(2026, 3, 2, 8), 1, math.nan),
+		]
+		columns = columns_from(points, {})
+		items = _build_items(columns, catalog("A", "B"))
+
+		for item in items:
+			own = [point for point in points if point[0] == item["code"]]
+			expected = reference_item(own, 0.0)
+			self.assertEqual(plain({key: item[key] for key in expected}), plain(expected))
+
+		# A zero price is skipped when picking the item's price; stock
+		# movement never depends on prices.
+		self.assertEqual(items[0]["price"], 15.0)
+		self.assertEqual(columns.diff.tolist(), [1.0, 0.0, 1.0, 1.0, 0.0])
+		# NaN never equals itself, so every NaN-priced point is kept.
+		self.assertEqual(len(items[1]["history"]), 3)
+
+	def test_items_follow_catalog_order(self):
+		points = [
+			("A", datetime(2026, 3, 1, 8), 1, 10),
+			("A", datetime(2026, 3, 2, 8), 2, 10),
+			("C", datetime(2026, 3, 1, 8), 3, 30),
+		]
+		columns = columns_from(points, {"B": 4.0})
+
+		self.assertEqual(list(columns.segments()), [(0, "A", 0, 2), (1, "C", 2, 3)])
+		items = _build_items(columns, catalog("C", "B", "A"))
+		self.assertEqual([item["code"] for item in items], ["C", "B", "A"])
+		# A code without points in range only shows its opening balance.
+		self.assertEqual(items[1]["history"], [{"label": "Opening", "date": "Opening", "stock": 4.0, "price": None}])
+		self.assertEqual((items[1]["differences"], items[1]["last_updated"]), ([], None))
+		self.assertEqual(
+			[entry["label"] for entry in items[2]["history"]], ["Opening", "2026-03-01 08:00", "2026-03-02 08:00"]
+		)
+
+	def test_empty_columns(self):
+		columns = VarianceColumns.empty()
+
+		self.assertEqual(columns.summary(), [])
+		self.assertEqual(_build_items(columns, catalog("A"))[0]["totals"], {"positive": 0.0, "negative": 0.0})
+
+	def test_compact_payload_decodes_to_verbose_items(self):
+		points = [
+			("A", datetime(2026, 3, 1, 8), 5, 10),
+			("A", datetime(2026, 3, 1, 20), 5, 12),
+			("A", datetime(2026, 3, 2, 8), 7.125, 12),
+			("B", datetime(2026, 3, 1, 20), 3, 20),
+			("B", datetime(2026, 3, 3, 8), 0, 20),
+			# Price changes only, so the compared point is not kept itself.
+			("D", datetime(2026, 3, 1, 8), 1, 10),
+			("D", datetime(2026, 3, 2, 8), 1, 10),
+			("D", datetime(2026, 3, 3, 8), 2, 10),
+		]
+		columns = columns_from(points, {"A": 5.0, "C": 2.5, "D": 1.0}, {"C": 40.0})
+		rows = catalog("A", "B", "C", "D") + [frappe._dict(code="E")]
+		# Null attributes come back as empty strings, as in the verbose rows.
+		rows[1].update(designation=None, brand=None, description_hash="abc")
+
+		self.assertEqual(decode_compact(_build_compact_items(columns, rows)), _build_items(columns, rows))
+		compact = _build_compact_items(columns, rows)["items"]
+		# C and E have no points in range.
+		self.assertEqual([(item["t"], item["u"]) for item in (compact[2], compact[4])], [([], -1), ([], -1)])
+
+		# Missing series keys decode like their empty values.
+		trimmed = _build_compact_items(columns, rows)
+		for item in trimmed["items"]:
+			for key in ("o", "t", "s", "p", "q"):
+				if not item[key]:
+					del item[key]
+		self.assertEqual(decode_compact(trimmed), _build_items(columns, rows))
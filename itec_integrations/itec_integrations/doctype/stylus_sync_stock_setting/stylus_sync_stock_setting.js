@@ -30,9 +30,10 @@ frappe.ui.form.on('Stylus Sync Stock Setting', {
 						callback: function (r) {
 							if (r.message && r.message.queued) {
 								frappe.show_alert({
-									message: __('Backfill queued in the background. Check the Stylus Price Change Log list once it finishes.'),
+									message: __('Backfill queued in {0} partitions. Progress is shown under Backfill Progress.', [r.message.partitions]),
 									indicator: 'green',
 								}, 7);
+								frm.reload_doc();
 							} else if (r.message) {
 								frappe.msgprint(__('Backfill complete. Histories scanned: {0}. Logs created: {1}.',
 									[r.message.histories, r.message.logs_created]));
@@ -42,5 +43,74 @@ frappe.ui.form.on('Stylus Sync Stock Setting', {
 				}
 			);
 		}, __('Backfill Price Changes'));
+
+		frm.add_custom_button(__('Result Cache Stats'), function () {
+			frappe.call({
+				method: 'itec_integrations.itec_integrations.stylus.cache.get_result_cache_stats',
+				callback: function (r) {
+					const stats = r.message || {};
+					const rows = Object.entries(stats.namespaces || {}).map(([namespace, counts]) =>
+						`<tr><td>${frappe.utils.escape_html(namespace)}</td><td>${counts.hits}</td>
+							<td>${counts.misses}</td><td>${counts.hit_rate}%</td></tr>`
+					).join('');
+					frappe.msgprint({
+						title: __('Stylus Result Cache'),
+						message: `<p>${__('Generation {0} · {1} of {2} entries', [stats.generation, stats.entries, stats.max_entries])}</p>
+							<table class="table table-bordered table-sm">
+								<thead><tr><th>${__('Result')}</th><th>${__('Hits')}</th><th>${__('Misses')}</th><th>${__('Hit Rate')}</th></tr></thead>
+								<tbody>${rows || `<tr><td colspan="4">${__('No cached requests yet')}</td></tr>`}</tbody>
+							</table>`,
+					});
+				},
+			});
+		});
+
+		frm.add_custom_button(__('Export Archive Now'), function () {
+			frappe.call({
+				method: 'itec_integrations.itec_integrations.stylus.archive.export_stylus_archive',
+				callback: function (r) {
+					if (r.message && r.message.queued) {
+						frappe.show_alert({
+							message: __('Archive export queued ({0}).', [r.message.format]),
+							indicator: 'green',
+						}, 7);
+					}
+				},
+			});
+		});
+
+		frm.trigger('show_backfill_progress');
+	},
+
+	show_backfill_progress: function (frm) {
+		const partitions = frm.doc.backfill_partition_status || [];
+		if (!partitions.length) return;
+
+		const days_between = (from, to) => frappe.datetime.get_day_diff(to, from) + 1;
+		let total_days = 0;
+		let done_days = 0;
+		let throughput = 0;
+		partitions.forEach((row) => {
+			total_days += days_between(row.partition_from, row.partition_to);
+			if (row.status === 'Completed') {
+				done_days += days_between(row.partition_from, row.partition_to);
+			} else if (row.checkpoint) {
+				done_days += days_between(row.partition_from, row.checkpoint);
+			}
+			if (row.status === 'Running') {
+				throughput += flt(row.throughput);
+			}
+		});
+
+		const percent = total_days ? Math.round((done_days / total_days) * 100) : 0;
+		const failed = partitions.filter((row) => row.status === 'Failed').length;
+		let message = __('Backfill {0}% complete ({1} of {2} days)', [percent, done_days, total_days]);
+		if (throughput) {
+			message += ' · ' + __('{0} histories/min', [flt(throughput, 1)]);
+		}
+		if (failed) {
+			message += ' · ' + __('{0} partition(s) failed, run the backfill again to resume', [failed]);
+		}
+		frm.dashboard.set_headline_alert(message, failed ? 'red' : percent === 100 ? 'green' : 'blue');
 	},
 });
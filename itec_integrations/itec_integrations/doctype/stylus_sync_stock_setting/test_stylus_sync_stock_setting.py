@@ -2,7 +2,181 @@
 # See license.txt
 
 # import frappe
+import json
+import threading
 import unittest
+from datetime import date, datetime, time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import frappe
+from frappe.utils.redis_wrapper import RedisWrapper
+
+from itec_integrations.itec_integrations.stylus.backfill import iter_date_windows, plan_partitions, remaining_windows
+from itec_integrations.itec_integrations.stylus.cache import STATS_KEY, cached_result, get_result_cache_stats
+from itec_integrations.itec_integrations.stylus.fetch import download_catalog
+from itec_integrations.itec_integrations.stylus.ingest import iter_json_array, iter_stylus_items
+
+PAYLOAD = json.dumps(
+	[
+		{"CODE": "A1", "DESIGNATION": "Cable", "PRICE": "10.5", "STOCK": "3"},
+		{"CODE": "B2", "DESIGNATION": "Mouse", "PRICE": "25", "STOCK": "0"},
+	]
+).encode()
+ETAG = '"catalog-v1"'
+
+
+class _StylusStandIn(BaseHTTPRequestHandler):
+	"""Serves the same catalog on every request; honours If-None-Match only
+	when the server's `supports_etag` is set."""
+
+	def do_GET(self):
+		self.server.requests += 1
+		if self.server.supports_etag and self.headers.get("If-None-Match") == ETAG:
+			self.send_response(304)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(PAYLOAD)))
+		if self.server.supports_etag:
+			self.send_header("ETag", ETAG)
+		self.end_headers()
+		self.wfile.write(PAYLOAD)
+
+	def log_message(self, *args):
+		pass
+
 
 class TestStylusSyncStockSetting(unittest.TestCase):
-	pass
+	def serve(self, supports_etag):
+		server = ThreadingHTTPServer(("127.0.0.1", 0), _StylusStandIn)
+		server.supports_etag = supports_etag
+		server.requests = 0
+		thread = threading.Thread(target=server.serve_forever, daemon=True)
+		thread.start()
+		self.addCleanup(server.server_close)
+		self.addCleanup(server.shutdown)
+		return server, f"http://127.0.0.1:{server.server_port}/stockparceiros"
+
+	def test_not_modified_when_etag_matches(self):
+		server, url = self.serve(supports_etag=True)
+
+		first = download_catalog(url, {})
+		self.addCleanup(first.close)
+		self.assertFalse(first.not_modified)
+		self.assertEqual(first.etag, ETAG)
+		rows = list(iter_stylus_items(first.iter_chunks()))
+		self.assertEqual([row["code"] for row in rows], ["A1", "B2"])
+		self.assertEqual(rows[0]["price"], 10.5)
+
+		second = download_catalog(url, {}, etag=first.etag)
+		self.assertTrue(second.not_modified)
+		self.assertIsNone(second.body)
+		self.assertEqual(server.requests, 2)
+
+	def test_same_fingerprint_without_conditional_support(self):
+		_server, url = self.serve(supports_etag=False)
+
+		first = download_catalog(url, {})
+		second = download_catalog(url, {}, etag=ETAG)
+		self.addCleanup(first.close)
+		self.addCleanup(second.close)
+
+		self.assertFalse(second.not_modified)
+		self.assertTrue(first.digest)
+		self.assertEqual(first.digest, second.digest)
+
+	def test_json_array_split_at_every_offset(self):
+		document = '[{"CODE": "A1", "NAME": "Caf\u00e9 \\"x\\""}, 12.5, -3e2, "é, ]", [1, [2]], null, true]'
+		expected = json.loads(document)
+		encoded = document.encode("utf-8")
+		for size in (1, 2, 3, 7):
+			chunks = [encoded[start : start + size] for start in range(0, len(encoded), size)]
+			self.assertEqual(list(iter_json_array(chunks)), expected, size)
+		for split in range(1, len(encoded)):
+			self.assertEqual(list(iter_json_array([encoded[:split], b"", encoded[split:]])), expected, split)
+
+	def test_json_array_empty_and_whitespace(self):
+		self.assertEqual(list(iter_json_array([b" [ ", b" ] "])), [])
+		self.assertEqual(list(iter_json_array([b"[\n1 ,\t2\n]"])), [1, 2])
+
+	def test_json_array_rejects_malformed_input(self):
+		for document in ("[1 2]", "[,1]", "[1,,2]", "[1,]", '{"a": 1}', "[1, 2", "", "[1.]", "[1 x]"):
+			with self.assertRaises(ValueError, msg=document):
+				list(iter_json_array([document.encode()]))
+
+	def test_date_windows_cover_range_without_gaps(self):
+		windows = list(iter_date_windows(date(2026, 1, 1), date(2026, 1, 17), days=7))
+		self.assertEqual(
+			[(start.date(), end.date()) for start, end in windows],
+			[
+				(date(2026, 1, 1), date(2026, 1, 7)),
+				(date(2026, 1, 8), date(2026, 1, 14)),
+				(date(2026, 1, 15), date(2026, 1, 17)),
+			],
+		)
+		self.assertEqual((windows[0][0].time(), windows[-1][1].time()), (time.min, time.max))
+		self.assertEqual(len(list(iter_date_windows(date(2026, 1, 1), date(2026, 1, 1)))), 1)
+		self.assertEqual(list(iter_date_windows(date(2026, 1, 2), date(2026, 1, 1))), [])
+
+	def test_partitions_split_range_evenly(self):
+		def days(partitions):
+			return [(end - start).days + 1 for start, end in partitions]
+
+		def assert_contiguous(partitions, from_date, to_date):
+			self.assertEqual(partitions[0][0], from_date)
+			self.assertEqual(partitions[-1][1], to_date)
+			for (_start, end), (start, _end) in zip(partitions, partitions[1:]):
+				self.assertEqual(start, end + timedelta(days=1))
+
+		from_date = date(2026, 1, 1)
+		# Uneven: the first partitions take the remainder.
+		uneven = plan_partitions(from_date, date(2026, 1, 10), 4)
+		self.assertEqual(days(uneven), [3, 3, 2, 2])
+		assert_contiguous(uneven, from_date, date(2026, 1, 10))
+
+		self.assertEqual(plan_partitions(from_date, from_date, 4), [(from_date, from_date)])
+
+		# More partitions than days: one day each.
+		short = plan_partitions(from_date, date(2026, 1, 3), 8)
+		self.assertEqual(days(short), [1, 1, 1])
+		assert_contiguous(short, from_date, date(2026, 1, 3))
+
+		# Across a year end, with the default count for an unset setting.
+		year_end = plan_partitions(date(2025, 12, 30), date(2026, 1, 2), None)
+		self.assertEqual(days(year_end), [1, 1, 1, 1])
+		assert_contiguous(year_end, date(2025, 12, 30), date(2026, 1, 2))
+
+	def test_partition_resumes_after_checkpoint(self):
+		partition = frappe._dict(partition_from=date(2026, 1, 1), partition_to=date(2026, 1, 20), checkpoint=None)
+		self.assertEqual(next(remaining_windows(partition))[0], datetime(2026, 1, 1))
+
+		partition.checkpoint = date(2026, 1, 7)
+		self.assertEqual(
+			[(start.date(), end.date()) for start, end in remaining_windows(partition)],
+			[(date(2026, 1, 8), date(2026, 1, 14)), (date(2026, 1, 15), date(2026, 1, 20))],
+		)
+
+		partition.checkpoint = date(2026, 1, 20)
+		self.assertEqual(list(remaining_windows(partition)), [])
+
+	def test_result_cache_counts_hits_and_misses(self):
+		cache = frappe.cache()
+		namespace = "_test_stylus_results"
+		fields = (f"{namespace}:hits", f"{namespace}:misses")
+		super(RedisWrapper, cache).hdel(cache.make_key(STATS_KEY), *fields)
+		self.addCleanup(super(RedisWrapper, cache).hdel, cache.make_key(STATS_KEY), *fields)
+		code = f"_TEST-{frappe.generate_hash(length=8)}"
+		calls = []
+
+		def compute():
+			calls.append(code)
+			return {"code": code}
+
+		self.assertEqual(cached_result(namespace, {"code": code}, compute), {"code": code})
+		# Equivalent filters share the entry.
+		self.assertEqual(cached_result(namespace, {"code": f" {code} "}, compute), {"code": code})
+		self.assertEqual(calls, [code])
+		self.assertEqual(
+			get_result_cache_stats()["namespaces"][namespace], {"hits": 1, "misses": 1, "hit_rate": 50.0}
+		)
@@ -0,0 +1,112 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Requests against the NCR (VTEX) product search GraphQL endpoint.
+
+Everything here runs inside crawler worker threads, so it only raises and
+returns; logging, the circuit breaker and the database stay with the caller."""
+
+from collections import namedtuple
+
+import requests
+
+from itec_integrations.itec_integrations.utils import get_client
+
+
+NCR_GRAPHQL_URL = "https://www.ncrangola.com/_v/segment/graphql/v1"
+NCR_HEADERS = {
+	"Content-Type": "application/json",
+	"Accept": "application/json",
+	"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+	"Connection": "keep-alive",
+	"Cache-Control": "no-cache",
+}
+REQUEST_TIMEOUT = (3, 15)
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+# One productSearch window: its products, and the number of products the
+# category has in total (None when the response does not say).
+SearchPage = namedtuple("SearchPage", ("products", "total"))
+
+
+
+class NCRRequestError(Exception):
+	"""A product search request failed; `retryable` tells whether trying the
+	same window again can help."""
+
+	def __init__(self, message, status=None, retryable=True):
+		super().__init__(message)
+		self.status = status
+		self.retryable = retryable
+
+
+def build_payload(category, start, end, query_hash):
+	"""productSearch request for products [start, end) of `category`; VTEX
+	reads `from` and `to` as inclusive positions."""
+	return {
+		"operationName": "productSearchV3",
+		"variables": {
+			"query": category,
+			"selectedFacets": [{"key": "c", "value": category}],
+			"from": start,
+			"to": end - 1,
+			"orderBy": "OrderByScoreDESC",
+			"map": "c",
+		},
+		"extensions": {
+			"persistedQuery": {
+				"version": 1,
+				"sha256Hash": query_hash,
+				"sender": "vtex.store-resources@0.x",
+				"provider": "vtex.search-graphql@0.x",
+			}
+		},
+	}
+
+
+def parse_products(data):
+	"""The product rows NCR Catalog Product stores, from a productSearch response."""
+	search = (data or {}).get("data", {}).get("productSearch") or {}
+	return [
+		{
+			"productReference": product.get("productReference"),
+			"productName": product.get("productName"),
+			"brand": product.get("brand"),
+			"price": (product.get("priceRange") or {}).get("sellingPrice", {}).get("lowPrice"),
+		}
+		for product in search.get("products") or []
+	]
+
+
+def parse_total(data):
+	"""`recordsFiltered` of a productSearch response, or None."""
+	search = (data or {}).get("data", {}).get("productSearch") or {}
+	total = search.get("recordsFiltered")
+	return int(total) if isinstance(total, (int, float)) else None
+
+
+def _client():
+	# The crawler re-queues failed windows itself, so the client does not retry.
+	return get_client("ncr", timeout=REQUEST_TIMEOUT, retries=0)
+
+
+def fetch_products(url, headers, query_hash, category, start, end, timeout=REQUEST_TIMEOUT):
+	"""POST one productSearch window and return it as a SearchPage."""
+	try:
+		response = _client().post(
+			url, json=build_payload(category, start, end, query_hash), headers=headers, timeout=timeout
+		)
+	except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+		raise NCRRequestError(f"{type(e).__name__}: {str(e)[:200]}")
+
+	if response.status_code in RETRYABLE_STATUS:
+		raise NCRRequestError(f"HTTP {response.status_code}", status=response.status_code)
+	if response.status_code != 200:
+		raise NCRRequestError(
+			f"HTTP {response.status_code}: {response.text[:200]}", status=response.status_code, retryable=False
+		)
+
+	# A response without productSearch data ends the category, as an empty
+	# page does.
+	data = response.json()
+	return SearchPage(parse_products(data), parse_total(data))
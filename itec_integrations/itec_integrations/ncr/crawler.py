@@ -0,0 +1,339 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Concurrent crawl of NCR categories.
+
+The first page of each category carries its product count
+(`recordsFiltered`), so the rest of the category is planned from it in one
+go instead of probing ahead until an empty page turns up. Page windows of
+every category are then fetched by a bounded thread pool, sized by an AIMD
+controller that follows the observed latency and errors. All requests draw
+from one token bucket and a per-host concurrency cap, and each host slot is
+held for a short pause after its response, so the request rate against NCR
+stays bounded however many workers run. A failed window is
+re-queued with backoff instead of being skipped."""
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+
+from itec_integrations.itec_integrations.ncr.api import NCRRequestError
+from itec_integrations.itec_integrations.utils import AIMDController
+
+
+# The defaults match the sequential sync this crawler replaced: one request
+# open at a time, windows of 5 growing to at most 12 products, and a pause of
+# at least 0.1 s after every response, which also caps the rate at 10 requests
+# a second. NCR Sync Setting can raise the concurrency and the rate.
+DEFAULT_WINDOW_SIZE = 5
+MIN_WINDOW_SIZE = 3
+MAX_WINDOW_SIZE = 12
+DEFAULT_MAX_WORKERS = 1
+DEFAULT_PER_HOST = 1
+DEFAULT_RATE = 10.0
+DEFAULT_PAUSE = 0.1
+DEFAULT_LOOKAHEAD = 3
+MAX_WINDOW_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10.0
+
+
+class TokenBucket:
+	"""Thread-safe token bucket: `rate` tokens per second, bursting up to
+	`capacity`."""
+
+	def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+		self.rate = float(rate)
+		self.capacity = float(capacity or max(1.0, rate))
+		self.tokens = self.capacity
+		self.clock = clock
+		self.sleep = sleep
+		self.updated = clock()
+		self.lock = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self.lock:
+				now = self.clock()
+				self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+				self.updated = now
+				# Tolerate float rounding, so waiting exactly the deficit is
+				# always enough.
+				if self.tokens >= 1 - 1e-9:
+					self.tokens -= 1
+					return
+				wait_for = (1 - self.tokens) / self.rate
+			self.sleep(wait_for)
+
+
+class HostLimiter:
+	"""At most `limit` concurrent requests per host."""
+
+	def __init__(self, limit):
+		self.limit = limit
+		self.slots = {}
+		self.lock = threading.Lock()
+
+	def slot(self, url):
+		host = urlsplit(url).netloc
+		with self.lock:
+			if host not in self.slots:
+				self.slots[host] = threading.BoundedSemaphore(self.limit)
+			return self.slots[host]
+
+
+class Window:
+	"""Products [start, start + size) of a category. Pending windows may span
+	many pages; they are cut to the current window size when sent."""
+
+	__slots__ = ("category", "start", "size", "attempt", "not_before", "sent_at", "latency")
+
+	def __init__(self, category, start, size, attempt=0, not_before=0.0):
+		self.category = category
+		self.start = start
+		self.size = size
+		self.attempt = attempt
+		self.not_before = not_before
+		self.sent_at = None
+		self.latency = None
+
+	@property
+	def end(self):
+		return self.start + self.size
+
+
+class CategoryPlan:
+	"""What is left to fetch of one category.
+
+	Only the first window is sent until its page tells the category's total;
+	then all of [0, total) is planned at once. If pages carry no total the
+	category is crawled open-ended, up to `lookahead` windows ahead, until a
+	page comes back short."""
+
+	__slots__ = ("category", "total", "end", "pending", "next_start", "in_flight", "open_ended")
+
+	def __init__(self, category):
+		self.category = category
+		self.total = None
+		self.end = None
+		self.pending = []
+		self.next_start = 0
+		self.in_flight = 0
+		self.open_ended = False
+
+	def queue(self, window):
+		self.pending.append(window)
+		self.pending.sort(key=lambda pending: pending.start)
+
+	def take(self, size, lookahead):
+		"""The next window to send, at most `size` products, or None."""
+		if self.pending:
+			window = self.pending[0]
+			if window.size <= size:
+				return self.pending.pop(0)
+			self.pending[0] = Window(
+				self.category, window.start + size, window.size - size, window.attempt, window.not_before
+			)
+			return Window(self.category, window.start, size, window.attempt, window.not_before)
+
+		if self.end is not None:
+			return None
+		if self.open_ended and self.in_flight >= lookahead:
+			return None
+		if not self.open_ended and self.next_start:
+			return None
+		window = Window(self.category, self.next_start, size)
+		self.next_start += size
+		return window
+
+	def plan(self, total):
+		self.total = total
+		if self.next_start < total:
+			self.queue(Window(self.category, self.next_start, total - self.next_start))
+			self.next_start = total
+		self.set_end(total)
+
+	def set_end(self, end):
+		"""Nothing exists from `end` on: drop or trim the windows past it."""
+		if self.end is not None and self.end <= end:
+			return
+		self.end = end
+		pending = []
+		for window in self.pending:
+			if window.start < end:
+				window.size = min(window.size, end - window.start)
+				pending.append(window)
+		self.pending = pending
+
+
+class CrawlResult:
+	def __init__(self):
+		self.products = {}
+		self.totals = {}
+		self.incomplete = []
+		self.failed_windows = []
+		self.errors = []
+		self.requests = 0
+		self.elapsed = 0.0
+
+	def category_products(self, category):
+		"""Products of `category` in page order, without the duplicates
+		overlapping windows return."""
+		seen = set()
+		products = []
+		for _start, page in sorted(self.products.get(category, {}).items()):
+			for product in page:
+				reference = product.get("productReference")
+				if reference:
+					if reference in seen:
+						continue
+					seen.add(reference)
+				products.append(product)
+		return products
+
+	def all_products(self, categories):
+		return [product for category in categories for product in self.category_products(category)]
+
+
+class NCRCrawler:
+	"""Crawl categories with `fetch(category, start, end)`, which returns a
+	SearchPage or raises NCRRequestError.
+
+	Window sizes come from `controller`, an AIMDController fed with every
+	request's latency and retryable errors. `on_event(kind, window, detail)`
+	is called from the calling thread for "success" and "failure" (a
+	retryable error, with the exception) and "failed" (a window given up
+	on); returning False from `allow_request()` stops sending windows, and
+	from `allow_retry()` gives up on a failed window instead of re-queueing
+	it. Windows left unsent end up in `failed_windows` too."""
+
+	def __init__(
+		self,
+		fetch,
+		url,
+		window_size=DEFAULT_WINDOW_SIZE,
+		max_workers=DEFAULT_MAX_WORKERS,
+		per_host=DEFAULT_PER_HOST,
+		rate=DEFAULT_RATE,
+		pause=DEFAULT_PAUSE,
+		lookahead=DEFAULT_LOOKAHEAD,
+		max_attempts=MAX_WINDOW_ATTEMPTS,
+		backoff=BACKOFF_BASE,
+		on_event=None,
+		allow_request=None,
+		allow_retry=None,
+		controller=None,
+	):
+		self.fetch = fetch
+		self.url = url
+		self.max_workers = max_workers
+		self.pause = pause
+		self.lookahead = lookahead
+		self.max_attempts = max_attempts
+		self.backoff = backoff
+		self.controller = controller or AIMDController(window_size, MIN_WINDOW_SIZE, MAX_WINDOW_SIZE)
+		self.bucket = TokenBucket(rate)
+		self.hosts = HostLimiter(per_host)
+		self.on_event = on_event or (lambda kind, window, detail: None)
+		self.allow_request = allow_request or (lambda: True)
+		self.allow_retry = allow_retry or (lambda: True)
+
+	def run(self, categories):
+		result = CrawlResult()
+		started = time.monotonic()
+		plans = {category: CategoryPlan(category) for category in categories}
+		futures = {}
+
+		with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+			def dispatch():
+				"""Send windows round-robin over the categories while workers
+				are free. False once `allow_request()` refused."""
+				sent = True
+				while sent:
+					sent = False
+					for plan in plans.values():
+						if len(futures) >= self.max_workers:
+							return True
+						window = plan.take(self.controller.value, self.lookahead)
+						if window is None:
+							continue
+						if not self.allow_request():
+							plan.queue(window)
+							return False
+						plan.in_flight += 1
+						result.requests += 1
+						futures[executor.submit(self._fetch_window, window)] = window
+						sent = True
+				return True
+
+			dispatch()
+			while futures:
+				done, _pending = wait(futures, return_when=FIRST_COMPLETED)
+				for future in done:
+					window = futures.pop(future)
+					plan = plans[window.category]
+					plan.in_flight -= 1
+					try:
+						page = future.result()
+					except NCRRequestError as e:
+						if e.retryable:
+							self.controller.record(window.latency, ok=False, started=window.sent_at)
+						self._retry_or_fail(plan, window, e, result)
+					else:
+						self.controller.record(window.latency, started=window.sent_at)
+						self.on_event("success", window, len(page.products))
+						self._apply_page(plan, window, page, result)
+				dispatch()
+
+		for plan in plans.values():
+			result.failed_windows.extend(plan.pending)
+			if plan.end is None or plan.pending or any(
+				window.category == plan.category for window in result.failed_windows
+			):
+				result.incomplete.append(plan.category)
+		result.elapsed = time.monotonic() - started
+		return result
+
+	def _apply_page(self, plan, window, page, result):
+		result.products.setdefault(window.category, {})[window.start] = page.products
+		if plan.total is None and not plan.open_ended:
+			if page.total is None:
+				plan.open_ended = True
+			else:
+				plan.plan(page.total)
+				result.totals[plan.category] = page.total
+		if len(page.products) < window.size:
+			plan.set_end(window.start + len(page.products))
+
+	def _retry_or_fail(self, plan, window, error, result):
+		result.errors.append(error)
+		if plan.end is not None and window.start >= plan.end:
+			return
+		if (
+			error.retryable
+			and window.attempt + 1 < self.max_attempts
+			and self.allow_retry()
+		):
+			self.on_event("failure", window, error)
+			delay = min(BACKOFF_MAX, self.backoff * 2**window.attempt) * random.uniform(0.5, 1.0)
+			plan.queue(Window(window.category, window.start, window.size, window.attempt + 1, time.monotonic() + delay))
+		else:
+			self.on_event("failed", window, error)
+			result.failed_windows.append(window)
+
+	def _fetch_window(self, window):
+		delay = window.not_before - time.monotonic()
+		if delay > 0:
+			time.sleep(delay)
+		with self.hosts.slot(self.url):
+			self.bucket.acquire()
+			window.sent_at = time.monotonic()
+			try:
+				return self.fetch(window.category, window.start, window.end)
+			finally:
+				window.latency = time.monotonic() - window.sent_at
+				if self.pause:
+					time.sleep(self.pause)
@@ -0,0 +1,143 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Normalized store of the NCR catalog.
+
+NCR Catalog Product holds one row per productReference (named by it) with
+name, brand, category and price, each indexed. A sync compares the crawled
+rows against the stored row hashes and upserts only the products that are
+new or changed; products missing from a category that was crawled completely
+are marked inactive rather than deleted. Reading one product or brand is an
+indexed lookup instead of parsing the whole catalog."""
+
+import hashlib
+import json
+
+import frappe
+from frappe.utils import cint, flt, now
+
+from itec_integrations.itec_integrations.utils import BULK_CHUNK_SIZE, bulk_upsert
+
+
+PRODUCT_DOCTYPE = "NCR Catalog Product"
+LEGACY_DOCTYPE = "NCR Products"
+PRODUCT_FIELDS = ("product_reference", "product_name", "brand", "category", "price", "row_hash", "is_active")
+PRODUCT_INSERT_FIELDS = (
+	("name", "creation", "modified", "owner", "modified_by", "docstatus") + PRODUCT_FIELDS + ("last_changed",)
+)
+PRODUCT_UPDATE_FIELDS = PRODUCT_FIELDS + ("last_changed", "modified")
+
+
+def row_hash(row):
+	values = (row["product_name"], row["brand"], row["category"], flt(row["price"], 2))
+	return hashlib.sha1(json.dumps(values, default=str).encode("utf-8")).hexdigest()
+
+
+def product_rows(products_by_category):
+	"""Rows for `{category: [parsed product, ...]}`. A product listed in more
+	than one category keeps the first."""
+	rows = {}
+	for category, products in products_by_category.items():
+		for product in products:
+			reference = product.get("productReference")
+			if not reference or reference in rows:
+				continue
+			row = {
+				"product_reference": reference,
+				"product_name": product.get("productName"),
+				"brand": product.get("brand"),
+				"category": category,
+				"price": flt(product.get("price")),
+			}
+			row["row_hash"] = row_hash(row)
+			rows[reference] = row
+	return list(rows.values())
+
+
+def get_index():
+	"""`reference -> (row_hash, is_active, category)` of the stored rows."""
+	return {
+		name: (stored_hash, cint(is_active), category)
+		for name, stored_hash, is_active, category in frappe.db.sql(
+			f"SELECT `name`, `row_hash`, `is_active`, `category` FROM `tab{PRODUCT_DOCTYPE}`"
+		)
+	}
+
+
+def upsert_products(rows, complete_categories=()):
+	"""Write the rows of one crawl. Only new, changed or reactivated products
+	are written; active products of `complete_categories` that the crawl did
+	not return are deactivated. Returns (written, deactivated)."""
+	index = get_index()
+	changed = [
+		row for row in rows if (index.get(row["product_reference"]) or (None, 0))[:2] != (row["row_hash"], 1)
+	]
+
+	timestamp = now()
+	user = frappe.session.user
+	bulk_upsert(
+		PRODUCT_DOCTYPE,
+		PRODUCT_INSERT_FIELDS,
+		[
+			(row["product_reference"], timestamp, timestamp, user, user, 0)
+			+ tuple(1 if fieldname == "is_active" else row.get(fieldname) for fieldname in PRODUCT_FIELDS)
+			+ (timestamp,)
+			for row in changed
+		],
+		PRODUCT_UPDATE_FIELDS,
+	)
+
+	seen = {row["product_reference"] for row in rows}
+	complete_categories = set(complete_categories)
+	missing = [
+		reference
+		for reference, (_hash, is_active, category) in index.items()
+		if is_active and category in complete_categories and reference not in seen
+	]
+	for start in range(0, len(missing), BULK_CHUNK_SIZE):
+		frappe.db.sql(
+			f"""
+				UPDATE `tab{PRODUCT_DOCTYPE}`
+				SET `is_active` = 0, `last_changed` = %(timestamp)s, `modified` = %(timestamp)s
+				WHERE `name` IN %(names)s
+			""",
+			{"timestamp": timestamp, "names": tuple(missing[start : start + BULK_CHUNK_SIZE])},
+		)
+	return len(changed), len(missing)
+
+
+def import_legacy_products():
+	"""Load the last NCR Products data_json blob into NCR Catalog Product, for
+	sites that have not synced since the switch. Usable from `bench execute`."""
+	names = frappe.get_all(LEGACY_DOCTYPE, fields=["name"], order_by="creation desc", limit=1)
+	if not names:
+		return 0
+	data_json = frappe.db.get_value(LEGACY_DOCTYPE, names[0].name, "data_json")
+	products = json.loads(data_json or "[]")
+	# The blob did not record categories.
+	written, _deactivated = upsert_products(product_rows({None: products}))
+	return written
+
+
+@frappe.whitelist()
+def get_products(references=None, brand=None, category=None, include_inactive=0, limit=None):
+	"""NCR products, optionally narrowed to `references`, a brand or a
+	category."""
+	frappe.has_permission(PRODUCT_DOCTYPE, "read", throw=True)
+	references = frappe.parse_json(references) if isinstance(references, str) else references
+	filters = {}
+	if references:
+		filters["name"] = ["in", list(references)]
+	if brand:
+		filters["brand"] = brand
+	if category:
+		filters["category"] = category
+	if not cint(include_inactive):
+		filters["is_active"] = 1
+	return frappe.get_all(
+		PRODUCT_DOCTYPE,
+		filters=filters,
+		fields=list(PRODUCT_FIELDS) + ["last_changed"],
+		order_by="name asc",
+		limit_page_length=cint(limit) or 0,
+	)
@@ -17,6 +17,8 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 		this.filter_controls = {};
 		this.request_id = 0;
 		this.charts = [];
+		// Codes requested per page; the server caps this at 200.
+		this.page_size = 50;
 
 		this.wrapper.addClass('stylus-stock-variance-wrapper');
 
@@ -154,6 +156,23 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 				}
 			}
 
+			.stylus-stock-variance-wrapper .stylus-sv-description-toggle {
+				cursor: pointer;
+				align-self: flex-start;
+			}
+
+			.stylus-stock-variance-wrapper .stylus-sv-description {
+				max-height: 240px;
+				overflow-y: auto;
+				padding: 8px 12px;
+				border-radius: 8px;
+				background: var(--gray-50);
+
+				@media (prefers-color-scheme: dark) {
+					background: rgba(15, 23, 42, 0.5);
+				}
+			}
+
 			.stylus-stock-variance-wrapper .stylus-sv-chart-filter {
 				display: flex;
 				align-items: center;
@@ -165,6 +184,16 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 				display: none;
 			}
 
+			.stylus-stock-variance-wrapper .stylus-sv-load-more {
+				display: flex;
+				justify-content: center;
+				margin: 12px 0 24px;
+			}
+
+			.stylus-stock-variance-wrapper .stylus-sv-load-more.hidden {
+				display: none;
+			}
+
 			.stylus-stock-variance-wrapper .stylus-sv-chart-filter label {
 				font-size: 0.85rem;
 				color: var(--gray-700);
@@ -482,6 +511,7 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 			'"/>').appendTo(this.$chartFilter);
 		this.$chartFilterInput = chartFilterInput;
 		this.$results = $('<div class="stylus-sv-results"></div>').appendTo(this.$main);
+		this.$loadMore = $('<div class="stylus-sv-load-more hidden"></div>').appendTo(this.$main);
 
 		const applyFilter = (value) => {
 			this.apply_card_filter(value);
@@ -516,6 +546,7 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 		this.set_default_filters();
 		this.reset_charts();
 		this.$results.empty();
+		this.update_load_more(null);
 		this.show_state('info', __('Filters reset. Click Run to refresh the dashboard.'));
 	}
 
@@ -560,34 +591,51 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 			.filter(Boolean);
 	}
 
-	fetch_data() {
-		const filters = this.get_filter_values();
+	fetch_data(cursor = null) {
+		const filters = cursor ? this.last_filters : this.get_filter_values();
 		if (!filters) return;
 
 		this.request_id += 1;
 		const current_request = this.request_id;
 
-		this.reset_charts();
-		this.$results.empty();
-		this.show_state('loading', __('Fetching Stylus stock history...'));
+		if (!cursor) {
+			this.last_filters = filters;
+			this.loaded_codes = 0;
+			this.total_codes = 0;
+			this.reset_charts();
+			this.$results.empty();
+			this.update_load_more(null);
+			this.show_state('loading', __('Fetching Stylus stock history...'));
+		} else {
+			this.$loadMore.find('button').prop('disabled', true).text(__('Loading...'));
+		}
 
 		frappe.call({
 			method: 'itec_integrations.itec_integrations.page.stylus_stock_variance.stylus_stock_variance.fetch_stock_variance',
-			args: { filters },
+			args: { filters, cursor, page_size: this.page_size, compact: 1 },
 			freeze: false,
 			callback: (response) => {
 				if (current_request !== this.request_id) {
 					return;
 				}
 
-				const items = response?.message?.items || [];
-				if (!items.length) {
+				const message = response?.message || {};
+				const items = message.format === 'compact'
+					? this.decode_compact(message)
+					: message.items || [];
+				if (!cursor) {
+					this.total_codes = message.total || 0;
+				}
+				this.loaded_codes += items.length;
+
+				if (!cursor && !items.length && !message.next_cursor) {
 					this.show_state('info', __('No stock records found for the selected filters.'));
 					return;
 				}
 
 				this.hide_state();
-				this.render_items(items);
+				this.render_items(items, !!cursor);
+				this.update_load_more(message.next_cursor);
 			},
 			error: (error) => {
 				if (current_request !== this.request_id) {
@@ -597,11 +645,83 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 					(error && (error.message || error._server_messages)) ||
 					__('Unable to load the Stylus stock history. Please try again.');
 				this.show_state('error', message);
+				this.update_load_more(cursor);
 				frappe.show_alert({ message, indicator: 'red' }, 7);
 			},
 		});
 	}
 
+	decode_compact(message) {
+		// Rebuild the item structure the cards render from the columnar
+		// payload: a shared axis of UTC seconds, stock as scaled deltas from
+		// the opening balance, and the axis position each point compares to.
+		const scale = message.scale || 1;
+		const pad = (value) => String(value).padStart(2, '0');
+		const points = (message.axis || []).map((seconds) => {
+			const d = new Date(seconds * 1000);
+			const year = d.getUTCFullYear();
+			const month = pad(d.getUTCMonth() + 1);
+			const day = pad(d.getUTCDate());
+			return {
+				label: `${year}-${month}-${day} ${pad(d.getUTCHours())}:${pad(d.getUTCMinutes())}`,
+				date: `${day}-${month}-${year}`,
+			};
+		});
+
+		return (message.items || []).map((item) => {
+			let stock = item.o || 0;
+			const history = [{ label: 'Opening', date: 'Opening', stock: stock / scale, price: null }];
+			const differences = [];
+
+			(item.t || []).forEach((axis_index, i) => {
+				const previous = stock;
+				const point = points[axis_index];
+				const price = item.p[i];
+				stock += item.s[i];
+				history.push({ label: point.label, date: point.date, stock: stock / scale, price });
+
+				if (stock !== previous) {
+					const from = item.q[i] < 0 ? 'Opening' : points[item.q[i]].label;
+					differences.push({
+						period: `${from} → ${point.label}`,
+						date: point.date,
+						difference: (stock - previous) / scale,
+						stock: stock / scale,
+						price,
+					});
+				}
+			});
+
+			return {
+				code: item.code,
+				designation: item.designation,
+				main_category: item.main_category,
+				brand: item.brand,
+				price: item.price,
+				history,
+				differences,
+				totals: { positive: item.totals[0], negative: item.totals[1] },
+				last_updated: points[item.u] ? points[item.u].label : null,
+				opening_balance: (item.o || 0) / scale,
+				description_hash: item.description_hash,
+			};
+		});
+	}
+
+	update_load_more(next_cursor) {
+		this.$loadMore.empty();
+		if (!next_cursor) {
+			this.$loadMore.addClass('hidden');
+			return;
+		}
+
+		this.$loadMore.removeClass('hidden');
+		$('<button class="btn btn-default btn-sm"></button>')
+			.text(__('Load more ({0} of {1} items checked)', [this.loaded_codes, this.total_codes]))
+			.on('click', () => this.fetch_data(next_cursor))
+			.appendTo(this.$loadMore);
+	}
+
 	show_state(state, message) {
 		this.$state
 			.attr('data-state', state)
@@ -624,9 +744,11 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 		this.charts = [];
 	}
 
-	render_items(items) {
-		this.$results.empty();
-		let rendered_count = 0;
+	render_items(items, append = false) {
+		if (!append) {
+			this.$results.empty();
+		}
+		let rendered_count = this.$results.find('.stylus-sv-card').length;
 
 		items.forEach((item) => {
 			const has_differences = (item.differences || []).length > 0;
@@ -729,6 +851,38 @@ itec_integrations.pages.StylusStockVariance = class StylusStockVariance {
 		if (!meta.children().length) {
 			meta.remove();
 		}
+
+		if (item.description_hash) {
+			this.render_description_toggle(item, header);
+		}
+	}
+
+	render_description_toggle(item, parent) {
+		const toggle = $('<a class="stylus-sv-description-toggle small"></a>')
+			.text(__('Show description'))
+			.appendTo(parent);
+		const body = $('<div class="stylus-sv-description small"></div>').hide().appendTo(parent);
+
+		toggle.on('click', (e) => {
+			e.preventDefault();
+			if (body.data('loaded')) {
+				body.toggle();
+				toggle.text(body.is(':visible') ? __('Hide description') : __('Show description'));
+				return;
+			}
+
+			toggle.text(__('Loading...'));
+			frappe.call({
+				method: 'itec_integrations.itec_integrations.stylus.blobs.get_content_blob',
+				args: { content_hash: item.description_hash },
+				callback: (r) => {
+					body.html(frappe.dom.remove_script_and_style(r.message || ''))
+						.data('loaded', true)
+						.show();
+					toggle.text(__('Hide description'));
+				},
+			});
+		});
 	}
 
 	render_table(item, parent) {
@@ -1,82 +1,190 @@
 import re
-from collections import OrderedDict
 from typing import Any, Dict, List, Optional
 
+import numpy as np
+
 import frappe
 from frappe import _
-from frappe.utils import cstr, flt, format_datetime, getdate
-
-
-MAX_ITEMS = 25
-DIFF_PRECISION = 3
+from frappe.utils import cint, cstr, flt, getdate
+
+from itec_integrations.itec_integrations.stylus.cache import cached_result
+from itec_integrations.itec_integrations.stylus.search import match_codes
+from itec_integrations.itec_integrations.stylus.variance import DIFF_PRECISION, VarianceColumns
+
+
+PAGE_SIZE = 25
+MAX_PAGE_SIZE = 200
+
+# Codes that left the catalog during or after [start, end] while they were in
+# it at some point up to `end`, with the attributes of their last stored row
+# up to then. The row is found through the history its last series point
+# refers to, so only the (parent, code) lookup touches the item table.
+REMOVED_CODES_QUERY = """
+	SELECT
+		`item`.`code` AS `name`, `item`.`designation`, `item`.`main_category`, `item`.`brand`,
+		`item`.`price`, `item`.`description_hash`
+	FROM (
+		SELECT
+			`code`, `stock_history`,
+			ROW_NUMBER() OVER (PARTITION BY `code` ORDER BY `ts` DESC) AS `rn`
+		FROM `tabStylus Stock Series`
+		WHERE `is_removed` = 0
+			AND `ts` <= %(end)s
+			AND `code` IN (
+				SELECT `code` FROM `tabStylus Stock Series` WHERE `is_removed` = 1 AND `ts` >= %(start)s
+			)
+			AND `code` NOT IN (SELECT `name` FROM `tabStylus Current Stock`)
+	) `point`
+	INNER JOIN `tabStylus Stock History Item` `item`
+		ON `item`.`parent` = `point`.`stock_history` AND `item`.`code` = `point`.`code`
+	WHERE `point`.`rn` = 1
+"""
 
 
 @frappe.whitelist()
-def fetch_stock_variance(filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+def fetch_stock_variance(
+	filters: Optional[Dict[str, Any]] = None,
+	cursor: Optional[str] = None,
+	page_size: Optional[int] = None,
+	compact: Optional[int] = 0,
+) -> Dict[str, Any]:
+	"""Variance for one page of matching codes, in code order. Pass the
+	returned `next_cursor` back as `cursor` to get the following page; it is
+	None after the last page. `total` is only counted for the first page.
+
+	With `compact`, items are returned in the columnar format described in
+	`_build_compact_items` instead of lists of dicts."""
 	filters = frappe.parse_json(filters) if filters else {}
+	page_size = min(cint(page_size) or PAGE_SIZE, MAX_PAGE_SIZE)
+	return cached_result(
+		"stock_variance",
+		{"filters": filters, "cursor": cursor, "page_size": page_size, "compact": cint(compact)},
+		lambda: _compute_stock_variance(filters, cursor, page_size, cint(compact)),
+	)
+
 
+def _compute_stock_variance(filters, cursor, page_size, compact):
 	from_date = filters.get("from_date")
 	to_date = filters.get("to_date")
 
 	start_date, end_date = _validate_dates(from_date, to_date)
-	params = {
-		"start": f"{start_date} 00:00:00",
-		"end": f"{end_date} 23:59:59",
-		"before_start": f"{start_date} 00:00:00",
-	}
-
-	conditions = [
-		"`creation` BETWEEN %(start)s AND %(end)s",
-		"`code` IS NOT NULL",
-		"`code` != ''",
-	]
-
-	_append_text_filter("code", filters.get("code"), conditions, params)
-	_append_text_filter("designation", filters.get("designation"), conditions, params)
-	_append_text_filter("main_category", filters.get("main_category"), conditions, params)
-	_append_text_filter("brand", filters.get("brand"), conditions, params)
-
-	where_clause = f"WHERE {' AND '.join(conditions)}"
-	distinct_codes = frappe.db.sql(
-		f"SELECT DISTINCT `code` FROM `tabStylus Stock History Item` {where_clause}",
+	start = f"{start_date} 00:00:00"
+	end = f"{end_date} 23:59:59"
+	params = {"start": start, "end": end}
+	current_conditions = []
+	removed_conditions = []
+
+	for fieldname, value, search_field in (
+		("name", filters.get("code"), "code"),
+		("designation", filters.get("designation"), None),
+		("main_category", filters.get("main_category"), None),
+		("brand", filters.get("brand"), None),
+	):
+		# The trigram index also holds removed codes, so both sides share
+		# the same conditions.
+		conditions = []
+		_append_text_filter(fieldname, value, conditions, params, search_field=search_field)
+		current_conditions.extend(conditions)
+		removed_conditions.extend(conditions)
+
+	# Code attributes come from the current catalog, or for codes that left
+	# it during or after the range from their last stored row; stock and
+	# price over time come from the per-code series, so the cost follows the
+	# number of codes on the page rather than the number of stored snapshots.
+	current_source = "`tabStylus Current Stock`"
+	removed_source = f"({REMOVED_CODES_QUERY}) `removed`"
+	total = None
+	if not cursor:
+		total = sum(
+			frappe.db.sql(f"SELECT COUNT(*) FROM {source} {_where(conditions)}", params)[0][0]
+			for source, conditions in ((current_source, current_conditions), (removed_source, removed_conditions))
+		)
+	else:
+		current_conditions.append("`name` > %(cursor)s")
+		removed_conditions.append("`name` > %(cursor)s")
+		params["cursor"] = cursor
+
+	# Each side is read in code order up to the page size, then merged in
+	# the database so the order matches the cursor comparison.
+	params["limit"] = page_size + 1
+	fields = "`name` AS `code`, `designation`, `main_category`, `brand`, `price`, `description_hash`"
+	catalog = frappe.db.sql(
+		f"""
+			(SELECT {fields} FROM {current_source} {_where(current_conditions)} ORDER BY `name` LIMIT %(limit)s)
+			UNION ALL
+			(SELECT {fields} FROM {removed_source} {_where(removed_conditions)} ORDER BY `name` LIMIT %(limit)s)
+			ORDER BY `code` ASC
+			LIMIT %(limit)s
+		""",
 		params,
 		as_dict=True,
 	)
 
-	if not distinct_codes:
-		return {"items": []}
+	next_cursor = None
+	if len(catalog) > page_size:
+		catalog = catalog[:page_size]
+		next_cursor = catalog[-1].code
 
-	if len(distinct_codes) > MAX_ITEMS:
-		frappe.throw(
-			_("Your filters match {0} different items. Please narrow them down to {1} or fewer items to keep the page responsive.").format(
-				len(distinct_codes), MAX_ITEMS
-			)
-		)
+	if not catalog:
+		return {"items": [], "next_cursor": None, "total": total or 0}
 
-	rows = frappe.db.sql(
-		f"""
-			SELECT
-				`code`,
-				`designation`,
-				`main_category`,
-				`brand`,
-				`price`,
-				`stock`,
-				`creation`
-			FROM `tabStylus Stock History Item`
-			{where_clause}
-			ORDER BY `code` ASC, `creation` ASC
-		""",
-		params,
-		as_dict=True,
+	columns = VarianceColumns.load([row.code for row in catalog], start, end)
+	if compact:
+		return {**_build_compact_items(columns, catalog), "next_cursor": next_cursor, "total": total}
+
+	items = _build_items(columns, catalog)
+	return {"items": items, "next_cursor": next_cursor, "total": total}
+
+
+def _where(conditions: List[str]) -> str:
+	return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+@frappe.whitelist()
+def fetch_catalog_variance_summary(
+	from_date: Optional[str] = None,
+	to_date: Optional[str] = None,
+	brand: Optional[str] = None,
+	main_category: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+	"""Stock movement totals per code over [from_date, to_date] for the whole
+	Stylus catalog, or one brand or main category. Codes whose stock and price
+	did not change in the range are left out."""
+	return cached_result(
+		"catalog_variance_summary",
+		{"from_date": from_date, "to_date": to_date, "brand": brand, "main_category": main_category},
+		lambda: _compute_catalog_variance_summary(from_date, to_date, brand, main_category),
 	)
 
-	# Get opening balances (stock before the from_date for each code)
-	code_list = [c['code'] for c in distinct_codes]
-	opening_balances = _get_opening_balances(code_list, start_date)
 
-	items = _build_items(rows, opening_balances)
-	return {"items": items}
+def _compute_catalog_variance_summary(from_date, to_date, brand, main_category):
+	start_date, end_date = _validate_dates(from_date, to_date)
+	filters = {}
+	if brand:
+		filters["brand"] = brand
+	if main_category:
+		filters["main_category"] = main_category
+
+	catalog = frappe.get_all(
+		"Stylus Current Stock",
+		filters=filters,
+		fields=["name as code", "designation", "main_category", "brand"],
+		limit_page_length=0,
+	)
+	columns = VarianceColumns.load(
+		[row.code for row in catalog] if filters else None,
+		f"{start_date} 00:00:00",
+		f"{end_date} 23:59:59",
+	)
+
+	info = {row.code: row for row in catalog}
+	summary = columns.summary()
+	for row in summary:
+		attributes = info.get(row["code"]) or {}
+		row["designation"] = attributes.get("designation") or ""
+		row["main_category"] = attributes.get("main_category") or ""
+		row["brand"] = attributes.get("brand") or ""
+	return summary
 
 
 def _validate_dates(from_date: Optional[str], to_date: Optional[str]):
@@ -92,158 +200,174 @@ def _validate_dates(from_date: Optional[str], to_date: Optional[str]):
 	return start, end
 
 
-def _get_opening_balances(codes: List[str], start_date) -> Dict[str, float]:
-	"""Get the last stock value before the start_date for each code (opening balance)."""
-	if not codes:
-		return {}
-	
-	# For each code, get the most recent stock entry before start_date
-	opening_balances = {}
-	
-	for code in codes:
-		result = frappe.db.sql(
-			"""
-				SELECT `stock`
-				FROM `tabStylus Stock History Item`
-				WHERE `code` = %(code)s
-					AND `creation` < %(before_start)s
-				ORDER BY `creation` DESC
-				LIMIT 1
-			""",
-			{
-				"code": code,
-				"before_start": f"{start_date} 00:00:00"
-			},
-			as_dict=True
-		)
-		
-		if result:
-			opening_balances[code] = flt(result[0].get("stock"))
-		else:
-			# No history before start_date, set opening balance to 0
-			opening_balances[code] = 0.0
-	
-	return opening_balances
-
-
-def _build_items(rows: List[Dict[str, Any]], opening_balances: Dict[str, float]) -> List[Dict[str, Any]]:
-	result = OrderedDict()
-
-	for row in rows:
-		code = row.get("code")
-		if not code:
+def _build_items(columns: VarianceColumns, catalog: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+	"""Shape the computed columns into the page's per-item structure, one item
+	per catalog row. Labels are formatted only for the differences and
+	compressed history entries that are returned."""
+	segments = {code: (position, start, end) for position, code, start, end in columns.segments()}
+	items = []
+
+	for attributes in catalog:
+		code = attributes.code
+		opening_balance = columns.opening.get(code, 0.0)
+		# Always start with the opening balance (even if 0).
+		history = [{"label": "Opening", "date": "Opening", "stock": _round(opening_balance), "price": None}]
+		item = {
+			"code": code,
+			"designation": attributes.get("designation") or "",
+			"main_category": attributes.get("main_category") or "",
+			"brand": attributes.get("brand") or "",
+			"price": _opening_price(columns, attributes),
+			"history": history,
+			"differences": [],
+			"totals": {"positive": 0.0, "negative": 0.0},
+			"last_updated": None,
+			"opening_balance": opening_balance,
+			# Resolved by the page only when the user expands the description.
+			"description_hash": attributes.get("description_hash"),
+		}
+		items.append(item)
+
+		# Codes without points in range only show their opening balance.
+		if code not in segments:
 			continue
+		position, start, end = segments[code]
 
-		item = result.get(code)
-		if not item:
-			item = {
-				"code": code,
-				"designation": row.get("designation") or "",
-				"main_category": row.get("main_category") or "",
-				"brand": row.get("brand") or "",
-				"price": flt(row.get("price")),
-				"history": [],
-				"differences": [],
-				"totals": {"positive": 0.0, "negative": 0.0},
-				"last_updated": None,
-				"opening_balance": opening_balances.get(code),  # Store opening balance
-			}
-			result[code] = item
-		else:
-			if not item.get("designation") and row.get("designation"):
-				item["designation"] = row.get("designation")
-			if not item.get("main_category") and row.get("main_category"):
-				item["main_category"] = row.get("main_category")
-			if not item.get("brand") and row.get("brand"):
-				item["brand"] = row.get("brand")
-			if not item.get("price") and row.get("price"):
-				item["price"] = flt(row.get("price"))
-
-		history_entry = {
-			"label": format_datetime(row.get("creation"), "yyyy-MM-dd HH:mm"),
-			"timestamp": row.get("creation"),
-			"stock": flt(row.get("stock")),
-			"price": flt(row.get("price")),
+		for index in np.flatnonzero(columns.diff[start:end]) + start:
+			label = columns.label(index)
+			previous_label = "Opening" if columns.is_first[index] else columns.label(index - 1)
+			item["differences"].append(
+				{
+					"period": f"{previous_label} → {label}",
+					"date": columns.date(index),
+					"difference": float(columns.diff[index]),
+					"stock": _round(columns.stock[index]),
+					"price": float(columns.price[index]),
+				}
+			)
+
+		for index in np.flatnonzero(columns.keep[start:end]) + start:
+			history.append(
+				{
+					"label": columns.label(index),
+					"date": columns.date(index),
+					"stock": _round(columns.stock[index]),
+					"price": float(columns.price[index]),
+				}
+			)
+
+		priced = np.flatnonzero(columns.price[start:end])
+		if len(priced):
+			item["price"] = float(columns.price[start + priced[0]])
+		item["totals"] = {
+			"positive": float(columns.positive[position]),
+			"negative": float(columns.negative[position]),
 		}
-		item["history"].append(history_entry)
-		item["last_updated"] = history_entry["label"]
-
-		_append_difference(item, history_entry)
-
-	return [
-		{
-			**item,
-			"history": _compress_history(item["history"], item.get("opening_balance")),
-			"differences": item["differences"],
-			"totals": {
-				"positive": _round(item["totals"]["positive"]),
-				"negative": _round(item["totals"]["negative"]),
-			},
+		item["last_updated"] = columns.label(end - 1)
+
+	return items
+
+
+def _build_compact_items(columns: VarianceColumns, catalog: List[Dict[str, Any]]) -> Dict[str, Any]:
+	"""Columnar form of `_build_items` for the page.
+
+	`axis` holds every timestamp the page needs once, as integer seconds
+	(naive datetimes read as UTC). Per item, `t` lists the axis positions of
+	the compressed history points, `s` their stock as deltas of
+	stock * `scale` starting from `o` (the scaled opening balance), `p` their
+	prices and `q` the axis position of the point each one is compared with
+	(-1 for the opening balance); `u` is the axis position of the last point,
+	-1 for a code without points in range. Differences are the non-zero stock
+	deltas and are rebuilt by the page."""
+	scale = 10**DIFF_PRECISION
+	axis = np.array([], dtype=np.int64)
+	segments = {}
+	if len(columns.codes):
+		seconds = np.array(columns.ts, dtype="datetime64[s]").astype(np.int64)
+		kept = np.flatnonzero(columns.keep)
+		compared = np.where(columns.is_first[kept], -1, kept - 1)
+		last = columns.ends - 1
+		axis = np.unique(np.concatenate([seconds[kept], seconds[compared[compared >= 0]], seconds[last]]))
+
+		kept_axis = np.searchsorted(axis, seconds[kept])
+		compared_axis = np.where(compared >= 0, np.searchsorted(axis, seconds[np.maximum(compared, 0)]), -1)
+		scaled = np.rint(columns.stock[kept] * scale).astype(np.int64)
+		# Kept points are sorted like the rows, so each code's share is a slice.
+		kept_starts = np.searchsorted(kept, columns.starts)
+		kept_ends = np.append(kept_starts[1:], len(kept))
+		segments = {code: (position, start, end) for position, code, start, end in columns.segments()}
+
+	items = []
+	for attributes in catalog:
+		code = attributes.code
+		opening = int(round(columns.opening.get(code, 0.0) * scale))
+		item = {
+			"code": code,
+			"designation": attributes.get("designation") or "",
+			"main_category": attributes.get("main_category") or "",
+			"brand": attributes.get("brand") or "",
+			"price": _opening_price(columns, attributes),
+			"description_hash": attributes.get("description_hash"),
+			"totals": [0.0, 0.0],
+			"o": opening,
+			"t": [],
+			"s": [],
+			"p": [],
+			"q": [],
+			"u": -1,
 		}
-		for item in result.values()
-	]
-
-
-def _append_difference(item: Dict[str, Any], current_entry: Dict[str, Any]) -> None:
-	history = item.get("history") or []
-	
-	# Handle first entry within the date range
-	if len(history) == 1:
-		# Opening balance is always set now (either from history or 0)
-		opening_balance = item.get("opening_balance", 0.0)
-		
-		# Calculate variance from opening balance
-		diff = _round(current_entry["stock"] - opening_balance)
-		if diff != 0:
-			date_label = format_datetime(current_entry.get("timestamp"), "dd-MM-yyyy") if current_entry.get("timestamp") else current_entry["label"]
-			
-			diff_record = {
-				"period": f"Opening → {current_entry['label']}",
-				"date": date_label,
-				"difference": diff,
-				"stock": _round(current_entry["stock"]),
-				"price": flt(current_entry.get("price")),
-			}
-			
-			item["differences"].append(diff_record)
-			
-			if diff > 0:
-				item["totals"]["positive"] = _round(item["totals"]["positive"] + diff)
-			else:
-				item["totals"]["negative"] = _round(item["totals"]["negative"] + diff)
-		return
-	
-	if len(history) < 2:
-		return
-
-	prev_entry = history[-2]
-	diff = _round(current_entry["stock"] - prev_entry["stock"])
-	if not diff:
-		return
+		items.append(item)
 
-	date_label = format_datetime(current_entry.get("timestamp"), "dd-MM-yyyy") if current_entry.get("timestamp") else current_entry["label"]
+		if code not in segments:
+			continue
+		position, start, end = segments[code]
+		selected = slice(kept_starts[position], kept_ends[position])
+		stock = scaled[selected]
+		priced = np.flatnonzero(columns.price[start:end])
+		if len(priced):
+			item["price"] = float(columns.price[start + priced[0]])
+		item.update(
+			{
+				"totals": [float(columns.positive[position]), float(columns.negative[position])],
+				"t": kept_axis[selected].tolist(),
+				"s": np.diff(stock, prepend=opening).tolist(),
+				"p": columns.price[kept[selected]].tolist(),
+				"q": compared_axis[selected].tolist(),
+				"u": int(np.searchsorted(axis, seconds[end - 1])),
+			}
+		)
 
-	diff_record = {
-		"period": f"{prev_entry['label']} → {current_entry['label']}",
-		"date": date_label,
-		"difference": diff,
-		"stock": _round(current_entry["stock"]),
-		"price": flt(current_entry.get("price")),
-	}
+	return {"format": "compact", "scale": scale, "axis": axis.tolist(), "items": items}
 
-	item["differences"].append(diff_record)
 
-	if diff > 0:
-		item["totals"]["positive"] = _round(item["totals"]["positive"] + diff)
-	else:
-		item["totals"]["negative"] = _round(item["totals"]["negative"] + diff)
+def _opening_price(columns: VarianceColumns, attributes: Dict[str, Any]) -> float:
+	"""Price shown for a code before its first point in range: the price at
+	the range start, else the catalog row's."""
+	return columns.opening_price.get(attributes.code) or flt(attributes.get("price"))
 
 
-def _append_text_filter(fieldname: str, value: Any, conditions: List[str], params: Dict[str, Any]) -> None:
+def _append_text_filter(
+	fieldname: str,
+	value: Any,
+	conditions: List[str],
+	params: Dict[str, Any],
+	search_field: Optional[str] = None,
+) -> None:
 	values = _normalize_values(value)
 	if not values:
 		return
 
+	# Narrow to the codes the trigram index allows first; the LIKE below then
+	# only verifies those candidates.
+	candidates = match_codes(search_field or fieldname, values)
+	if candidates is not None:
+		if not candidates:
+			conditions.append("1 = 0")
+			return
+		param_key = f"{fieldname}_codes"
+		conditions.append(f"`name` IN %({param_key})s")
+		params[param_key] = tuple(candidates)
+
 	if len(values) == 1:
 		param_key = f"{fieldname}_like"
 		conditions.append(f"`{fieldname}` LIKE %({param_key})s")
@@ -272,69 +396,3 @@ def _normalize_values(value: Any) -> List[str]:
 
 def _round(value: float) -> float:
 	return flt(value, DIFF_PRECISION)
-
-
-def _compress_history(entries: List[Dict[str, Any]], opening_balance: Optional[float] = None) -> List[Dict[str, Any]]:
-	if not entries:
-		return []
-	
-	compressed = []
-	last_stock = None
-	last_price = None
-	first_entry_added = False
-
-	# Always add opening balance as the first entry (even if 0)
-	if opening_balance is not None:
-		compressed.append({
-			"label": "Opening",
-			"date": "Opening",
-			"stock": _round(opening_balance),
-			"price": None,
-		})
-		last_stock = _round(opening_balance)
-		first_entry_added = True
-
-	for entry in entries:
-		stock_value = _round(entry.get("stock") or 0)
-		price_value = entry.get("price")
-		if price_value is None:
-			price_value = last_price
-		else:
-			price_value = flt(price_value)
-
-		# Always include the first entry to ensure opening balance is shown
-		if last_stock is None or stock_value != last_stock or price_value != last_price:
-			compressed.append(
-				{
-					"label": entry.get("label"),
-					"date": format_datetime(entry.get("timestamp"), "dd-MM-yyyy") if entry.get("timestamp") else entry.get("label"),
-					"stock": stock_value,
-					"price": price_value,
-				}
-			)
-			# Track if first entry was added
-			if last_stock is None:
-				first_entry_added = True
-			last_stock = stock_value
-			last_price = price_value
-		else:
-			if compressed:
-				compressed[-1]["price"] = price_value
-
-	# Ensure first entry is always included as opening balance
-	if not first_entry_added and entries:
-		first_entry = entries[0]
-		first_stock = _round(first_entry.get("stock") or 0)
-		first_price = first_entry.get("price")
-		if first_price is not None:
-			first_price = flt(first_price)
-		
-		compressed.insert(0, {
-			"label": first_entry.get("label"),
-			"date": format_datetime(first_entry.get("timestamp"), "dd-MM-yyyy") if first_entry.get("timestamp") else first_entry.get("label"),
-			"stock": first_stock,
-			"price": first_price,
-		})
-
-	return compressed
-
@@ -4,6 +4,15 @@
 
 frappe.query_reports["NCR Price Comparison"] = {
 	"filters": [
-
+		{
+			"fieldname": "brand",
+			"label": __("Brand"),
+			"fieldtype": "Data"
+		},
+		{
+			"fieldname": "category",
+			"label": __("Category"),
+			"fieldtype": "Data"
+		}
 	]
 };
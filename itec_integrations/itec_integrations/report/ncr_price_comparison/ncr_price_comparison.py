@@ -2,7 +2,8 @@
 # For license information, please see license.txt
 
 import frappe
-import json
+
+from itec_integrations.itec_integrations.ncr.products import PRODUCT_DOCTYPE
 
 def execute(filters=None):
     columns = [
@@ -18,25 +19,28 @@ def execute(filters=None):
 
     data = []
 
-    ncr_doc = frappe.get_all("NCR Products", fields=["name"], order_by="creation desc", limit=1)
-    if not ncr_doc:
-        return columns, data
-
-    ncr_data = frappe.get_doc("NCR Products", ncr_doc[0].name)
+    filters = filters or {}
+    product_filters = {"is_active": 1}
+    if filters.get("brand"):
+        product_filters["brand"] = filters.get("brand")
+    if filters.get("category"):
+        product_filters["category"] = filters.get("category")
 
-    try:
-        products = json.loads(ncr_data.data_json)
-    except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "Invalid JSON in NCR Products")
-        return columns, data
+    products = frappe.get_all(
+        PRODUCT_DOCTYPE,
+        filters=product_filters,
+        fields=["product_reference", "product_name", "price"],
+        order_by="name asc",
+        limit_page_length=0,
+    )
 
     sync_setting = frappe.get_single("NCR Sync Setting")
     tax_category = sync_setting.tax_category
 
     for p in products:
-        product_ref = p.get("productReference")
-        ncr_name = p.get("productName")
-        ncr_price = p.get("price") or 0
+        product_ref = p.product_reference
+        ncr_name = p.product_name
+        ncr_price = p.price or 0
 
         item = frappe.db.get_value("Item", {"item_code": product_ref, "disabled": 0}, ["item_name"], as_dict=True)
         if item:
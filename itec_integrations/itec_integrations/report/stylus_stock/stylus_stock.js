@@ -0,0 +1,43 @@
+// Copyright (c) 2026, Abbass Chokor and contributors
+// For license information, please see license.txt
+/* eslint-disable */
+
+frappe.query_reports["Stylus Stock"] = {
+	"filters": [
+		{
+			"fieldname": "brand",
+			"label": __("Brand"),
+			"fieldtype": "Data"
+		},
+		{
+			"fieldname": "main_category",
+			"label": __("Category"),
+			"fieldtype": "Data"
+		}
+	],
+	formatter: function (value, row, column, data, default_formatter) {
+		if (column.fieldname === "description" && data && data.description_hash) {
+			return `<a class="stylus-blob-link" data-hash="${frappe.utils.escape_html(data.description_hash)}"
+				data-title="${frappe.utils.escape_html(data.code || '')}">${__('View')}</a>`;
+		}
+		return default_formatter(value, row, column, data);
+	},
+	onload: function (report) {
+		// Bound on the report's own wrapper so the handler goes away with it.
+		report.page.wrapper.off('click.stylus_blob').on('click.stylus_blob', '.stylus-blob-link', function (e) {
+			e.preventDefault();
+			const $link = $(this);
+			frappe.call({
+				method: 'itec_integrations.itec_integrations.stylus.blobs.get_content_blob',
+				args: { content_hash: $link.data('hash') },
+				callback: function (r) {
+					frappe.msgprint({
+						title: $link.data('title') || __('Description'),
+						message: frappe.dom.remove_script_and_style(r.message || ''),
+						wide: true,
+					});
+				},
+			});
+		});
+	}
+};
@@ -0,0 +1,41 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import frappe
+
+
+def execute(filters=None):
+	columns = [
+		{"label": "Code", "fieldname": "code", "fieldtype": "Data", "width": 200},
+		{"label": "Designation", "fieldname": "designation", "fieldtype": "Data", "width": 200},
+		{"label": "Price", "fieldname": "price", "fieldtype": "Currency", "width": 200},
+		{"label": "Stock", "fieldname": "stock", "fieldtype": "Float", "width": 200},
+		{"label": "Category", "fieldname": "main_category", "fieldtype": "Data", "width": 200},
+		{"label": "Brand", "fieldname": "brand", "fieldtype": "Data", "width": 200},
+		{"label": "Description", "fieldname": "description", "fieldtype": "Data", "width": 200},
+	]
+
+	filters = filters or {}
+	conditions = {}
+	for fieldname in ("brand", "main_category"):
+		if filters.get(fieldname):
+			conditions[fieldname] = filters.get(fieldname)
+
+	data = frappe.get_all(
+		"Stylus Current Stock",
+		filters=conditions,
+		fields=[
+			"code",
+			"designation",
+			"price",
+			"stock",
+			"main_category",
+			"brand",
+			"description_hash",
+		],
+		order_by="name asc",
+		limit_page_length=0,
+	)
+	# Descriptions live in Stylus Content Blob and are fetched by the report
+	# view only when a user opens one.
+	return columns, data
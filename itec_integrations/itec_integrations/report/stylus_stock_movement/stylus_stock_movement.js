@@ -17,6 +17,26 @@ frappe.query_reports["Stylus Stock Movement"] = {
 			fieldtype: "Date",
 			default: frappe.datetime.get_today(),
 			reqd: 1
+		},
+		{
+			fieldname: "group_by",
+			label: "Group By",
+			fieldtype: "Select",
+			options: "\nBrand\nMain Category"
+		},
+		{
+			fieldname: "brand",
+			label: "Brand",
+			fieldtype: "Data"
+		},
+		{
+			fieldname: "main_category",
+			label: "Main Category",
+			fieldtype: "Data"
 		}
-	]
+	],
+	tree: true,
+	name_field: "code",
+	parent_field: "parent_group",
+	initial_depth: 0
 };
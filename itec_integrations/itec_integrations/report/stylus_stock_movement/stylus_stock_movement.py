@@ -1,65 +1,57 @@
 import frappe
+from frappe.utils import flt, getdate
+
+from itec_integrations.itec_integrations.stylus.cache import cached_result
+from itec_integrations.itec_integrations.stylus.rollup import ROLLUP_DOCTYPE
+from itec_integrations.itec_integrations.stylus.series import SERIES_DOCTYPE, get_values_at
+from itec_integrations.itec_integrations.utils import chunked
+
+GROUP_FIELDS = {"Brand": "brand", "Main Category": "main_category"}
+MOVEMENT_PRECISION = 3
+
 
 def execute(filters=None):
 	if not filters:
 		filters = {}
 
+	return cached_result("stylus_stock_movement", filters, lambda: _execute(filters))
+
+
+def _execute(filters):
 	from_date = filters.get("from_date")
 	to_date = filters.get("to_date")
 
-	# Step 1: Fetch item stock history
-	raw_data = frappe.db.sql("""
-		SELECT code, stock, creation, designation, price, main_category, brand
-		FROM `tabStylus Stock History Item`
-		WHERE creation BETWEEN %(from_date)s AND %(to_date)s
-		ORDER BY code, creation
-	""", {
-		"from_date": from_date,
-		"to_date": to_date
-	}, as_dict=True)
-
-	# Step 2: Calculate absolute stock movements per item
-	movement_by_item = {}
-	previous_stock = {}
-	item_info = {}
-
-	for row in raw_data:
-		code = row["code"]
-		stock = row["stock"]
-
-		# Save item metadata once
-		if code not in item_info:
-			item_info[code] = {
-				"designation": row.get("designation"),
-				"price": row.get("price"),
-				"main_category": row.get("main_category"),
-				"brand": row.get("brand")
-			}
-
-		# Calculate change if previous stock exists
-		if code in previous_stock:
-			change = abs(stock - previous_stock[code])
-			movement_by_item[code] = movement_by_item.get(code, 0) + change
-
-		previous_stock[code] = stock
-
-	# Step 3: Build final data, excluding 0-change items
-	data = []
-	for code, total_change in movement_by_item.items():
-		if total_change == 0:
-			continue  # Skip unchanged items
+	if not from_date or not to_date:
+		frappe.throw("Please set both From Date and To Date")
 
-		info = item_info.get(code, {})
-		data.append({
-			"code": code,
-			"designation": info.get("designation"),
-			"price": info.get("price"),
-			"main_category": info.get("main_category"),
-			"brand": info.get("brand"),
-			"total_absolute_change": total_change
-		})
+	# Step 1: Sum the daily movement per item in the database. Only changes
+	# after the first snapshot of the range count, so the change that first
+	# snapshot recorded against the day before is taken off again.
+	start = f"{getdate(from_date)} 00:00:00"
+	end = f"{getdate(to_date)} 23:59:59"
+	movement = {
+		code: flt(total - opening_change, MOVEMENT_PRECISION)
+		for code, total, opening_change in _movement_per_code(start, end)
+	}
+
+	# Attributes come from each item's last stored row up to the end of the
+	# range, so items that have since left the catalog still show and filter.
+	moved = [code for code, total in movement.items() if total]
+	items = [
+		frappe._dict(attributes, code=code, total_absolute_change=movement[code])
+		for code, attributes in _attributes(moved, end, filters).items()
+	]
+	items.sort(key=lambda item: item.total_absolute_change, reverse=True)
+
+	# Step 2: Roll items up by brand or category, each group followed by its
+	# items so the tree view can drill down
+	group_field = GROUP_FIELDS.get(filters.get("group_by"))
+	if group_field:
+		data = _group_rows(items, group_field)
+	else:
+		data = [dict(item, indent=0) for item in items]
 
-	# Step 4: Define report columns
+	# Step 3: Define report columns
 	columns = [
 		{"label": "Item Code", "fieldname": "code", "fieldtype": "Data", "width": 150},
 		{"label": "Designation", "fieldname": "designation", "fieldtype": "Data", "width": 200},
@@ -68,8 +60,97 @@ def execute(filters=None):
 		{"label": "Brand", "fieldname": "brand", "fieldtype": "Data", "width": 150},
 		{"label": "Total Stock Movement", "fieldname": "total_absolute_change", "fieldtype": "Float", "width": 180}
 	]
+	if group_field:
+		columns.append({"label": "Items", "fieldname": "item_count", "fieldtype": "Int", "width": 80})
 
 	return columns, data
 
 
+def _group_rows(items, group_field):
+	groups = {}
+	for item in items:
+		groups.setdefault(item.get(group_field) or "Not Set", []).append(item)
+
+	totals = {group: sum(item.total_absolute_change for item in members) for group, members in groups.items()}
+	data = []
+	for group in sorted(groups, key=lambda group: totals[group], reverse=True):
+		data.append({
+			"code": group,
+			group_field: group,
+			"total_absolute_change": totals[group],
+			"item_count": len(groups[group]),
+			"indent": 0,
+		})
+		data.extend(dict(item, indent=1, parent_group=group) for item in groups[group])
+	return data
+
+
+def _movement_per_code(start, end):
+	"""(code, summed daily movement, change recorded by the range's first
+	snapshot) for every code with a rollup row in [start, end]."""
+	totals = frappe.db.sql(
+		f"""
+			SELECT `code`, SUM(`movement`)
+			FROM `tab{ROLLUP_DOCTYPE}`
+			WHERE `day` BETWEEN %(from_date)s AND %(to_date)s
+			GROUP BY `code`
+		""",
+		{"from_date": getdate(start), "to_date": getdate(end)},
+	)
+
+	# The rollup counts a day's first change from the previous close; for
+	# the first snapshot of the range that change happened before it.
+	opening_changes = {}
+	first = frappe.db.sql(
+		"SELECT MIN(`creation`) FROM `tabStylus Stock History` WHERE `creation` BETWEEN %(start)s AND %(end)s",
+		{"start": start, "end": end},
+	)[0][0]
+	if first:
+		points = frappe.get_all(
+			SERIES_DOCTYPE,
+			filters={"ts": first, "is_removed": 0},
+			fields=["code", "stock"],
+			limit_page_length=0,
+		)
+		previous = get_values_at([point.code for point in points], first, before=True)
+		opening_changes = {
+			point.code: abs(flt(point.stock) - flt(previous[point.code].stock))
+			for point in points
+			if point.code in previous
+		}
+
+	return [(code, flt(total), opening_changes.get(code, 0.0)) for code, total in totals]
+
+
+def _attributes(codes, end, filters):
+	"""code -> designation, price, category and brand of its last stored row
+	up to `end`, for the codes that match the brand and category filters."""
+	conditions = []
+	params = {"end": end}
+	for fieldname in ("brand", "main_category"):
+		if filters.get(fieldname):
+			conditions.append(f"AND `item`.`{fieldname}` = %({fieldname})s")
+			params[fieldname] = filters.get(fieldname)
 
+	attributes = {}
+	for chunk in chunked(codes):
+		for row in frappe.db.sql(
+			f"""
+				SELECT
+					`item`.`code`, `item`.`designation`, `item`.`price`, `item`.`main_category`, `item`.`brand`
+				FROM (
+					SELECT
+						`code`, `stock_history`,
+						ROW_NUMBER() OVER (PARTITION BY `code` ORDER BY `ts` DESC) AS `rn`
+					FROM `tab{SERIES_DOCTYPE}`
+					WHERE `is_removed` = 0 AND `ts` <= %(end)s AND `code` IN %(codes)s
+				) `point`
+				INNER JOIN `tabStylus Stock History Item` `item`
+					ON `item`.`parent` = `point`.`stock_history` AND `item`.`code` = `point`.`code`
+				WHERE `point`.`rn` = 1 {" ".join(conditions)}
+			""",
+			{**params, "codes": tuple(chunk)},
+			as_dict=True,
+		):
+			attributes[row.pop("code")] = row
+	return attributes
@@ -13,6 +13,32 @@ frappe.query_reports["Stylus Stock Pivot"] = {
 			"fieldtype": "Date",
 			"default": frappe.datetime.get_today(),
 			"reqd": 1
+		},
+		{
+			"fieldname": "bucket",
+			"label": "Bucket",
+			"fieldtype": "Select",
+			"options": "Daily\nWeekly\nMonthly",
+			"default": "Daily"
+		},
+		{
+			"fieldname": "value",
+			"label": "Value",
+			"fieldtype": "Select",
+			"options": "Close\nOpen\nMin\nMax",
+			"default": "Close"
+		},
+		{
+			"fieldname": "column_page",
+			"label": "Column Page",
+			"fieldtype": "Int",
+			"default": 1
+		},
+		{
+			"fieldname": "columns_per_page",
+			"label": "Columns Per Page",
+			"fieldtype": "Int",
+			"default": 31
 		}
 	]
 };
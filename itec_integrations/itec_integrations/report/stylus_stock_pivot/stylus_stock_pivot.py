@@ -1,37 +1,52 @@
+from datetime import timedelta
+
 import frappe
-from datetime import datetime
+from frappe.utils import cint, getdate
+
+from itec_integrations.itec_integrations.stylus.cache import cached_result
+from itec_integrations.itec_integrations.stylus.rollup import ROLLUP_DOCTYPE, get_rollup
+from itec_integrations.itec_integrations.stylus.series import get_values_at
+
+
+VALUE_FIELDS = {"Close": "close_stock", "Open": "open_stock", "Min": "min_stock", "Max": "max_stock"}
+DEFAULT_COLUMNS_PER_PAGE = 31
 
 
 def execute(filters=None):
 	if not filters:
 		filters = {}
 
+	return cached_result("stylus_stock_pivot", filters, lambda: _execute(filters))
+
+
+def _execute(filters):
 	from_date = filters.get("from_date")
 	to_date = filters.get("to_date")
 
 	if not from_date or not to_date:
 		frappe.throw("Please set both From Date and To Date")
 
-	# Step 1: Get distinct dates
-	dates = frappe.db.get_all(
-		"Stylus Stock History Item",
-		fields=["DATE(creation) as date"],
-		filters={"creation": ["between", [from_date, to_date]]},
-		distinct=True
-	)
+	bucket = filters.get("bucket") or "Daily"
+	value_field = VALUE_FIELDS.get(filters.get("value") or "Close", "close_stock")
+	per_page = cint(filters.get("columns_per_page")) or DEFAULT_COLUMNS_PER_PAGE
+	page = max(cint(filters.get("column_page")), 1)
 
-	# Ensure dates are formatted and sorted in descending order
-	date_list = sorted(
-		[
-			d.get("date").strftime("%Y-%m-%d")
-			if hasattr(d.get("date"), "strftime")
-			else str(d.get("date"))
-			for d in dates
-		],
-		reverse=True
-	)
+	# Step 1: Get the distinct days on which some stock or price changed,
+	# from the (day, code) index of the daily rollup
+	dates = frappe.db.sql_list(f"""
+		SELECT DISTINCT `day`
+		FROM `tab{ROLLUP_DOCTYPE}`
+		WHERE `day` BETWEEN %s AND %s
+	""", (getdate(from_date), getdate(to_date)))
+
+	# Step 2: Group them into buckets, newest first, and keep the page asked for
+	buckets = {}
+	for date in sorted(getdate(d) for d in dates):
+		buckets.setdefault(_bucket_key(date, bucket), []).append(date)
+	bucket_keys = sorted(buckets, reverse=True)
+	page_keys = bucket_keys[(page - 1) * per_page : page * per_page]
 
-	# Step 2: Define columns
+	# Step 3: Define columns
 	columns = [
 		{"label": "Item Code", "fieldname": "code", "fieldtype": "Data", "width": 150},
 		{"label": "Designation", "fieldname": "designation", "fieldtype": "Data", "width": 200},
@@ -39,64 +54,115 @@ def execute(filters=None):
 		{"label": "Brand", "fieldname": "brand", "fieldtype": "Data", "width": 150},
 		{"label": "Price", "fieldname": "price", "fieldtype": "Currency", "width": 120},
 	]
- 
-	for date in date_list:
+
+	for key in page_keys:
 		columns.append({
-			"label": date,
-			"fieldname": date,
+			"label": _bucket_label(key, bucket),
+			"fieldname": key,
 			"fieldtype": "Float",
 			"width": 150
 		})
 
-	# Step 3: Get raw stock data
-	raw_data = frappe.db.sql("""
-		SELECT
-			`code`,
-			`designation`,
-			`main_category`,
-			`brand`,
-			`price`,
-			DATE(`creation`) AS `date`,
-			`stock` AS `stock`
-		FROM
-			`tabStylus Stock History Item`
-		WHERE
-			DATE(`creation`) BETWEEN %s AND %s
-		GROUP BY
-			`code`, DATE(`creation`)
-	""", (from_date, to_date), as_dict=True)
-
-	# Step 4: Transform data into row-wise format
+	if not page_keys:
+		return columns, []
+
+	# Step 4: Read the daily rollup of the page's range. Codes of the current
+	# catalog that have not changed since the page's first day hold their
+	# current values throughout; only the codes that changed since then need
+	# the value they entered the page with.
+	page_keys = sorted(page_keys)
+	start_day = buckets[page_keys[0]][0]
+	end_day = buckets[page_keys[-1]][-1]
+	rollup = get_rollup(start_day, end_day)
+	changed = frappe.db.sql_list(
+		f"SELECT DISTINCT `code` FROM `tab{ROLLUP_DOCTYPE}` WHERE `day` >= %s", start_day
+	)
+	opening = get_values_at(changed, f"{start_day} 00:00:00", include_removed=True, before=True)
+	catalog = {
+		row.name: row
+		for row in frappe.get_all(
+			"Stylus Current Stock",
+			fields=["name", "designation", "main_category", "brand", "stock", "price"],
+			limit_page_length=0,
+		)
+	}
+	changed = set(changed)
+	for code, row in catalog.items():
+		if code not in changed:
+			opening[code] = frappe._dict(stock=row.stock, price=row.price, is_removed=0)
+
+	# Step 5: Aggregate every bucket, carrying the last close across days
+	# without a change
 	item_map = {}
-	for row in raw_data:
-		key = row.code
-		date = row.date.strftime("%Y-%m-%d")
-		stock = row.stock
-		price = row.price
-
-		if key not in item_map:
-			item_map[key] = {
-				"code": row.code,
-				"designation": row.designation,
-				"main_category": row.main_category,
-				"brand": row.brand,
-				"price": price,
-				"_latest_date": date
-			}
-		else:
-			# Update price if this is a more recent date
-			if date > item_map[key]["_latest_date"]:
-				item_map[key]["price"] = price
-				item_map[key]["_latest_date"] = date
-
-		item_map[key][date] = stock
-
-	# Step 5: Clean up temporary fields and return data
-	data = []
-	for item in item_map.values():
-		# Remove temporary tracking field
-		if "_latest_date" in item:
-			del item["_latest_date"]
-		data.append(item)
-	
-	return columns, data
+	for code in sorted(set(opening) | set(rollup)):
+		days = rollup.get(code, [])
+		current = opening.get(code)
+		close = None if not current or current.is_removed else current.stock
+		removed = not current or current.is_removed
+		price = current.price if current else None
+		position = 0
+		values = {}
+		for key in page_keys:
+			bucket_end = buckets[key][-1]
+			rows = []
+			while position < len(days) and days[position].day <= bucket_end:
+				rows.append(days[position])
+				position += 1
+
+			if rows:
+				value = _aggregate(rows, close, value_field)
+				close = rows[-1].close_stock
+				removed = rows[-1].is_removed
+				price = rows[-1].last_price
+			else:
+				value = close
+			if not removed and value is not None:
+				values[key] = value
+
+		if values:
+			item_map[code] = {"code": code, "price": price, **values}
+
+	# Step 6: Attach the current catalog attributes and return data
+	for code, item in item_map.items():
+		info = catalog.get(code)
+		if info:
+			item.update(designation=info.designation, main_category=info.main_category, brand=info.brand)
+
+	message = None
+	if len(bucket_keys) > per_page:
+		first = (page - 1) * per_page + 1
+		message = (
+			f"Showing columns {first} to {first + len(page_keys) - 1} of {len(bucket_keys)}. "
+			"Change Column Page to see the others."
+		)
+
+	return columns, list(item_map.values()), message
+
+
+def _bucket_key(date, bucket):
+	if bucket == "Weekly":
+		return (date - timedelta(days=date.weekday())).isoformat()
+	if bucket == "Monthly":
+		return date.strftime("%Y-%m")
+	return date.isoformat()
+
+
+def _bucket_label(key, bucket):
+	if bucket == "Weekly":
+		return f"Week of {key}"
+	if bucket == "Monthly":
+		return getdate(f"{key}-01").strftime("%b %Y")
+	return key
+
+
+def _aggregate(rows, carried, value_field):
+	"""One bucket's value from its rollup rows; `carried` is the close before
+	the bucket, which also holds on the bucket's days before its first row."""
+	if value_field == "open_stock":
+		return carried if carried is not None else rows[0].open_stock
+	if value_field == "close_stock":
+		return rows[-1].close_stock
+	values = [row[value_field] for row in rows]
+	if carried is not None:
+		values.append(carried)
+	return min(values) if value_field == "min_stock" else max(values)
@@ -0,0 +1,354 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Columnar archive of Stylus data under the site's private files.
+
+Each dataset (the stock histories and their item rows, the daily rollup and
+the price change logs) is written to
+`private/files/stylus_archive/<dataset>/<YYYY-MM>/` as compressed part files:
+Parquet when pyarrow is installed, gzipped CSV otherwise. Item rows carry
+the hashes of their descriptions and images, not the content. Exports are
+incremental on `(modified, name)` and stop short of the last `EXPORT_LAG`, so
+rows stamped by a transaction that commits late are not skipped; a row
+updated after it was archived is appended again and readers keep the last
+version of each name. A month with too many parts is compacted into one."""
+
+import csv
+import gzip
+import io
+import json
+import mmap
+import os
+import time
+from datetime import timedelta
+
+import numpy as np
+
+import frappe
+from frappe.utils import cint, get_datetime, now_datetime
+
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = pq = None
+
+from itec_integrations.itec_integrations.stylus.ingest import HISTORY_ITEM_DOCTYPE
+from itec_integrations.itec_integrations.stylus.price_changes import LOG_DOCTYPE
+from itec_integrations.itec_integrations.stylus.rollup import ROLLUP_DOCTYPE
+from itec_integrations.itec_integrations.stylus.sync import HISTORY_DOCTYPE
+
+
+ARCHIVE_FOLDER = "stylus_archive"
+MANIFEST_FILE = "manifest.json"
+EXPORT_BATCH_SIZE = 50000
+MAX_PARTS_PER_MONTH = 48
+EXPORT_LOCK_KEY = "stylus_archive:export_lock"
+EXPORT_LOCK_TTL = 60 * 60
+# Rows are stamped when written but only visible once their transaction
+# commits; a sync commits within this long of stamping its rows.
+EXPORT_LAG = timedelta(hours=1)
+
+# dataset -> source doctype, the column that decides the month, and the
+# archived columns with their types.
+DATASETS = {
+	"history": {
+		"doctype": HISTORY_DOCTYPE,
+		"time_field": "creation",
+		"columns": (
+			("creation", "timestamp"),
+			("snapshot_type", "string"),
+			("item_count", "int"),
+			("stored_count", "int"),
+		),
+	},
+	"history_items": {
+		"doctype": HISTORY_ITEM_DOCTYPE,
+		"time_field": "creation",
+		"columns": (
+			("parent", "string"),
+			("idx", "int"),
+			("creation", "timestamp"),
+			("code", "string"),
+			("designation", "string"),
+			("price", "float"),
+			("stock", "float"),
+			("main_category", "string"),
+			("brand", "string"),
+			("description_hash", "string"),
+			("imagens_hash", "string"),
+			("imagem_capa_hash", "string"),
+			("is_removed", "int"),
+			("row_hash", "string"),
+		),
+	},
+	"daily": {
+		"doctype": ROLLUP_DOCTYPE,
+		"time_field": "day",
+		"columns": (
+			("code", "string"),
+			("day", "date"),
+			("open_stock", "float"),
+			("close_stock", "float"),
+			("min_stock", "float"),
+			("max_stock", "float"),
+			("movement", "float"),
+			("last_price", "float"),
+			("is_removed", "int"),
+		),
+	},
+	"price_changes": {
+		"doctype": LOG_DOCTYPE,
+		"time_field": "sync_datetime",
+		"columns": (
+			("code", "string"),
+			("brand", "string"),
+			("main_category", "string"),
+			("stock_history", "string"),
+			("sync_datetime", "timestamp"),
+			("old_price", "float"),
+			("new_price", "float"),
+			("change_amount", "float"),
+			("change_pct", "float"),
+			("direction", "string"),
+		),
+	},
+}
+KEY_COLUMNS = (("name", "string"), ("modified", "timestamp"))
+
+
+def get_archive_path(*parts):
+	return frappe.get_site_path("private", "files", ARCHIVE_FOLDER, *parts)
+
+
+def archive_format():
+	return "parquet" if pq else "csv.gz"
+
+
+def read_manifest():
+	path = get_archive_path(MANIFEST_FILE)
+	if not os.path.exists(path):
+		return {}
+	with open(path) as manifest:
+		return json.load(manifest)
+
+
+def _write_manifest(manifest):
+	path = get_archive_path(MANIFEST_FILE)
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	with open(f"{path}.tmp", "w") as target:
+		json.dump(manifest, target, indent=1, sort_keys=True)
+	os.replace(f"{path}.tmp", path)
+
+
+def export_archive(datasets=None):
+	"""Append every row modified since the last export to the archive.
+	Safe to call after each sync; concurrent calls skip while one runs."""
+	cache = frappe.cache()
+	lock = cache.make_key(EXPORT_LOCK_KEY)
+	if not cache.set(lock, 1, ex=EXPORT_LOCK_TTL, nx=True):
+		return None
+
+	try:
+		manifest = read_manifest()
+		exported = {}
+		until = now_datetime() - EXPORT_LAG
+		for dataset in datasets or DATASETS:
+			state = manifest.setdefault(dataset, {})
+			exported[dataset] = 0
+			while True:
+				rows = _read_batch(dataset, state.get("modified"), state.get("name"), until)
+				if not rows:
+					break
+				for month, month_rows in _by_month(dataset, rows).items():
+					_write_part(dataset, month, month_rows)
+					_compact_if_needed(dataset, month)
+				state.update(modified=str(rows[-1]["modified"]), name=rows[-1]["name"], format=archive_format())
+				_write_manifest(manifest)
+				exported[dataset] += len(rows)
+		return exported
+	finally:
+		cache.delete(lock)
+
+
+def _read_batch(dataset, after_modified, after_name, until):
+	spec = DATASETS[dataset]
+	fields = [fieldname for fieldname, _type in KEY_COLUMNS + spec["columns"]]
+	condition = "`modified` < %(until)s"
+	params = {"limit": EXPORT_BATCH_SIZE, "until": until}
+	if after_modified:
+		condition += " AND (`modified` > %(modified)s OR (`modified` = %(modified)s AND `name` > %(name)s))"
+		params.update(modified=get_datetime(after_modified), name=after_name or "")
+	return frappe.db.sql(
+		f"""
+			SELECT {", ".join(f"`{fieldname}`" for fieldname in fields)}
+			FROM `tab{spec["doctype"]}`
+			WHERE {condition}
+			ORDER BY `modified`, `name`
+			LIMIT %(limit)s
+		""",
+		params,
+		as_dict=True,
+	)
+
+
+def _by_month(dataset, rows):
+	time_field = DATASETS[dataset]["time_field"]
+	months = {}
+	for row in rows:
+		moment = row.get(time_field) or row["modified"]
+		months.setdefault(moment.strftime("%Y-%m"), []).append(row)
+	return months
+
+
+def _columns(dataset):
+	return KEY_COLUMNS + DATASETS[dataset]["columns"]
+
+
+def _write_part(dataset, month, rows, name=None):
+	folder = get_archive_path(dataset, month)
+	os.makedirs(folder, exist_ok=True)
+	name = name or f"part-{time.time_ns()}"
+	path = os.path.join(folder, f"{name}.{archive_format()}")
+
+	columns = _columns(dataset)
+	if pq:
+		table = pa.Table.from_pylist(
+			[{fieldname: row.get(fieldname) for fieldname, _type in columns} for row in rows],
+			schema=_arrow_schema(columns),
+		)
+		pq.write_table(table, f"{path}.tmp", compression="zstd")
+	else:
+		with gzip.open(f"{path}.tmp", "wt", newline="") as target:
+			writer = csv.writer(target)
+			writer.writerow([fieldname for fieldname, _type in columns])
+			writer.writerows([_csv_value(row.get(fieldname)) for fieldname, _type in columns] for row in rows)
+	# Readers only pick up complete files.
+	os.replace(f"{path}.tmp", path)
+	return path
+
+
+def _arrow_schema(columns):
+	types = {
+		"string": pa.string(),
+		"float": pa.float64(),
+		"int": pa.int64(),
+		"date": pa.date32(),
+		"timestamp": pa.timestamp("us"),
+	}
+	return pa.schema([(fieldname, types[kind]) for fieldname, kind in columns])
+
+
+def _csv_value(value):
+	if value is None:
+		return ""
+	if hasattr(value, "isoformat"):
+		return value.isoformat()
+	return value
+
+
+def list_parts(dataset, from_month=None, to_month=None):
+	"""Part files of `dataset`, oldest month and part first."""
+	root = get_archive_path(dataset)
+	if not os.path.isdir(root):
+		return []
+	parts = []
+	for month in sorted(os.listdir(root)):
+		if (from_month and month < from_month) or (to_month and month > to_month):
+			continue
+		folder = os.path.join(root, month)
+		parts.extend(
+			os.path.join(folder, filename)
+			for filename in sorted(os.listdir(folder))
+			if filename.endswith((".parquet", ".csv.gz"))
+		)
+	return parts
+
+
+def read_archive(dataset, from_month=None, to_month=None, columns=None):
+	"""Read archived `dataset` rows in [from_month, to_month] ("YYYY-MM") as
+	a dict of NumPy columns, keeping the last archived version of each row.
+	Part files are memory-mapped, so this works offline on a copy of the
+	archive folder without touching the database."""
+	wanted = [fieldname for fieldname, _type in _columns(dataset)]
+	if columns:
+		wanted = ["name"] + [fieldname for fieldname in columns if fieldname in wanted and fieldname != "name"]
+
+	chunks = [_read_part(path, dataset, wanted) for path in list_parts(dataset, from_month, to_month)]
+	if not chunks:
+		return {fieldname: np.array([]) for fieldname in wanted}
+	result = {fieldname: np.concatenate([chunk[fieldname] for chunk in chunks]) for fieldname in wanted}
+
+	# Later parts hold later versions: keep each name's last occurrence.
+	names = result["name"]
+	_unique, last_from_end = np.unique(names[::-1], return_index=True)
+	keep = np.sort(len(names) - 1 - last_from_end)
+	return {fieldname: values[keep] for fieldname, values in result.items()}
+
+
+def _read_part(path, dataset, wanted):
+	if path.endswith(".parquet"):
+		if not pq:
+			frappe.throw("pyarrow is required to read Parquet archive files")
+		table = pq.read_table(path, columns=wanted, memory_map=True)
+		return {fieldname: table.column(fieldname).to_numpy(zero_copy_only=False) for fieldname in wanted}
+
+	kinds = dict(_columns(dataset))
+	with open(path, "rb") as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+		with gzip.GzipFile(fileobj=mapped) as compressed:
+			reader = csv.DictReader(io.TextIOWrapper(compressed, encoding="utf-8", newline=""))
+			rows = list(reader)
+	return {fieldname: _csv_column([row[fieldname] for row in rows], kinds[fieldname]) for fieldname in wanted}
+
+
+def _csv_column(values, kind):
+	if kind == "float":
+		return np.array([float(value) if value else np.nan for value in values], dtype=float)
+	if kind == "int":
+		return np.array([cint(value) for value in values], dtype=np.int64)
+	if kind == "timestamp":
+		return np.array([value or "NaT" for value in values], dtype="datetime64[us]")
+	if kind == "date":
+		return np.array([value or "NaT" for value in values], dtype="datetime64[D]")
+	return np.array([value or None for value in values], dtype=object)
+
+
+def _compact_if_needed(dataset, month):
+	"""Rewrite a month with too many parts as one deduplicated part."""
+	parts = list_parts(dataset, month, month)
+	if len(parts) <= MAX_PARTS_PER_MONTH:
+		return
+	columns = read_archive(dataset, month, month)
+	rows = [
+		{fieldname: _from_numpy(values[index]) for fieldname, values in columns.items()}
+		for index in range(len(columns["name"]))
+	]
+	_write_part(dataset, month, rows, name=f"compacted-{time.time_ns()}")
+	for path in parts:
+		os.remove(path)
+
+
+def _from_numpy(value):
+	if isinstance(value, np.datetime64):
+		return None if np.isnat(value) else value.astype(object)
+	if isinstance(value, np.floating):
+		return None if np.isnan(value) else float(value)
+	if isinstance(value, np.integer):
+		return int(value)
+	return value
+
+
+def enqueue_export():
+	frappe.enqueue(
+		"itec_integrations.itec_integrations.stylus.archive.export_archive",
+		queue="long",
+		timeout=3600,
+	)
+
+
+@frappe.whitelist()
+def export_stylus_archive():
+	"""Queue an incremental archive export."""
+	frappe.only_for("System Manager")
+	enqueue_export()
+	return {"queued": True, "format": archive_format()}
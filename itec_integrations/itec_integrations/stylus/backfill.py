@@ -0,0 +1,271 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Set-based backfill of Stylus Price Change Log.
+
+Consecutive price differences per code are computed in the database with
+`LAG(price) OVER (PARTITION BY code ORDER BY creation)` over every item row,
+removals included, one date window at a time. Idempotency comes from the
+unique (stock_history, code) constraint on the log and INSERT IGNORE, so
+nothing is read back before writing."""
+
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe.utils import add_to_date, cint, flt, get_datetime, getdate, now_datetime, time_diff_in_seconds
+
+from itec_integrations.itec_integrations.stylus.price_changes import (
+	LOG_DOCTYPE,
+	insert_price_change_logs,
+)
+from itec_integrations.itec_integrations.stylus.price_stats import refresh_price_change_stats
+from itec_integrations.itec_integrations.stylus.snapshots import get_keyframe, get_latest_history
+
+
+BACKFILL_CHUNK_DAYS = 7
+DEFAULT_PARTITIONS = 4
+PARTITION_DOCTYPE = "Stylus Backfill Partition"
+PARTITION_FIELD = "backfill_partition_status"
+# Partition jobs are enqueued with this timeout; a partition "Running" for
+# longer than that lost its worker and may be resumed.
+PARTITION_TIMEOUT = 3600
+
+
+def iter_date_windows(from_date, to_date, days=BACKFILL_CHUNK_DAYS):
+	"""Yield (start, end) datetimes covering [from_date, to_date] in windows of
+	`days` calendar days."""
+	start = getdate(from_date)
+	to_date = getdate(to_date)
+	while start <= to_date:
+		end = min(start + timedelta(days=days - 1), to_date)
+		yield datetime.combine(start, time.min), datetime.combine(end, time.max)
+		start = end + timedelta(days=1)
+
+
+def get_seed_creation(start):
+	"""Earliest creation the LAG window has to see so the first history in the
+	window can be compared with its predecessor. For delta storage that is the
+	keyframe the predecessor builds on."""
+	prior = get_latest_history(before=start)
+	if not prior:
+		return start
+	keyframe = get_keyframe(prior)
+	return keyframe.creation if keyframe else prior.creation
+
+
+def backfill_window(start, end):
+	"""Create the missing price change logs for histories created in
+	[start, end]. Returns (histories_scanned, logs_created)."""
+	start = get_datetime(start)
+	end = get_datetime(end)
+	histories = frappe.db.count("Stylus Stock History", {"creation": ["between", (start, end)]})
+	if not histories:
+		return 0, 0
+
+	# LAG runs over every row, removals included, so a code that was removed
+	# and re-added is seen as new (as live ingestion does) instead of being
+	# compared with its price from before the removal. The log points at the
+	# history preceding its own, like the incremental path.
+	rows = frappe.db.sql(
+		"""
+			SELECT
+				`sequenced`.`code`, `sequenced`.`designation`, `sequenced`.`main_category`, `sequenced`.`brand`,
+				`sequenced`.`parent` AS `stock_history`,
+				`histories`.`previous_stock_history`,
+				`sequenced`.`creation` AS `sync_datetime`,
+				`sequenced`.`old_price`,
+				`sequenced`.`price` AS `new_price`
+			FROM (
+				SELECT
+					`code`, `designation`, `main_category`, `brand`, `parent`, `creation`, `price`, `is_removed`,
+					LAG(`price`) OVER (PARTITION BY `code` ORDER BY `creation`) AS `old_price`,
+					LAG(`is_removed`) OVER (PARTITION BY `code` ORDER BY `creation`) AS `previous_removed`
+				FROM `tabStylus Stock History Item`
+				WHERE `creation` >= %(seed)s
+					AND `creation` <= %(end)s
+					AND IFNULL(`code`, '') != ''
+			) `sequenced`
+			LEFT JOIN (
+				SELECT
+					`name`,
+					LAG(`name`) OVER (ORDER BY `creation`, `name`) AS `previous_stock_history`
+				FROM `tabStylus Stock History`
+				WHERE `creation` >= %(seed)s
+					AND `creation` <= %(end)s
+			) `histories` ON `histories`.`name` = `sequenced`.`parent`
+			WHERE `sequenced`.`creation` >= %(start)s
+				AND `sequenced`.`is_removed` = 0
+				AND `sequenced`.`previous_removed` = 0
+				AND `sequenced`.`old_price` IS NOT NULL
+				AND `sequenced`.`price` != `sequenced`.`old_price`
+			ORDER BY `sequenced`.`creation`, `sequenced`.`code`
+		""",
+		{"seed": get_seed_creation(start), "start": start, "end": end},
+		as_dict=True,
+	)
+
+	changes = []
+	for row in rows:
+		change_amount = row.new_price - row.old_price
+		row["change_amount"] = change_amount
+		row["change_pct"] = (change_amount / row.old_price * 100.0) if row.old_price else 0.0
+		row["direction"] = "Increase" if change_amount > 0 else "Decrease"
+		changes.append(row)
+
+	names = insert_price_change_logs(changes, ignore_duplicates=True)
+	logs_created = frappe.db.count(LOG_DOCTYPE, {"name": ["in", names]}) if names else 0
+	if logs_created:
+		refresh_price_change_stats({row.sync_datetime for row in changes})
+	return histories, logs_created
+
+
+def backfill_range(from_date, to_date):
+	"""Backfill every window in [from_date, to_date], committing after each
+	so a long run keeps its progress."""
+	histories = logs_created = 0
+	for start, end in iter_date_windows(from_date, to_date):
+		scanned, created = backfill_window(start, end)
+		histories += scanned
+		logs_created += created
+		frappe.db.commit()
+	return histories, logs_created
+
+
+def plan_partitions(from_date, to_date, count=DEFAULT_PARTITIONS):
+	"""Split [from_date, to_date] into at most `count` contiguous date ranges
+	of (nearly) equal length."""
+	from_date = getdate(from_date)
+	to_date = getdate(to_date)
+	total_days = (to_date - from_date).days + 1
+	count = max(1, min(cint(count) or DEFAULT_PARTITIONS, total_days))
+	size, remainder = divmod(total_days, count)
+
+	partitions = []
+	start = from_date
+	for index in range(count):
+		days = size + (1 if index < remainder else 0)
+		end = start + timedelta(days=days - 1)
+		partitions.append((start, end))
+		start = end + timedelta(days=1)
+	return partitions
+
+
+def prepare_partitions(setting, from_date, to_date):
+	"""Return the partitions to run for [from_date, to_date]. Unfinished
+	partitions of the same range are resumed from their checkpoint; otherwise
+	the range is planned afresh.
+
+	Rows are read and written directly rather than through `setting.save()`,
+	which would overwrite checkpoints running partitions write meanwhile.
+	Partitions another worker is running are left alone unless they outlived
+	the job timeout."""
+	from_date = getdate(from_date)
+	to_date = getdate(to_date)
+	existing = get_partitions(setting)
+	same_range = (
+		existing
+		and getdate(existing[0].partition_from) == from_date
+		and getdate(existing[-1].partition_to) == to_date
+	)
+	if same_range and any(row.status != "Completed" for row in existing):
+		return [row for row in existing if row.status != "Completed" and not _is_running(row)]
+
+	frappe.db.delete(PARTITION_DOCTYPE, {"parenttype": setting.doctype, "parentfield": PARTITION_FIELD})
+	for idx, (start, end) in enumerate(plan_partitions(from_date, to_date, setting.get("backfill_partitions")), 1):
+		frappe.get_doc(
+			{
+				"doctype": PARTITION_DOCTYPE,
+				"parent": setting.name,
+				"parenttype": setting.doctype,
+				"parentfield": PARTITION_FIELD,
+				"idx": idx,
+				"partition_from": start,
+				"partition_to": end,
+				"status": "Queued",
+			}
+		).db_insert()
+	return get_partitions(setting)
+
+
+def _is_running(row):
+	"""Whether a worker is (still) running the partition."""
+	return (
+		row.status == "Running"
+		and row.started_at
+		and get_datetime(row.started_at) > add_to_date(now_datetime(), seconds=-PARTITION_TIMEOUT)
+	)
+
+
+def get_partitions(setting):
+	return frappe.get_all(
+		PARTITION_DOCTYPE,
+		filters={"parenttype": setting.doctype, "parentfield": PARTITION_FIELD},
+		fields=["name", "partition_from", "partition_to", "status", "started_at"],
+		order_by="idx asc",
+	)
+
+
+def run_partition(partition):
+	"""Backfill one partition window by window, persisting a checkpoint after
+	each so a rerun picks up after the last completed window."""
+	row = frappe.db.get_value(
+		PARTITION_DOCTYPE,
+		partition,
+		[
+			"name",
+			"partition_from",
+			"partition_to",
+			"status",
+			"checkpoint",
+			"histories_scanned",
+			"logs_created",
+			"started_at",
+		],
+		as_dict=True,
+	)
+	if not row or row.status == "Completed" or _is_running(row):
+		return
+
+	histories = cint(row.histories_scanned)
+	logs_created = cint(row.logs_created)
+	run_started = now_datetime()
+	run_histories = 0
+	_update_partition(partition, status="Running", started_at=run_started, error=None)
+	frappe.db.commit()
+
+	try:
+		for window_start, window_end in remaining_windows(row):
+			scanned, created = backfill_window(window_start, window_end)
+			histories += scanned
+			logs_created += created
+			run_histories += scanned
+			elapsed = time_diff_in_seconds(now_datetime(), run_started)
+			_update_partition(
+				partition,
+				checkpoint=window_end.date(),
+				histories_scanned=histories,
+				logs_created=logs_created,
+				throughput=flt(run_histories / elapsed * 60, 1) if elapsed > 0 else 0,
+			)
+			frappe.db.commit()
+	except Exception as e:
+		frappe.db.rollback()
+		_update_partition(partition, status="Failed", error=str(e)[:500])
+		frappe.db.commit()
+		frappe.log_error(frappe.get_traceback(), "Stylus Backfill Partition Failed")
+		raise
+
+	_update_partition(partition, status="Completed", finished_at=now_datetime())
+	frappe.db.commit()
+	return {"histories": histories, "logs_created": logs_created}
+
+
+def remaining_windows(row):
+	"""Windows of a partition still to run: all of them, or those after the
+	day of its last checkpoint."""
+	start = getdate(row.checkpoint) + timedelta(days=1) if row.checkpoint else getdate(row.partition_from)
+	return iter_date_windows(start, row.partition_to)
+
+
+def _update_partition(partition, **values):
+	frappe.db.set_value(PARTITION_DOCTYPE, partition, values, update_modified=False)
@@ -0,0 +1,152 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Content-addressed storage for the heavy Stylus text fields.
+
+`description_html`, `imagens` and `imagem_capa` almost never change between
+syncs, so each distinct value is written once to Stylus Content Blob (named by
+its SHA-1) and history rows only carry the hash. Readers resolve hashes to
+text on demand."""
+
+import frappe
+from frappe.utils import cint, now
+from frappe.utils.html_utils import sanitize_html
+
+from itec_integrations.itec_integrations.stylus.ingest import BLOB_FIELDS, INGEST_CHUNK_SIZE
+from itec_integrations.itec_integrations.stylus.snapshots import content_digest
+from itec_integrations.itec_integrations.utils import bulk_upsert
+
+
+BLOB_DOCTYPE = "Stylus Content Blob"
+BLOB_INSERT_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"content_hash",
+	"byte_size",
+	"content",
+)
+
+
+class BlobStore:
+	"""Moves heavy text out of catalog rows into Stylus Content Blob. Hashes
+	already confirmed during this run are remembered, so an unchanged blob
+	costs neither a lookup nor a write after its first sighting."""
+
+	def __init__(self):
+		self.known = set()
+
+	def extract(self, rows):
+		pending = {}
+		for row in rows:
+			for text_field, hash_field in BLOB_FIELDS.items():
+				value = row.get(text_field)
+				digest = row.get(hash_field) or content_digest(value)
+				row[hash_field] = digest
+				row[text_field] = None
+				if digest and digest not in self.known and value is not None:
+					pending[digest] = value
+
+		if pending:
+			self._store(pending)
+		return rows
+
+	def _store(self, pending):
+		existing = set(
+			frappe.get_all(BLOB_DOCTYPE, filters={"name": ["in", list(pending)]}, pluck="name")
+		)
+		timestamp = now()
+		user = frappe.session.user
+		values = []
+		for digest, content in pending.items():
+			if digest in existing:
+				continue
+			content = str(content)
+			values.append(
+				(digest, timestamp, timestamp, user, user, 0, digest, len(content.encode("utf-8")), content)
+			)
+		if values:
+			frappe.db.bulk_insert(BLOB_DOCTYPE, BLOB_INSERT_FIELDS, values, ignore_duplicates=True)
+		self.known.update(pending)
+
+
+def resolve_blobs(hashes):
+	"""hash -> content for the given hashes, in one query."""
+	hashes = list({h for h in hashes if h})
+	if not hashes:
+		return {}
+	return dict(
+		frappe.get_all(
+			BLOB_DOCTYPE,
+			filters={"name": ["in", hashes]},
+			fields=["name", "content"],
+			as_list=True,
+		)
+	)
+
+
+def attach_content(rows):
+	"""Fill the text fields of `rows` from their blob hashes in place. Rows
+	written before blob storage keep their inline text."""
+	contents = resolve_blobs(
+		row.get(hash_field) for row in rows for hash_field in BLOB_FIELDS.values()
+	)
+	for row in rows:
+		for text_field, hash_field in BLOB_FIELDS.items():
+			digest = row.get(hash_field)
+			if digest:
+				row[text_field] = contents.get(digest)
+	return rows
+
+
+@frappe.whitelist()
+def get_content_blob(content_hash):
+	"""Blob content for display. Descriptions are supplier HTML, so event
+	handler attributes, scripts and unsafe URLs are stripped before the desk
+	renders them; JSON content passes through unchanged."""
+	frappe.has_permission(BLOB_DOCTYPE, "read", throw=True)
+	content = frappe.db.get_value(BLOB_DOCTYPE, content_hash, "content")
+	return sanitize_html(content) if content else content
+
+
+def migrate_legacy_blobs(batch_size=INGEST_CHUNK_SIZE):
+	"""Move inline text on history rows written before blob storage into
+	Stylus Content Blob, one batch per transaction.
+
+	bench --site <site> execute itec_integrations.itec_integrations.stylus.blobs.migrate_legacy_blobs
+	"""
+	batch_size = cint(batch_size) or INGEST_CHUNK_SIZE
+	store = BlobStore()
+	text_fields = list(BLOB_FIELDS)
+	hash_fields = list(BLOB_FIELDS.values())
+	migrated = 0
+
+	while True:
+		rows = frappe.db.sql(
+			f"""
+				SELECT `name`, {", ".join(f"`{fieldname}`" for fieldname in text_fields)}
+				FROM `tabStylus Stock History Item`
+				WHERE {" OR ".join(f"`{fieldname}` IS NOT NULL" for fieldname in text_fields)}
+				LIMIT %(limit)s
+			""",
+			{"limit": batch_size},
+			as_dict=True,
+		)
+		if not rows:
+			break
+
+		store.extract(rows)
+		bulk_upsert(
+			"Stylus Stock History Item",
+			["name"] + text_fields + hash_fields,
+			[[row.name] + [None] * len(text_fields) + [row[f] for f in hash_fields] for row in rows],
+			text_fields + hash_fields,
+		)
+		frappe.db.commit()
+		migrated += len(rows)
+
+	frappe.logger().info(f"Stylus blobs: migrated {migrated} history rows to content blobs")
+	return migrated
@@ -0,0 +1,116 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Redis cache for Stylus report and page results.
+
+Results are keyed by a namespace, the current data generation and a digest of
+the normalized filters. Anything that changes the stored Stylus data (a sync,
+a backfill, the same-day cleanup) bumps the generation, so older entries are
+never read again and simply age out. Entries carry a TTL and the number kept
+is capped, oldest first. Hits and misses are counted per namespace."""
+
+import hashlib
+import json
+import pickle
+import time
+
+import frappe
+from frappe.utils import cint, flt
+from frappe.utils.redis_wrapper import RedisWrapper
+
+
+CACHE_PREFIX = "stylus_results"
+GENERATION_KEY = f"{CACHE_PREFIX}:generation"
+INDEX_KEY = f"{CACHE_PREFIX}:index"
+STATS_KEY = f"{CACHE_PREFIX}:stats"
+RESULT_TTL = 6 * 60 * 60
+MAX_ENTRIES = 500
+MAX_ENTRY_BYTES = 8 * 1024 * 1024
+
+
+def normalize_filters(value):
+	"""Canonical form of a filter value: empty values dropped, strings
+	stripped, lists sorted, so equivalent requests share a key."""
+	if isinstance(value, dict):
+		normalized = {}
+		for key, item in value.items():
+			item = normalize_filters(item)
+			if item not in (None, "", [], {}):
+				normalized[key] = item
+		return normalized
+	if isinstance(value, (list, tuple, set)):
+		items = [normalize_filters(item) for item in value]
+		return sorted((item for item in items if item not in (None, "")), key=str)
+	if isinstance(value, str):
+		return value.strip()
+	return value
+
+
+def get_generation():
+	cache = frappe.cache()
+	return cint(cache.get(cache.make_key(GENERATION_KEY)))
+
+
+def bump_generation():
+	"""Invalidate every cached result. Call after the data change commits."""
+	cache = frappe.cache()
+	return cache.incr(cache.make_key(GENERATION_KEY))
+
+
+def cached_result(namespace, filters, compute):
+	"""Return the cached result of `compute()` for `filters`, computing and
+	storing it on a miss."""
+	cache = frappe.cache()
+	digest = hashlib.sha1(
+		json.dumps(normalize_filters(filters or {}), sort_keys=True, default=str).encode("utf-8")
+	).hexdigest()
+	key = cache.make_key(f"{CACHE_PREFIX}:{namespace}:{get_generation()}:{digest}")
+
+	payload = cache.get(key)
+	if payload is not None:
+		cache.hincrby(cache.make_key(STATS_KEY), f"{namespace}:hits", 1)
+		return pickle.loads(payload)
+
+	cache.hincrby(cache.make_key(STATS_KEY), f"{namespace}:misses", 1)
+	result = compute()
+	payload = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+	if len(payload) <= MAX_ENTRY_BYTES:
+		cache.set(key, payload, ex=RESULT_TTL)
+		_track(cache, key)
+	return result
+
+
+def _track(cache, key):
+	index = cache.make_key(INDEX_KEY)
+	cache.zadd(index, {key: time.time()})
+	overflow = cache.zcard(index) - MAX_ENTRIES
+	if overflow > 0:
+		evicted = [member for member, _score in cache.zpopmin(index, overflow)]
+		if evicted:
+			cache.delete(*evicted)
+
+
+@frappe.whitelist()
+def get_result_cache_stats():
+	"""Hit and miss counters per namespace, with the current generation and
+	number of tracked entries."""
+	frappe.only_for("System Manager")
+	cache = frappe.cache()
+	counters = {}
+	# The counters are raw integers written by HINCRBY; RedisWrapper.hgetall
+	# would prefix the key again and unpickle the values.
+	raw = super(RedisWrapper, cache).hgetall(cache.make_key(STATS_KEY)) or {}
+	for field, value in raw.items():
+		namespace, _sep, kind = frappe.safe_decode(field).rpartition(":")
+		counters.setdefault(namespace, {"hits": 0, "misses": 0})[kind] = cint(frappe.safe_decode(value))
+
+	for stats in counters.values():
+		total = stats["hits"] + stats["misses"]
+		stats["hit_rate"] = flt(stats["hits"] / total * 100, 1) if total else 0.0
+
+	return {
+		"generation": get_generation(),
+		"entries": cint(cache.zcard(cache.make_key(INDEX_KEY))),
+		"max_entries": MAX_ENTRIES,
+		"namespaces": counters,
+	}
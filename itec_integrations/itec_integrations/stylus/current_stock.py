@@ -0,0 +1,167 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Materialized latest state of the Stylus catalog.
+
+Stylus Current Stock holds one row per code (named by the code) with the values
+of the newest snapshot. Each sync upserts only the codes whose fingerprint
+changed and deletes the codes that disappeared, so "latest stock of X" is a
+primary-key lookup instead of a rebuild of the snapshot chain. The trigram
+search index is kept in step for changed codes; removed codes stay indexed
+with their last values, see stylus.search."""
+
+import frappe
+from frappe.utils import cint, now
+
+from itec_integrations.itec_integrations.stylus.ingest import BLOB_FIELDS, INGEST_CHUNK_SIZE
+from itec_integrations.itec_integrations.stylus.search import (
+	ensure_search_index,
+	index_rows,
+	rebuild_search_index,
+	search_key,
+)
+from itec_integrations.itec_integrations.stylus.snapshots import get_latest_history, get_state
+from itec_integrations.itec_integrations.utils import bulk_upsert
+
+
+CURRENT_STOCK_DOCTYPE = "Stylus Current Stock"
+CURRENT_FIELDS = (
+	"code",
+	"designation",
+	"price",
+	"stock",
+	"main_category",
+	"brand",
+	"row_hash",
+) + tuple(BLOB_FIELDS.values())
+CURRENT_INSERT_FIELDS = (
+	("name", "creation", "modified", "owner", "modified_by", "docstatus")
+	+ CURRENT_FIELDS
+	+ ("stock_history", "last_changed")
+)
+CURRENT_UPDATE_FIELDS = CURRENT_FIELDS + ("stock_history", "last_changed", "modified")
+
+
+class CurrentStockUpdater:
+	"""Applies the rows of one sync to Stylus Current Stock. `previous_index`
+	is the `code -> (row_hash, price, stock)` state the table is expected to hold."""
+
+	def __init__(self, history, previous_index):
+		self.history = history
+		self.previous_index = previous_index or {}
+		self.updated = 0
+
+	def apply(self, rows):
+		changed = [
+			row
+			for row in rows
+			if row.get("code")
+			and not row.get("is_removed")
+			and (self.previous_index.get(row["code"]) or (None,))[0] != row.get("row_hash")
+		]
+		self._reindex(changed)
+		upsert_current_rows(changed, self.history.name, self.history.creation)
+		self.updated += len(changed)
+
+	def remove(self, codes):
+		# The search index keeps removed codes for the pages listing them.
+		delete_current_rows(codes)
+
+	def _reindex(self, rows):
+		"""Refresh the search index for rows whose searchable values differ
+		from what the table holds; most changes only touch stock or price."""
+		if not rows:
+			return
+		indexed = {
+			row.code: search_key(row)
+			for row in frappe.get_all(
+				CURRENT_STOCK_DOCTYPE,
+				filters={"name": ["in", [row["code"] for row in rows]]},
+				fields=["name as code", "designation", "brand", "main_category"],
+				limit_page_length=0,
+			)
+		}
+		index_rows([row for row in rows if indexed.get(row["code"]) != search_key(row)])
+
+
+def upsert_current_rows(rows, stock_history, changed_at):
+	timestamp = now()
+	user = frappe.session.user
+	bulk_upsert(
+		CURRENT_STOCK_DOCTYPE,
+		CURRENT_INSERT_FIELDS,
+		[
+			(row["code"], timestamp, timestamp, user, user, 0)
+			+ tuple(row.get(fieldname) for fieldname in CURRENT_FIELDS)
+			+ (stock_history, changed_at)
+			for row in rows
+		],
+		CURRENT_UPDATE_FIELDS,
+	)
+
+
+def delete_current_rows(codes):
+	codes = list(codes)
+	for start in range(0, len(codes), INGEST_CHUNK_SIZE):
+		frappe.db.delete(CURRENT_STOCK_DOCTYPE, {"name": ["in", codes[start : start + INGEST_CHUNK_SIZE]]})
+
+
+def ensure_current_stock(history=None):
+	"""Seed the table from the snapshot chain the first time it is needed, so
+	incremental updates have a complete base to apply to."""
+	if frappe.db.count(CURRENT_STOCK_DOCTYPE):
+		ensure_search_index()
+		return
+	rebuild_current_stock(history)
+
+
+def rebuild_current_stock(history=None):
+	"""Replace the table with the state at `history` (default: the latest).
+	Usable from `bench execute` to repair drift."""
+	if not history:
+		latest = get_latest_history()
+		history = latest.name if latest else None
+	if not history:
+		return 0
+
+	creation = frappe.db.get_value("Stylus Stock History", history, "creation")
+	rows = get_state(history, fields=CURRENT_FIELDS)
+	frappe.db.delete(CURRENT_STOCK_DOCTYPE)
+	upsert_current_rows(rows, history, creation)
+	rebuild_search_index()
+	return len(rows)
+
+
+def repoint_history(old_names, new_name):
+	"""Move references to histories that are about to be deleted."""
+	if old_names:
+		frappe.db.sql(
+			f"""
+				UPDATE `tab{CURRENT_STOCK_DOCTYPE}`
+				SET `stock_history` = %(new)s
+				WHERE `stock_history` IN %(old)s
+			""",
+			{"new": new_name, "old": tuple(old_names)},
+		)
+
+
+@frappe.whitelist()
+def get_current_stock(codes=None, brand=None, main_category=None, limit=None):
+	"""Latest Stylus values per code, optionally narrowed to `codes`, a brand
+	or a main category."""
+	frappe.has_permission(CURRENT_STOCK_DOCTYPE, "read", throw=True)
+	codes = frappe.parse_json(codes) if isinstance(codes, str) else codes
+	filters = {}
+	if codes:
+		filters["name"] = ["in", list(codes)]
+	if brand:
+		filters["brand"] = brand
+	if main_category:
+		filters["main_category"] = main_category
+	return frappe.get_all(
+		CURRENT_STOCK_DOCTYPE,
+		filters=filters,
+		fields=list(CURRENT_FIELDS) + ["stock_history", "last_changed"],
+		order_by="name asc",
+		limit_page_length=cint(limit) or 0,
+	)
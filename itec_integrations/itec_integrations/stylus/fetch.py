@@ -0,0 +1,91 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Conditional download of the Stylus catalog.
+
+The request carries If-None-Match / If-Modified-Since from the previous sync.
+The body is spooled to a temporary file while a SHA-256 of it is computed,
+so an unchanged catalog can be recognised before anything is parsed or
+written, even when the endpoint ignores the conditional headers."""
+
+import hashlib
+from tempfile import SpooledTemporaryFile
+
+from itec_integrations.itec_integrations.stylus.ingest import READ_CHUNK_BYTES
+from itec_integrations.itec_integrations.utils import get_client
+
+
+STYLUS_STOCK_URL = "https://www.stylus.co.ao/encomendas/api/stockparceiros"
+REQUEST_TIMEOUT = (10, 300)
+# Payloads up to this size stay in memory; larger ones spill to disk.
+SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+NOT_MODIFIED = "Not Modified"
+UNCHANGED = "Unchanged"
+UPDATED = "Updated"
+
+
+class CatalogDownload:
+	"""Result of `download_catalog`. When not `not_modified`, `iter_chunks()`
+	replays the spooled body and `close()` releases it."""
+
+	def __init__(self, not_modified=False, etag=None, last_modified=None, digest=None, body=None):
+		self.not_modified = not_modified
+		self.etag = etag
+		self.last_modified = last_modified
+		self.digest = digest
+		self.body = body
+
+	def iter_chunks(self, size=READ_CHUNK_BYTES):
+		self.body.seek(0)
+		while True:
+			chunk = self.body.read(size)
+			if not chunk:
+				return
+			yield chunk
+
+	def close(self):
+		if self.body:
+			self.body.close()
+			self.body = None
+
+
+def conditional_headers(etag=None, last_modified=None):
+	headers = {}
+	if etag:
+		headers["If-None-Match"] = etag
+	if last_modified:
+		headers["If-Modified-Since"] = last_modified
+	return headers
+
+
+def download_catalog(url, headers, etag=None, last_modified=None, timeout=REQUEST_TIMEOUT):
+	"""GET `url` conditionally and spool the body while fingerprinting it."""
+	response = get_client("stylus", timeout=REQUEST_TIMEOUT).get(
+		url,
+		headers={**headers, **conditional_headers(etag, last_modified)},
+		stream=True,
+		timeout=timeout,
+	)
+	with response:
+		if response.status_code == 304:
+			return CatalogDownload(not_modified=True, etag=etag, last_modified=last_modified)
+		response.raise_for_status()
+
+		digest = hashlib.sha256()
+		body = SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+		try:
+			for chunk in response.iter_content(chunk_size=READ_CHUNK_BYTES):
+				if chunk:
+					digest.update(chunk)
+					body.write(chunk)
+		except Exception:
+			body.close()
+			raise
+
+		return CatalogDownload(
+			etag=response.headers.get("ETag"),
+			last_modified=response.headers.get("Last-Modified"),
+			digest=digest.hexdigest(),
+			body=body,
+		)
@@ -0,0 +1,220 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+import codecs
+import json
+
+import frappe
+from frappe.utils import flt, now
+
+from itec_integrations.itec_integrations.utils import bulk_upsert
+
+
+INGEST_CHUNK_SIZE = 1000
+READ_CHUNK_BYTES = 64 * 1024
+
+HISTORY_ITEM_DOCTYPE = "Stylus Stock History Item"
+HISTORY_ITEM_FIELDS = (
+	"code",
+	"designation",
+	"price",
+	"stock",
+	"main_category",
+	"brand",
+	"description_html",
+	"imagens",
+	"imagem_capa",
+)
+# Heavy text fields are stored once in Stylus Content Blob and referenced by
+# hash, see stylus.blobs.
+BLOB_FIELDS = {
+	"description_html": "description_hash",
+	"imagens": "imagens_hash",
+	"imagem_capa": "imagem_capa_hash",
+}
+# Snapshot bookkeeping columns, see stylus.snapshots.
+STORAGE_FIELDS = ("is_removed", "row_hash")
+INSERT_FIELDS = HISTORY_ITEM_FIELDS + tuple(BLOB_FIELDS.values()) + STORAGE_FIELDS
+# Values substituted for None in NOT NULL columns.
+INSERT_DEFAULTS = {"is_removed": 0}
+CHILD_META_FIELDS = (
+	"name",
+	"creation",
+	"modified",
+	"owner",
+	"modified_by",
+	"docstatus",
+	"parent",
+	"parentfield",
+	"parenttype",
+	"idx",
+)
+
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",]"
+
+
+def iter_json_array(chunks):
+	"""Yield the elements of a top-level JSON array from an iterable of byte
+	(or text) chunks without materialising the whole document."""
+	decoder = json.JSONDecoder()
+	utf8 = codecs.getincrementaldecoder("utf-8")()
+	chunks = iter(chunks)
+	buffer = ""
+	pos = 0
+	eof = False
+	started = False
+
+	def read_more():
+		nonlocal buffer, pos, eof
+		for chunk in chunks:
+			if not chunk:
+				continue
+			text = utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+			if text:
+				buffer = buffer[pos:] + text
+				pos = 0
+				return True
+		tail = utf8.decode(b"", final=True)
+		buffer = buffer[pos:] + tail
+		pos = 0
+		eof = True
+		return bool(tail)
+
+	# After "[" a value or "]" may follow, after a value "," or "]", and after
+	# "," only a value.
+	expect = "open"
+	while True:
+		while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+			pos += 1
+		if pos >= len(buffer):
+			if eof:
+				raise ValueError("Unexpected end of JSON stream")
+			read_more()
+			continue
+
+		char = buffer[pos]
+		if expect == "open":
+			if char != "[":
+				raise ValueError("Expected a JSON array")
+			expect = "first"
+			pos += 1
+			continue
+		if char == "]" and expect in ("first", "separator"):
+			return
+		if expect == "separator":
+			if char != ",":
+				raise ValueError(f"Expected ',' or ']' at offset {pos} of the JSON array")
+			expect = "value"
+			pos += 1
+			continue
+		if char in ",]":
+			raise ValueError(f"Expected a value at offset {pos} of the JSON array")
+
+		try:
+			value, end = decoder.raw_decode(buffer, pos)
+		except json.JSONDecodeError:
+			if eof:
+				raise
+			read_more()
+			continue
+
+		# A value not followed by a delimiter yet may still be truncated
+		# (e.g. "12." of a number split across chunks); wait for more input.
+		if not eof and (end >= len(buffer) or buffer[end] not in _DELIMITERS):
+			read_more()
+			continue
+
+		pos = end
+		expect = "separator"
+		yield value
+
+
+def iter_stylus_items(chunks):
+	"""Parse the `stockparceiros` payload from an iterable of byte chunks and
+	yield rows ready for `Stylus Stock History Item`."""
+	for item in iter_json_array(chunks):
+		if not isinstance(item, dict):
+			frappe.throw("Unexpected response format from Stylus API")
+		yield normalize_item(item)
+
+
+def normalize_item(item):
+	return {
+		"code": item.get("CODE"),
+		"designation": item.get("DESIGNATION"),
+		"price": flt(item.get("PRICE")),
+		"stock": flt(item.get("STOCK")),
+		"main_category": item.get("CATEGORIA_PRINCIPAL"),
+		"brand": item.get("MARCA"),
+		"description_html": item.get("DESCRICAO"),
+		"imagens": item.get("IMAGENS"),
+		"imagem_capa": item.get("IMAGEM_CAPA"),
+	}
+
+
+def insert_history_items(history, rows, start_idx=0):
+	"""Write a chunk of rows under `history` with a single multi-row INSERT.
+
+	Child rows inherit the parent's `creation` so readers filtering on the
+	item timestamp keep seeing the same values the ORM used to write.
+	Returns the idx of the last row written."""
+	if not rows:
+		return start_idx
+
+	values = []
+	idx = start_idx
+	for row in rows:
+		idx += 1
+		values.append(_child_values(history, row, frappe.generate_hash(length=10), idx, history.modified))
+
+	frappe.db.bulk_insert(HISTORY_ITEM_DOCTYPE, CHILD_META_FIELDS + INSERT_FIELDS, values)
+	return idx
+
+
+def upsert_history_items(history, rows, existing_names, start_idx=0):
+	"""Overwrite the rows of `history` for codes it already holds and append
+	the rest, in one statement per chunk. `existing_names` maps code -> item
+	name and is updated with the appended rows. Returns the last idx used."""
+	if not rows:
+		return start_idx
+
+	modified = now()
+	values = []
+	idx = start_idx
+	for row in rows:
+		name = existing_names.get(row.get("code"))
+		if not name:
+			idx += 1
+			name = frappe.generate_hash(length=10)
+			if row.get("code"):
+				existing_names[row.get("code")] = name
+		values.append(_child_values(history, row, name, idx, modified))
+
+	bulk_upsert(
+		HISTORY_ITEM_DOCTYPE,
+		CHILD_META_FIELDS + INSERT_FIELDS,
+		values,
+		INSERT_FIELDS + ("modified",),
+	)
+	return idx
+
+
+def _child_values(history, row, name, idx, modified):
+	return (
+		name,
+		history.creation,
+		modified,
+		history.owner,
+		history.owner,
+		0,
+		history.name,
+		"items",
+		"Stylus Stock History",
+		idx,
+	) + tuple(_insert_value(row, fieldname) for fieldname in INSERT_FIELDS)
+
+
+def _insert_value(row, fieldname):
+	value = row.get(fieldname)
+	return INSERT_DEFAULTS.get(fieldname) if value is None else value
@@ -0,0 +1,263 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Bulk price change detection for Stylus syncs.
+
+Changes are computed chunk by chunk as the catalog streams in, by joining the
+incoming rows against the previous state's `code -> price` map, and written to
+Stylus Price Change Log with multi-row INSERTs."""
+
+import frappe
+from frappe.utils import cint, flt, now
+
+
+LOG_DOCTYPE = "Stylus Price Change Log"
+LOG_BATCH_SIZE = 1000
+# `format:SPC-{#####}` autonames draw their counter from the unnamed ("")
+# series in tabSeries; names are reserved from it in blocks.
+LOG_SERIES_KEY = ""
+LOG_NAME_PREFIX = "SPC-"
+LOG_NAME_DIGITS = 5
+LOG_FIELDS = (
+	"code",
+	"designation",
+	"main_category",
+	"brand",
+	"stock_history",
+	"previous_stock_history",
+	"sync_datetime",
+	"old_price",
+	"new_price",
+	"change_amount",
+	"change_pct",
+	"direction",
+)
+LOG_INSERT_FIELDS = ("name", "creation", "modified", "owner", "modified_by", "docstatus") + LOG_FIELDS
+
+
+def compute_price_changes(previous_prices, rows, stock_history, previous_stock_history, sync_datetime):
+	"""Return a change record for every row whose price differs from
+	`previous_prices[code]`. Codes absent from the previous state are new and
+	produce no change."""
+	changes = []
+	for row in rows:
+		code = row.get("code")
+		if not code or row.get("is_removed"):
+			continue
+		old_price = previous_prices.get(code)
+		if old_price is None:
+			continue
+
+		old_price = flt(old_price)
+		new_price = flt(row.get("price"))
+		if old_price == new_price:
+			continue
+
+		change_amount = new_price - old_price
+		changes.append(
+			{
+				"code": code,
+				"designation": row.get("designation"),
+				"main_category": row.get("main_category"),
+				"brand": row.get("brand"),
+				"stock_history": stock_history,
+				"previous_stock_history": previous_stock_history,
+				"sync_datetime": sync_datetime,
+				"old_price": old_price,
+				"new_price": new_price,
+				"change_amount": change_amount,
+				"change_pct": (change_amount / old_price * 100.0) if old_price else 0.0,
+				"direction": "Increase" if change_amount > 0 else "Decrease",
+			}
+		)
+	return changes
+
+
+def insert_price_change_logs(changes, ignore_duplicates=False, merge_duplicates=False):
+	"""Write `changes` with one multi-row INSERT per batch. Returns the names
+	reserved for them; with `ignore_duplicates` some of those may not have
+	been written.
+
+	With `merge_duplicates` a change for a (stock_history, code) pair that is
+	already logged moves that log's new price instead, keeping its original
+	old price, so repeated changes within one snapshot net out."""
+	if not changes:
+		return []
+
+	names = reserve_log_names(len(changes))
+	timestamp = now()
+	user = frappe.session.user
+	values = [
+		(name, timestamp, timestamp, user, user, 0) + tuple(change.get(f) for f in LOG_FIELDS)
+		for name, change in zip(names, changes)
+	]
+	for start in range(0, len(values), LOG_BATCH_SIZE):
+		batch = values[start : start + LOG_BATCH_SIZE]
+		if merge_duplicates:
+			_merge_logs(batch)
+		else:
+			frappe.db.bulk_insert(
+				LOG_DOCTYPE, LOG_INSERT_FIELDS, batch, ignore_duplicates=ignore_duplicates
+			)
+	return names
+
+
+def _merge_logs(values):
+	columns = ", ".join(f"`{fieldname}`" for fieldname in LOG_INSERT_FIELDS)
+	placeholder = "(" + ", ".join(["%s"] * len(LOG_INSERT_FIELDS)) + ")"
+	frappe.db.sql(
+		f"""
+			INSERT INTO `tab{LOG_DOCTYPE}` ({columns})
+			VALUES {", ".join([placeholder] * len(values))}
+			ON DUPLICATE KEY UPDATE
+				`new_price` = VALUES(`new_price`),
+				`change_amount` = VALUES(`new_price`) - `old_price`,
+				`change_pct` = IF(`old_price` != 0, (VALUES(`new_price`) - `old_price`) / `old_price` * 100, 0),
+				`direction` = IF(VALUES(`new_price`) > `old_price`, 'Increase', 'Decrease'),
+				`sync_datetime` = VALUES(`sync_datetime`),
+				`modified` = VALUES(`modified`)
+		""",
+		tuple(value for row in values for value in row),
+	)
+
+
+def drop_reverted_logs(stock_history, previous_prices, rows):
+	"""Remove the logs of `stock_history` for `rows` whose price is back at
+	`previous_prices[code]`, i.e. whose merged change netted out to zero."""
+	codes = [
+		row.get("code")
+		for row in rows
+		if row.get("code")
+		and not row.get("is_removed")
+		and previous_prices.get(row.get("code")) is not None
+		and flt(previous_prices[row.get("code")]) == flt(row.get("price"))
+	]
+	for start in range(0, len(codes), LOG_BATCH_SIZE):
+		frappe.db.delete(
+			LOG_DOCTYPE,
+			{"stock_history": stock_history, "code": ["in", codes[start : start + LOG_BATCH_SIZE]]},
+		)
+
+
+def repoint_logs(keep, remove_names):
+	"""Move log links off histories that are about to be merged into `keep`.
+
+	Per code, the latest log of the removed histories takes `keep` as its
+	history unless `keep` already has one; the others keep their prices and
+	sync time but lose the link, since (stock_history, code) is unique.
+	Previous-history links to a removed history point at `keep` instead,
+	unless the log itself now belongs to `keep`."""
+	if not remove_names:
+		return
+	# Rewritten logs get a new `modified` so incremental readers such as the
+	# archive export pick them up again.
+	params = {"keep": keep, "removed": tuple(remove_names), "modified": now()}
+
+	frappe.db.sql(
+		f"""
+			UPDATE `tab{LOG_DOCTYPE}`
+			SET `previous_stock_history` = IF(
+				`stock_history` = %(keep)s OR `stock_history` IN %(removed)s, NULL, %(keep)s
+			), `modified` = %(modified)s
+			WHERE `previous_stock_history` IN %(removed)s
+		""",
+		params,
+	)
+
+	to_keep = frappe.db.sql_list(
+		f"""
+			SELECT `name`
+			FROM (
+				SELECT
+					`name`,
+					`code`,
+					ROW_NUMBER() OVER (PARTITION BY `code` ORDER BY `sync_datetime` DESC, `creation` DESC) AS `rn`
+				FROM `tab{LOG_DOCTYPE}`
+				WHERE `stock_history` IN %(removed)s
+			) `latest`
+			WHERE `rn` = 1
+				AND `code` NOT IN (
+					SELECT `code`
+					FROM `tab{LOG_DOCTYPE}`
+					WHERE `stock_history` = %(keep)s
+						AND `code` IS NOT NULL
+				)
+		""",
+		params,
+	)
+	for start in range(0, len(to_keep), LOG_BATCH_SIZE):
+		frappe.db.sql(
+			f"""
+				UPDATE `tab{LOG_DOCTYPE}`
+				SET `stock_history` = %(keep)s, `modified` = %(modified)s
+				WHERE `name` IN %(names)s
+			""",
+			{**params, "names": tuple(to_keep[start : start + LOG_BATCH_SIZE])},
+		)
+
+	frappe.db.sql(
+		f"""
+			UPDATE `tab{LOG_DOCTYPE}`
+			SET `stock_history` = NULL, `modified` = %(modified)s
+			WHERE `stock_history` IN %(removed)s
+		""",
+		params,
+	)
+
+
+def reserve_log_names(count):
+	"""Reserve `count` consecutive names from the log's naming series with a
+	single counter update instead of one per document."""
+	current = frappe.db.sql(
+		"SELECT `current` FROM `tabSeries` WHERE `name` = %s FOR UPDATE", (LOG_SERIES_KEY,)
+	)
+	if current:
+		start = cint(current[0][0])
+		frappe.db.sql(
+			"UPDATE `tabSeries` SET `current` = %s WHERE `name` = %s",
+			(start + count, LOG_SERIES_KEY),
+		)
+	else:
+		start = 0
+		frappe.db.sql(
+			"INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)", (LOG_SERIES_KEY, count)
+		)
+
+	return [
+		f"{LOG_NAME_PREFIX}{number:0{LOG_NAME_DIGITS}d}" for number in range(start + 1, start + count + 1)
+	]
+
+
+class PriceChangeRecorder:
+	"""Collects price changes while a sync streams in and flushes them in
+	batches, so the cost scales with the number of changes."""
+
+	def __init__(self, history_doc, previous_name, previous_prices, merge_duplicates=False):
+		self.history_doc = history_doc
+		self.previous_name = previous_name
+		self.previous_prices = previous_prices or {}
+		self.merge_duplicates = merge_duplicates
+		self.pending = []
+		self.logs_created = 0
+
+	def collect(self, rows):
+		if not self.previous_prices:
+			return
+		self.pending.extend(
+			compute_price_changes(
+				self.previous_prices,
+				rows,
+				self.history_doc.name,
+				self.previous_name,
+				self.history_doc.creation or now(),
+			)
+		)
+		if len(self.pending) >= LOG_BATCH_SIZE:
+			self.flush()
+
+	def flush(self):
+		if self.pending:
+			insert_price_change_logs(self.pending, merge_duplicates=self.merge_duplicates)
+			self.logs_created += len(self.pending)
+			self.pending = []
+		return self.logs_created
@@ -0,0 +1,181 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Per-day price change counters over Stylus Price Change Log.
+
+Stylus Price Change Stat holds, per day and per brand, main category and
+code, the number of changes, increases and decreases and the sums of
+change_pct, |change_pct| and change_amount, named
+"<dimension>|<value>|<day>". Whenever logs are written, the days they fall
+on are recomputed from the log with one GROUP BY per dimension, so merged or
+dropped same-day logs and re-run backfills never double count. The analytics
+API only reads these rows: its cost depends on the number of days asked for,
+not on the size of the log."""
+
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe.utils import cint, flt, getdate, now
+
+from itec_integrations.itec_integrations.stylus.price_changes import LOG_DOCTYPE
+
+
+STATS_DOCTYPE = "Stylus Price Change Stat"
+DIMENSIONS = ("brand", "main_category", "code")
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 500
+ORDER_FIELDS = {
+	"changes": "SUM(`change_count`)",
+	"increases": "SUM(`increase_count`)",
+	"decreases": "SUM(`decrease_count`)",
+	"abs_change_pct": "SUM(`sum_abs_change_pct`)",
+	"avg_change_pct": "SUM(`sum_change_pct`) / SUM(`change_count`)",
+	"change_amount": "SUM(`sum_change_amount`)",
+}
+
+
+def refresh_price_change_stats(days):
+	"""Recompute the stats of `days` from the price change log."""
+	days = sorted({getdate(day) for day in days if day})
+	if not days:
+		return
+
+	frappe.db.delete(STATS_DOCTYPE, {"day": ["in", days]})
+	timestamp = now()
+	user = frappe.session.user
+	for day in days:
+		params = {
+			"start": datetime.combine(day, time.min),
+			"end": datetime.combine(day + timedelta(days=1), time.min),
+			"day": day,
+			"timestamp": timestamp,
+			"user": user,
+		}
+		for dimension in DIMENSIONS:
+			attributes = (
+				"MAX(`brand`), MAX(`main_category`)" if dimension == "code" else "NULL, NULL"
+			)
+			frappe.db.sql(
+				f"""
+					INSERT INTO `tab{STATS_DOCTYPE}` (
+						`name`, `creation`, `modified`, `owner`, `modified_by`, `docstatus`,
+						`dimension`, `dimension_value`, `day`, `brand`, `main_category`,
+						`change_count`, `increase_count`, `decrease_count`,
+						`sum_change_pct`, `sum_abs_change_pct`, `sum_change_amount`
+					)
+					SELECT
+						CONCAT('{dimension}|', IFNULL(`{dimension}`, ''), '|', %(day)s),
+						%(timestamp)s, %(timestamp)s, %(user)s, %(user)s, 0,
+						'{dimension}', IFNULL(`{dimension}`, ''), %(day)s, {attributes},
+						COUNT(*),
+						SUM(`direction` = 'Increase'),
+						SUM(`direction` = 'Decrease'),
+						SUM(`change_pct`),
+						SUM(ABS(`change_pct`)),
+						SUM(`change_amount`)
+					FROM `tab{LOG_DOCTYPE}`
+					WHERE `sync_datetime` >= %(start)s AND `sync_datetime` < %(end)s
+					GROUP BY IFNULL(`{dimension}`, '')
+				""",
+				params,
+			)
+
+
+def rebuild_price_change_stats(from_date=None, to_date=None):
+	"""Recompute the stats of every day in [from_date, to_date] (default: the
+	whole log). Usable from `bench execute`."""
+	bounds = frappe.db.sql(f"SELECT MIN(`sync_datetime`), MAX(`sync_datetime`) FROM `tab{LOG_DOCTYPE}`")
+	first, last = bounds[0] if bounds else (None, None)
+	if not (from_date or first) or not (to_date or last):
+		return 0
+	from_date = getdate(from_date or first)
+	to_date = getdate(to_date or last)
+
+	day = from_date
+	count = 0
+	while day <= to_date:
+		refresh_price_change_stats([day])
+		frappe.db.commit()
+		day += timedelta(days=1)
+		count += 1
+	return count
+
+
+def _read_stats(
+	dimension, from_date, to_date, filters=None, min_changes=None, order_by="abs_change_pct", limit=None
+):
+	if dimension not in DIMENSIONS:
+		frappe.throw(f"Dimension must be one of {', '.join(DIMENSIONS)}")
+	frappe.has_permission(LOG_DOCTYPE, "read", throw=True)
+
+	conditions = ["`dimension` = %(dimension)s", "`day` BETWEEN %(from_date)s AND %(to_date)s"]
+	params = {
+		"dimension": dimension,
+		"from_date": getdate(from_date),
+		"to_date": getdate(to_date),
+		"limit": min(cint(limit) or DEFAULT_LIMIT, MAX_LIMIT),
+		"min_changes": cint(min_changes),
+	}
+	for fieldname, value in (filters or {}).items():
+		if value:
+			conditions.append(f"`{fieldname}` = %({fieldname})s")
+			params[fieldname] = value
+
+	order = ORDER_FIELDS.get(order_by) or ORDER_FIELDS["abs_change_pct"]
+	rows = frappe.db.sql(
+		f"""
+			SELECT
+				`dimension_value` AS `value`,
+				MAX(`brand`) AS `brand`,
+				MAX(`main_category`) AS `main_category`,
+				SUM(`change_count`) AS `change_count`,
+				SUM(`increase_count`) AS `increase_count`,
+				SUM(`decrease_count`) AS `decrease_count`,
+				SUM(`sum_change_pct`) AS `sum_change_pct`,
+				SUM(`sum_abs_change_pct`) AS `sum_abs_change_pct`,
+				SUM(`sum_change_amount`) AS `sum_change_amount`
+			FROM `tab{STATS_DOCTYPE}`
+			WHERE {" AND ".join(conditions)}
+			GROUP BY `dimension_value`
+			HAVING SUM(`change_count`) >= %(min_changes)s
+			ORDER BY {order} DESC
+			LIMIT %(limit)s
+		""",
+		params,
+		as_dict=True,
+	)
+	for row in rows:
+		row["avg_change_pct"] = flt(row.sum_change_pct / row.change_count, 3) if row.change_count else 0.0
+	return rows
+
+
+@frappe.whitelist()
+def get_top_movers(
+	from_date, to_date, dimension="code", brand=None, main_category=None, order_by="abs_change_pct", limit=DEFAULT_LIMIT
+):
+	"""Brands, categories or codes with the most repricing in the range.
+	`brand` and `main_category` narrow code rows, e.g. top codes of a brand."""
+	filters = {"brand": brand, "main_category": main_category} if dimension == "code" else None
+	return _read_stats(dimension, from_date, to_date, filters=filters, order_by=order_by, limit=limit)
+
+
+@frappe.whitelist()
+def get_repricing_summary(from_date, to_date, dimension="main_category", limit=MAX_LIMIT):
+	"""Change counts and average change % per brand or main category."""
+	return _read_stats(dimension, from_date, to_date, order_by="changes", limit=limit)
+
+
+@frappe.whitelist()
+def get_frequent_repricings(
+	from_date, to_date, min_changes=2, brand=None, main_category=None, limit=DEFAULT_LIMIT
+):
+	"""Codes repriced at least `min_changes` times in the range."""
+	return _read_stats(
+		"code",
+		from_date,
+		to_date,
+		filters={"brand": brand, "main_category": main_category},
+		min_changes=min_changes,
+		order_by="changes",
+		limit=limit,
+	)
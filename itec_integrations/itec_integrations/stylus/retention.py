@@ -0,0 +1,154 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Tiered retention for Stylus Stock History.
+
+Histories newer than the full-detail window are kept as synced. Older ones are
+collapsed to the last history of each day, and past the daily window to the
+last history of each ISO week. Collapsing folds the removed snapshots into the
+survivor, so the state at every survivor is unchanged, and moves every link
+(current stock, series points, price change logs) onto it before the removed
+rows are deleted in bounded batches. Per-code change events stay in Stylus
+Stock Series, Stylus Stock Daily and Stylus Price Change Log, which are never
+downsampled."""
+
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+import frappe
+from frappe.utils import add_days, cint, get_datetime, getdate, now
+
+from itec_integrations.itec_integrations.stylus.cache import bump_generation
+from itec_integrations.itec_integrations.stylus.current_stock import repoint_history
+from itec_integrations.itec_integrations.stylus.price_changes import repoint_logs
+from itec_integrations.itec_integrations.stylus.series import repoint_history as repoint_series_history
+from itec_integrations.itec_integrations.stylus.snapshots import fold_histories
+
+
+DEFAULT_FULL_DAYS = 30
+DEFAULT_DAILY_DAYS = 180
+DEFAULT_DELETE_BATCH_SIZE = 5000
+MAX_GROUPS_PER_RUN = 200
+
+
+def collapse_histories(keep, remove_names, batch_size=DEFAULT_DELETE_BATCH_SIZE, commit=False):
+	"""Merge `remove_names` into `keep`, the latest history of their group,
+	and delete them. With `commit`, every delete batch is committed."""
+	if not remove_names:
+		return 0
+
+	# Delta snapshots only make sense on top of the ones before them, so
+	# carry anything the removed histories recorded into the survivor first.
+	fold_histories(keep, remove_names)
+	repoint_history(remove_names, keep)
+	repoint_series_history(remove_names, keep)
+	repoint_logs(keep, remove_names)
+	if commit:
+		frappe.db.commit()
+
+	# Everything left on the removed histories is superseded by the survivor,
+	# so it can go in as many transactions as it takes.
+	deleted = 0
+	while True:
+		names = frappe.db.sql_list(
+			"""
+				SELECT `name`
+				FROM `tabStylus Stock History Item`
+				WHERE `parent` IN %(removed)s
+				LIMIT %(limit)s
+			""",
+			{"removed": tuple(remove_names), "limit": batch_size},
+		)
+		if not names:
+			break
+		frappe.db.delete("Stylus Stock History Item", {"name": ["in", names]})
+		deleted += len(names)
+		if commit:
+			frappe.db.commit()
+
+	frappe.db.delete("Stylus Stock History", {"name": ["in", remove_names]})
+	if commit:
+		frappe.db.commit()
+	return deleted
+
+
+def plan_retention(full_days=DEFAULT_FULL_DAYS, daily_days=DEFAULT_DAILY_DAYS, today=None):
+	"""Yield (keep, remove_names) for every day older than the full-detail
+	window and every week older than the daily window that holds more than
+	one history."""
+	today = getdate(today)
+	full_before = datetime.combine(add_days(today, -cint(full_days)), time.min)
+	# Start weekly groups on a Monday so a week is never split between tiers.
+	daily_start = getdate(add_days(today, -max(cint(daily_days), cint(full_days))))
+	daily_before = datetime.combine(daily_start - timedelta(days=daily_start.weekday()), time.min)
+
+	groups = OrderedDict()
+	for row in frappe.db.sql(
+		"""
+			SELECT `name`, `creation`
+			FROM `tabStylus Stock History`
+			WHERE `creation` < %(before)s
+			ORDER BY `creation` ASC
+		""",
+		{"before": full_before},
+		as_dict=True,
+	):
+		day = getdate(row.creation)
+		if get_datetime(row.creation) < daily_before:
+			key = ("week", day - timedelta(days=day.weekday()))
+		else:
+			key = ("day", day)
+		groups.setdefault(key, []).append(row.name)
+
+	for names in groups.values():
+		if len(names) > 1:
+			yield names[-1], names[:-1]
+
+
+def apply_retention(
+	full_days=DEFAULT_FULL_DAYS,
+	daily_days=DEFAULT_DAILY_DAYS,
+	batch_size=DEFAULT_DELETE_BATCH_SIZE,
+	max_groups=MAX_GROUPS_PER_RUN,
+):
+	"""Collapse up to `max_groups` day or week groups, committing as it goes.
+	Whatever is left is picked up by the next run."""
+	groups = histories = items = 0
+	for keep, remove_names in plan_retention(full_days, daily_days):
+		if groups >= max_groups:
+			break
+		items += collapse_histories(keep, remove_names, batch_size=batch_size, commit=True)
+		histories += len(remove_names)
+		groups += 1
+
+	if groups:
+		bump_generation()
+	return {"groups": groups, "histories": histories, "items": items}
+
+
+def run_scheduled_retention():
+	"""Daily scheduler entry point; does nothing unless retention is enabled
+	in Stylus Sync Stock Setting."""
+	setting = frappe.get_single("Stylus Sync Stock Setting")
+	if not setting.retention_enabled:
+		return
+
+	result = apply_retention(
+		full_days=cint(setting.retention_full_days) or DEFAULT_FULL_DAYS,
+		daily_days=cint(setting.retention_daily_days) or DEFAULT_DAILY_DAYS,
+		batch_size=cint(setting.retention_batch_size) or DEFAULT_DELETE_BATCH_SIZE,
+	)
+	frappe.db.set_value(
+		"Stylus Sync Stock Setting",
+		"Stylus Sync Stock Setting",
+		{
+			"last_retention_run": now(),
+			"last_retention_result": (
+				f"{result['groups']} groups, {result['histories']} histories, "
+				f"{result['items']} items removed"
+			),
+		},
+		update_modified=False,
+	)
+	frappe.db.commit()
+	return result
@@ -0,0 +1,238 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Daily rollup of Stylus stock per code.
+
+Stylus Stock Daily holds, for every code and day on which its stock or price
+changed, the opening, closing, minimum and maximum stock, the movement (sum of
+absolute stock changes) and the last price, named "<code>@<day>". Days
+without a row carry the previous close forward. Rows are updated from the
+series points written at ingest and can be rebuilt from Stylus Stock Series
+for any date range."""
+
+from itertools import groupby
+
+import frappe
+from frappe.utils import flt, get_datetime, getdate, now
+
+from itec_integrations.itec_integrations.stylus.backfill import iter_date_windows
+from itec_integrations.itec_integrations.stylus.cache import bump_generation
+from itec_integrations.itec_integrations.stylus.series import (
+	SERIES_DOCTYPE,
+	backfill_series_window,
+	get_series,
+	get_values_at,
+)
+from itec_integrations.itec_integrations.utils import bulk_upsert, chunked
+
+
+ROLLUP_DOCTYPE = "Stylus Stock Daily"
+ROLLUP_FIELDS = (
+	"code",
+	"day",
+	"open_stock",
+	"close_stock",
+	"min_stock",
+	"max_stock",
+	"movement",
+	"last_price",
+	"is_removed",
+)
+ROLLUP_INSERT_FIELDS = ("name", "creation", "modified", "owner", "modified_by", "docstatus") + ROLLUP_FIELDS
+HISTORY_BACKFILL_LOCK_KEY = "stylus_series:history_backfill_lock"
+HISTORY_BACKFILL_TIMEOUT = 4 * 60 * 60
+
+
+def rollup_name(code, day):
+	return f"{code}@{getdate(day).isoformat()}"
+
+
+class DailyRollupWriter:
+	"""Folds the series points of one sync into their day's rollup row.
+	`previous_index` is the `code -> (row_hash, price, stock)` state before
+	the sync and supplies the opening stock of a day's first change."""
+
+	def __init__(self, previous_index):
+		self.previous_index = previous_index or {}
+
+	def apply(self, points):
+		rows = []
+		for point in points:
+			previous = self.previous_index.get(point["code"])
+			opening = previous[2] if previous else flt(point["stock"])
+			# A removal keeps the last stock so it does not drag the day's
+			# minimum to zero; the flag hides the code from then on. A new
+			# code has no earlier stock to move from.
+			stock = opening if point.get("is_removed") else flt(point["stock"])
+			rows.append(
+				{
+					"code": point["code"],
+					"day": getdate(point["ts"]),
+					"open_stock": opening,
+					"close_stock": stock,
+					"min_stock": min(opening, stock),
+					"max_stock": max(opening, stock),
+					"movement": abs(stock - opening),
+					"last_price": point["price"],
+					"is_removed": point.get("is_removed") or 0,
+				}
+			)
+		_merge_rows(rows)
+
+
+def _merge_rows(rows):
+	"""Insert new day rows; for existing ones keep the opening stock, fold
+	the new close into min and max and add to the movement."""
+	if not rows:
+		return
+
+	timestamp = now()
+	user = frappe.session.user
+	columns = ", ".join(f"`{fieldname}`" for fieldname in ROLLUP_INSERT_FIELDS)
+	placeholder = "(" + ", ".join(["%s"] * len(ROLLUP_INSERT_FIELDS)) + ")"
+	for chunk in chunked(rows):
+		frappe.db.sql(
+			f"""
+				INSERT INTO `tab{ROLLUP_DOCTYPE}` ({columns})
+				VALUES {", ".join([placeholder] * len(chunk))}
+				ON DUPLICATE KEY UPDATE
+					`min_stock` = LEAST(`min_stock`, VALUES(`close_stock`)),
+					`max_stock` = GREATEST(`max_stock`, VALUES(`close_stock`)),
+					`movement` = `movement` + VALUES(`movement`),
+					`close_stock` = VALUES(`close_stock`),
+					`last_price` = VALUES(`last_price`),
+					`is_removed` = VALUES(`is_removed`),
+					`modified` = VALUES(`modified`)
+			""",
+			tuple(
+				value
+				for row in chunk
+				for value in (rollup_name(row["code"], row["day"]), timestamp, timestamp, user, user, 0)
+				+ tuple(row[fieldname] for fieldname in ROLLUP_FIELDS)
+			),
+		)
+
+
+def backfill_daily_rollup(from_date, to_date):
+	"""Rebuild the rollup rows of [from_date, to_date] from Stylus Stock
+	Series, one date window at a time. Run with `bench execute` after the
+	series backfill."""
+	rows = 0
+	for start, end in iter_date_windows(from_date, to_date):
+		rows += rebuild_rollup_window(start, end)
+		frappe.db.commit()
+		bump_generation()
+	return rows
+
+
+def get_history_backfill_range():
+	"""(from_date, to_date) of the stored history that Stylus Stock Series or
+	Stylus Stock Daily do not cover yet, or None. Every code gets a point and
+	a day row at its first stored row, so complete tables start with the
+	oldest item row."""
+	first_item = frappe.db.sql("SELECT MIN(`creation`) FROM `tabStylus Stock History Item`")[0][0]
+	if not first_item:
+		return None
+	first_point = frappe.db.sql(f"SELECT MIN(`ts`) FROM `tab{SERIES_DOCTYPE}`")[0][0]
+	first_day = frappe.db.sql(f"SELECT MIN(`day`) FROM `tab{ROLLUP_DOCTYPE}`")[0][0]
+	if not first_point or not first_day:
+		return getdate(first_item), getdate()
+	if get_datetime(first_point) <= get_datetime(first_item) and getdate(first_day) <= getdate(first_item):
+		return None
+	return getdate(first_item), max(getdate(first_point), getdate(first_day))
+
+
+def ensure_history_backfill():
+	"""Queue the series and rollup backfill of the history they do not cover,
+	e.g. on the first sync after upgrading or after an interrupted backfill.
+	At most one run is queued at a time."""
+	backfill_range = get_history_backfill_range()
+	if not backfill_range:
+		return False
+	cache = frappe.cache()
+	if not cache.set(cache.make_key(HISTORY_BACKFILL_LOCK_KEY), 1, ex=HISTORY_BACKFILL_TIMEOUT, nx=True):
+		return False
+	frappe.enqueue(
+		"itec_integrations.itec_integrations.stylus.rollup.backfill_history",
+		queue="long",
+		timeout=HISTORY_BACKFILL_TIMEOUT,
+		enqueue_after_commit=True,
+		from_date=backfill_range[0],
+		to_date=backfill_range[1],
+	)
+	return True
+
+
+def backfill_history(from_date, to_date):
+	"""Backfill the series and then the rollup over [from_date, to_date].
+	Windows run newest first, so an interrupted run leaves the oldest days
+	uncovered and the next sync queues them again."""
+	cache = frappe.cache()
+	windows = list(iter_date_windows(from_date, to_date))
+	points = rows = 0
+	try:
+		for start, end in reversed(windows):
+			points += backfill_series_window(start, end)
+			frappe.db.commit()
+		# Rollup windows read their opening stock from the completed series.
+		for start, end in reversed(windows):
+			rows += rebuild_rollup_window(start, end)
+			frappe.db.commit()
+		bump_generation()
+	finally:
+		cache.delete(cache.make_key(HISTORY_BACKFILL_LOCK_KEY))
+	return points, rows
+
+
+def rebuild_rollup_window(start, end):
+	opening = get_values_at(None, start, include_removed=True, before=True)
+	timestamp = now()
+	user = frappe.session.user
+	values = []
+	for code, points in get_series(None, start, end).items():
+		previous = opening.get(code)
+		stock = flt(previous.stock) if previous and not previous.is_removed else None
+		for day, day_points in groupby(points, key=lambda point: get_datetime(point.ts).date()):
+			day_points = list(day_points)
+			open_stock = stock if stock is not None else flt(day_points[0].stock)
+			stocks = [open_stock]
+			movement = 0.0
+			for point in day_points:
+				if not point.is_removed:
+					if stock is not None:
+						movement += abs(flt(point.stock) - stock)
+					stock = flt(point.stock)
+					stocks.append(stock)
+			last = day_points[-1]
+			values.append(
+				(rollup_name(code, day), timestamp, timestamp, user, user, 0)
+				+ (
+					code,
+					day,
+					open_stock,
+					stock if stock is not None else open_stock,
+					min(stocks),
+					max(stocks),
+					movement,
+					last.price,
+					last.is_removed or 0,
+				)
+			)
+
+	bulk_upsert(ROLLUP_DOCTYPE, ROLLUP_INSERT_FIELDS, values, ROLLUP_FIELDS[2:] + ("modified",))
+	return len(values)
+
+
+def get_rollup(start_day, end_day):
+	"""code -> rollup rows in [start_day, end_day], oldest first."""
+	rows = frappe.db.sql(
+		f"""
+			SELECT `code`, `day`, `open_stock`, `close_stock`, `min_stock`, `max_stock`, `movement`, `last_price`, `is_removed`
+			FROM `tab{ROLLUP_DOCTYPE}`
+			WHERE `day` BETWEEN %(start)s AND %(end)s
+			ORDER BY `code`, `day`
+		""",
+		{"start": getdate(start_day), "end": getdate(end_day)},
+		as_dict=True,
+	)
+	return {code: list(group) for code, group in groupby(rows, key=lambda row: row.code)}
@@ -0,0 +1,145 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Trigram index over the searchable Stylus catalog fields.
+
+For every code, Stylus Search Trigram holds the distinct three-character
+substrings of its code, designation, brand and main category, lower-cased and
+without accents like the database collation compares them. Codes that left
+the catalog keep the values of their last stored row, so pages listing
+removed codes can use the index too. A substring filter of three or more
+characters is resolved to the codes that carry all of its trigrams, so the
+caller only verifies `LIKE '%value%'` on those candidates. Shorter values
+cannot use the index."""
+
+import unicodedata
+
+import frappe
+from frappe.utils import cstr, now
+
+from itec_integrations.itec_integrations.stylus.ingest import INGEST_CHUNK_SIZE
+
+
+TRIGRAM_DOCTYPE = "Stylus Search Trigram"
+SEARCH_FIELDS = ("code", "designation", "brand", "main_category")
+TRIGRAM_INSERT_FIELDS = ("name", "creation", "modified", "owner", "modified_by", "docstatus", "field", "trigram", "code")
+
+
+# Codes no longer in the catalog, with the searchable values of their last
+# stored row, found through the history their last series point refers to.
+REMOVED_ROWS_QUERY = """
+	SELECT `item`.`code`, `item`.`designation`, `item`.`brand`, `item`.`main_category`
+	FROM (
+		SELECT
+			`code`, `stock_history`,
+			ROW_NUMBER() OVER (PARTITION BY `code` ORDER BY `ts` DESC) AS `rn`
+		FROM `tabStylus Stock Series`
+		WHERE `is_removed` = 0
+			AND `code` NOT IN (SELECT `name` FROM `tabStylus Current Stock`)
+	) `point`
+	INNER JOIN `tabStylus Stock History Item` `item`
+		ON `item`.`parent` = `point`.`stock_history` AND `item`.`code` = `point`.`code`
+	WHERE `point`.`rn` = 1
+"""
+
+
+def normalize_text(value):
+	"""`value` lower-cased and without accents, the way the case- and
+	accent-insensitive collation of the catalog tables compares it."""
+	text = unicodedata.normalize("NFKD", cstr(value).strip())
+	return "".join(char for char in text if not unicodedata.combining(char)).casefold()
+
+
+def trigrams(value):
+	text = normalize_text(value)
+	return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def search_key(row):
+	"""The searchable values of a catalog row, to tell whether it needs
+	reindexing."""
+	return tuple(cstr(row.get(fieldname)) for fieldname in SEARCH_FIELDS)
+
+
+def index_rows(rows):
+	"""(Re)index the searchable fields of `rows` (dicts with a `code`)."""
+	rows = [row for row in rows if row.get("code")]
+	if not rows:
+		return
+	remove_codes([row["code"] for row in rows])
+
+	timestamp = now()
+	user = frappe.session.user
+	values = []
+	for row in rows:
+		for fieldname in SEARCH_FIELDS:
+			for trigram in trigrams(row.get(fieldname)):
+				values.append(
+					(
+						f"{fieldname}|{trigram}|{row['code']}",
+						timestamp,
+						timestamp,
+						user,
+						user,
+						0,
+						fieldname,
+						trigram,
+						row["code"],
+					)
+				)
+	for start in range(0, len(values), INGEST_CHUNK_SIZE):
+		frappe.db.bulk_insert(
+			TRIGRAM_DOCTYPE,
+			TRIGRAM_INSERT_FIELDS,
+			values[start : start + INGEST_CHUNK_SIZE],
+			ignore_duplicates=True,
+		)
+
+
+def remove_codes(codes):
+	codes = list(codes)
+	for start in range(0, len(codes), INGEST_CHUNK_SIZE):
+		frappe.db.delete(TRIGRAM_DOCTYPE, {"code": ["in", codes[start : start + INGEST_CHUNK_SIZE]]})
+
+
+def rebuild_search_index():
+	"""Reindex every code of Stylus Current Stock and every code that left the
+	catalog. Usable from `bench execute`."""
+	frappe.db.delete(TRIGRAM_DOCTYPE)
+	rows = frappe.get_all(
+		"Stylus Current Stock",
+		fields=["name as code", "designation", "brand", "main_category"],
+		limit_page_length=0,
+	)
+	rows += frappe.db.sql(REMOVED_ROWS_QUERY, as_dict=True)
+	for start in range(0, len(rows), INGEST_CHUNK_SIZE):
+		index_rows(rows[start : start + INGEST_CHUNK_SIZE])
+	return len(rows)
+
+
+def ensure_search_index():
+	if not frappe.db.count(TRIGRAM_DOCTYPE) and frappe.db.count("Stylus Current Stock"):
+		rebuild_search_index()
+
+
+def match_codes(fieldname, values):
+	"""Candidate codes whose `fieldname` may contain any of `values`, or None
+	when a value is too short for the index and the caller has to scan."""
+	candidates = set()
+	for value in values:
+		grams = trigrams(value)
+		if not grams:
+			return None
+		candidates.update(
+			frappe.db.sql_list(
+				f"""
+					SELECT `code`
+					FROM `tab{TRIGRAM_DOCTYPE}`
+					WHERE `field` = %(field)s AND `trigram` IN %(grams)s
+					GROUP BY `code`
+					HAVING COUNT(DISTINCT `trigram`) = %(count)s
+				""",
+				{"field": fieldname, "grams": tuple(grams), "count": len(grams)},
+			)
+		)
+	return candidates
@@ -0,0 +1,220 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Per-code time series of Stylus stock and price.
+
+Stylus Stock Series stores a point only when a code's stock or price changes
+(or the code leaves the catalog), named "<code>@<ts>" so rows are clustered by
+code and time. Between two points the earlier value holds, which makes
+"series for codes C between T1 and T2" a range read per code and "value at T"
+the latest point at or before T, independent of how many snapshots exist."""
+
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import flt, get_datetime, now
+
+from itec_integrations.itec_integrations.stylus.backfill import get_seed_creation, iter_date_windows
+from itec_integrations.itec_integrations.stylus.cache import bump_generation
+from itec_integrations.itec_integrations.utils import bulk_upsert
+
+
+SERIES_DOCTYPE = "Stylus Stock Series"
+SERIES_FIELDS = ("code", "ts", "stock", "price", "is_removed", "stock_history")
+SERIES_INSERT_FIELDS = ("name", "creation", "modified", "owner", "modified_by", "docstatus") + SERIES_FIELDS
+SERIES_UPDATE_FIELDS = ("stock", "price", "is_removed", "stock_history", "modified")
+
+
+def point_name(code, ts):
+	return f"{code}@{get_datetime(ts).isoformat(sep=' ')}"
+
+
+class SeriesWriter:
+	"""Turns the rows of one sync into series points. `previous_index` is the
+	`code -> (row_hash, price, stock)` state before the sync. `apply` and
+	`remove` return the points they wrote."""
+
+	def __init__(self, history, previous_index):
+		self.history = history
+		self.previous_index = previous_index or {}
+		self.points = 0
+
+	def apply(self, rows):
+		points = []
+		for row in rows:
+			code = row.get("code")
+			if not code or row.get("is_removed"):
+				continue
+			previous = self.previous_index.get(code)
+			price, stock = flt(row.get("price")), flt(row.get("stock"))
+			if previous and previous[1] == price and previous[2] == stock:
+				continue
+			points.append({"code": code, "stock": stock, "price": price, "is_removed": 0})
+		return self._write(points)
+
+	def remove(self, codes):
+		return self._write(
+			[
+				{"code": code, "stock": 0, "price": self.previous_index[code][1], "is_removed": 1}
+				for code in codes
+				if code in self.previous_index
+			]
+		)
+
+	def _write(self, points):
+		for point in points:
+			point["ts"] = self.history.creation
+			point["stock_history"] = self.history.name
+		write_points(points)
+		self.points += len(points)
+		return points
+
+
+def write_points(points):
+	"""Upsert points on their (code, ts) name; rewriting a point in place keeps
+	same-day snapshot updates idempotent."""
+	timestamp = now()
+	user = frappe.session.user
+	bulk_upsert(
+		SERIES_DOCTYPE,
+		SERIES_INSERT_FIELDS,
+		[
+			(point_name(point["code"], point["ts"]), timestamp, timestamp, user, user, 0)
+			+ tuple(point.get(fieldname) for fieldname in SERIES_FIELDS)
+			for point in points
+		],
+		SERIES_UPDATE_FIELDS,
+	)
+
+
+def repoint_history(old_names, new_name):
+	"""Move references to histories that are about to be deleted. Their points
+	stay: they are still what the catalog showed at that time."""
+	if old_names:
+		frappe.db.sql(
+			f"""
+				UPDATE `tab{SERIES_DOCTYPE}`
+				SET `stock_history` = %(new)s
+				WHERE `stock_history` IN %(old)s
+			""",
+			{"new": new_name, "old": tuple(old_names)},
+		)
+
+
+def get_series(codes, start, end):
+	"""code -> points in [start, end], oldest first. `codes=None` reads every
+	code."""
+	conditions = ["`ts` BETWEEN %(start)s AND %(end)s"]
+	params = {"start": get_datetime(start), "end": get_datetime(end)}
+	if codes is not None:
+		if not codes:
+			return OrderedDict()
+		conditions.append("`code` IN %(codes)s")
+		params["codes"] = tuple(codes)
+
+	series = OrderedDict()
+	for point in frappe.db.sql(
+		f"""
+			SELECT `code`, `ts`, `stock`, `price`, `is_removed`
+			FROM `tab{SERIES_DOCTYPE}`
+			WHERE {" AND ".join(conditions)}
+			ORDER BY `code`, `ts`
+		""",
+		params,
+		as_dict=True,
+	):
+		series.setdefault(point.code, []).append(point)
+	return series
+
+
+def get_values_at(codes, at, include_removed=False, before=False):
+	"""code -> the latest point at or before `at` (strictly before with
+	`before`). Codes that had left the catalog by then are omitted unless
+	`include_removed`. `codes=None` reads every code."""
+	conditions = ["`ts` < %(at)s" if before else "`ts` <= %(at)s"]
+	params = {"at": get_datetime(at)}
+	if codes is not None:
+		if not codes:
+			return {}
+		conditions.append("`code` IN %(codes)s")
+		params["codes"] = tuple(codes)
+
+	rows = frappe.db.sql(
+		f"""
+			SELECT `code`, `ts`, `stock`, `price`, `is_removed`
+			FROM (
+				SELECT
+					`code`, `ts`, `stock`, `price`, `is_removed`,
+					ROW_NUMBER() OVER (PARTITION BY `code` ORDER BY `ts` DESC) AS `rn`
+				FROM `tab{SERIES_DOCTYPE}`
+				WHERE {" AND ".join(conditions)}
+			) `latest`
+			WHERE `rn` = 1
+		""",
+		params,
+		as_dict=True,
+	)
+	return {row.code: row for row in rows if include_removed or not row.is_removed}
+
+
+@frappe.whitelist()
+def get_stock_series(codes, from_datetime, to_datetime):
+	"""Stock and price points for `codes` between the two datetimes."""
+	frappe.has_permission(SERIES_DOCTYPE, "read", throw=True)
+	codes = frappe.parse_json(codes) if isinstance(codes, str) else codes
+	return get_series(list(codes or []), from_datetime, to_datetime)
+
+
+@frappe.whitelist()
+def get_stock_value_at(codes, at):
+	"""Stock and price of `codes` as they stood at `at`."""
+	frappe.has_permission(SERIES_DOCTYPE, "read", throw=True)
+	codes = frappe.parse_json(codes) if isinstance(codes, str) else codes
+	return get_values_at(list(codes or []), at)
+
+
+def backfill_series(from_date, to_date):
+	"""Derive series points from the stored snapshots in [from_date, to_date],
+	one date window at a time. Idempotent: points are upserted on their
+	(code, ts) name. Run with `bench execute`."""
+	points = 0
+	for start, end in iter_date_windows(from_date, to_date):
+		points += backfill_series_window(start, end)
+		frappe.db.commit()
+		bump_generation()
+	return points
+
+
+def backfill_series_window(start, end):
+	"""Write a point for every stored item row in [start, end] whose stock,
+	price or presence differs from the code's previous stored row.
+
+	Full snapshots do not mark codes that disappeared, so for them a removal
+	only shows up once the code is seen again."""
+	rows = frappe.db.sql(
+		"""
+			SELECT `code`, `creation` AS `ts`, `stock`, `price`, `is_removed`, `parent` AS `stock_history`
+			FROM (
+				SELECT
+					`code`, `creation`, `stock`, `price`, `is_removed`, `parent`,
+					LAG(`stock`) OVER (PARTITION BY `code` ORDER BY `creation`) AS `old_stock`,
+					LAG(`price`) OVER (PARTITION BY `code` ORDER BY `creation`) AS `old_price`,
+					LAG(`is_removed`) OVER (PARTITION BY `code` ORDER BY `creation`) AS `old_removed`
+				FROM `tabStylus Stock History Item`
+				WHERE `creation` >= %(seed)s
+					AND `creation` <= %(end)s
+					AND IFNULL(`code`, '') != ''
+			) `sequenced`
+			WHERE `creation` >= %(start)s
+				AND (
+					`old_stock` IS NULL
+					OR `stock` != `old_stock`
+					OR `price` != `old_price`
+					OR `is_removed` != `old_removed`
+				)
+		""",
+		{"seed": get_seed_creation(get_datetime(start)), "start": start, "end": end},
+		as_dict=True,
+	)
+	write_points(rows)
+	return len(rows)
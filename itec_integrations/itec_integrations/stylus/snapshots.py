@@ -0,0 +1,309 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Snapshot storage for Stylus Stock History.
+
+A history is either a Full keyframe (every catalog item) or a Delta that only
+holds codes whose values changed since the previous snapshot, plus `is_removed`
+markers for codes that disappeared. The state at any history is rebuilt from
+the latest keyframe at or before it, overlaid with the deltas that follow."""
+
+import hashlib
+import json
+
+import frappe
+from frappe.utils import cint, flt, now
+
+from itec_integrations.itec_integrations.stylus.ingest import BLOB_FIELDS, HISTORY_ITEM_FIELDS
+
+
+FULL = "Full"
+DELTA = "Delta"
+DEFAULT_KEYFRAME_INTERVAL = 24
+MOVE_BATCH_SIZE = 1000
+
+FINGERPRINT_FIELDS = ("designation", "price", "stock", "main_category", "brand")
+
+
+def content_digest(value):
+	"""Stable digest of a text value; None for empty values."""
+	if value is None or value == "":
+		return None
+	return hashlib.sha1(str(value).encode("utf-8")).hexdigest()
+
+
+def row_fingerprint(row):
+	"""Digest of every stored attribute of a catalog row. Heavy text fields
+	contribute through their own digest so they can be stored by hash."""
+	parts = [row.get("code")]
+	parts.extend(
+		flt(row.get(fieldname)) if fieldname in ("price", "stock") else row.get(fieldname)
+		for fieldname in FINGERPRINT_FIELDS
+	)
+	parts.extend(
+		row.get(hash_field) or content_digest(row.get(text_field))
+		for text_field, hash_field in BLOB_FIELDS.items()
+	)
+	return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+def choose_snapshot_type(setting, previous_history=None):
+	"""Full when running in Full mode, when no usable keyframe exists, or when
+	the keyframe interval has been reached; Delta otherwise."""
+	mode = setting.get("storage_mode") or FULL
+	interval = cint(setting.get("keyframe_interval")) or DEFAULT_KEYFRAME_INTERVAL
+	if mode != DELTA or not previous_history:
+		return FULL
+
+	keyframe = get_keyframe(previous_history)
+	# Keyframes written before delta storage existed carry no row hashes, so
+	# they cannot seed a delta chain.
+	if not keyframe or not cint(keyframe.item_count):
+		return FULL
+
+	deltas_since = frappe.db.count(
+		"Stylus Stock History",
+		{"snapshot_type": DELTA, "creation": [">", keyframe.creation]},
+	)
+	return FULL if deltas_since + 1 >= interval else DELTA
+
+
+def get_latest_history(exclude=None, before=None):
+	filters = {}
+	if exclude:
+		filters["name"] = ["!=", exclude]
+	if before:
+		filters["creation"] = ["<", before]
+	rows = frappe.get_all(
+		"Stylus Stock History",
+		filters=filters,
+		fields=["name", "creation", "snapshot_type", "item_count"],
+		order_by="creation desc",
+		limit=1,
+	)
+	return rows[0] if rows else None
+
+
+def get_keyframe(history):
+	"""Latest Full history at or before `history`."""
+	creation = _get_creation(history)
+	rows = frappe.db.sql(
+		"""
+			SELECT `name`, `creation`, `item_count`
+			FROM `tabStylus Stock History`
+			WHERE IFNULL(`snapshot_type`, 'Full') != 'Delta'
+				AND `creation` <= %(creation)s
+			ORDER BY `creation` DESC
+			LIMIT 1
+		""",
+		{"creation": creation},
+		as_dict=True,
+	)
+	return rows[0] if rows else None
+
+
+def get_chain(history):
+	"""Names of the keyframe and every history up to `history`, oldest first."""
+	keyframe = get_keyframe(history)
+	if not keyframe:
+		return [_get_name(history)]
+	return frappe.db.sql_list(
+		"""
+			SELECT `name`
+			FROM `tabStylus Stock History`
+			WHERE `creation` >= %(start)s AND `creation` <= %(end)s
+			ORDER BY `creation` ASC
+		""",
+		{"start": keyframe.creation, "end": _get_creation(history)},
+	)
+
+
+def get_state(history, fields=None):
+	"""Rebuild the catalog as it stood at `history`: one row per code with the
+	values from the most recent snapshot in the chain that stored it."""
+	fields = list(fields or HISTORY_ITEM_FIELDS)
+	if "code" not in fields:
+		fields.insert(0, "code")
+	chain = get_chain(history)
+	if not chain:
+		return []
+
+	columns = ", ".join(f"`{fieldname}`" for fieldname in fields)
+	return frappe.db.sql(
+		f"""
+			SELECT {columns}
+			FROM (
+				SELECT
+					{columns},
+					`is_removed`,
+					ROW_NUMBER() OVER (
+						PARTITION BY `code`
+						ORDER BY `creation` DESC, `modified` DESC
+					) AS `rn`
+				FROM `tabStylus Stock History Item`
+				WHERE `parent` IN %(chain)s
+					AND IFNULL(`code`, '') != ''
+			) `latest`
+			WHERE `rn` = 1 AND IFNULL(`is_removed`, 0) = 0
+			ORDER BY `code`
+		""",
+		{"chain": tuple(chain)},
+		as_dict=True,
+	)
+
+
+def get_state_index(history):
+	"""code -> (row_hash, price, stock) for the state at `history`."""
+	if not history:
+		return {}
+	return {
+		row.code: (row.row_hash, flt(row.price), flt(row.stock))
+		for row in get_state(history, fields=("code", "row_hash", "price", "stock"))
+	}
+
+
+@frappe.whitelist()
+def get_snapshot(history=None, fields=None, resolve_content=False):
+	"""Reconstruct a Stylus catalog snapshot. Defaults to the latest history.
+	Heavy text fields are returned as blob hashes unless `resolve_content`."""
+	from itec_integrations.itec_integrations.stylus.blobs import attach_content
+
+	frappe.has_permission("Stylus Stock History", "read", throw=True)
+	fields = frappe.parse_json(fields) if isinstance(fields, str) else fields
+	if fields:
+		allowed = set(HISTORY_ITEM_FIELDS) | set(BLOB_FIELDS.values()) | {"row_hash"}
+		fields = [fieldname for fieldname in fields if fieldname in allowed]
+
+	if not history:
+		latest = get_latest_history()
+		history = latest.name if latest else None
+	if not history:
+		return []
+
+	rows = get_state(history, fields=fields or HISTORY_ITEM_FIELDS + tuple(BLOB_FIELDS.values()))
+	if cint(resolve_content):
+		attach_content(rows)
+	return rows
+
+
+class SnapshotWriter:
+	"""Filters streamed catalog rows down to what a snapshot has to store and
+	tracks which previous codes were not seen again."""
+
+	def __init__(self, snapshot_type, previous_index):
+		self.snapshot_type = snapshot_type
+		self.previous_index = previous_index or {}
+		self.seen = set()
+		self.item_count = 0
+		self.stored_count = 0
+
+	def prepare(self, rows):
+		stored = []
+		for row in rows:
+			row["row_hash"] = row_fingerprint(row)
+			row["is_removed"] = 0
+			self.item_count += 1
+			code = row.get("code")
+			if code:
+				self.seen.add(code)
+
+			previous = self.previous_index.get(code)
+			if self.snapshot_type == FULL or not previous or previous[0] != row["row_hash"]:
+				stored.append(row)
+
+		self.stored_count += len(stored)
+		return stored
+
+	def removed_codes(self):
+		"""Codes of the previous state that were not seen again."""
+		return [code for code in self.previous_index if code not in self.seen]
+
+	def removed_rows(self):
+		if self.snapshot_type == FULL:
+			return []
+		rows = [
+			{"code": code, "price": self.previous_index[code][1], "stock": 0, "is_removed": 1}
+			for code in self.removed_codes()
+		]
+		self.stored_count += len(rows)
+		return rows
+
+
+def fold_histories(keep, remove_names):
+	"""Merge `remove_names` into `keep`, the latest of the group, before they are
+	deleted, so a Delta survivor does not lose changes that only the removed
+	snapshots recorded. If any removed history was a keyframe, the survivor now
+	holds the full state and becomes one itself."""
+	if not remove_names:
+		return
+
+	keep_doc = frappe.db.get_value(
+		"Stylus Stock History", keep, ["name", "creation", "snapshot_type"], as_dict=True
+	)
+	if not keep_doc or (keep_doc.snapshot_type or FULL) == FULL:
+		return
+
+	# A keyframe among the removed histories supersedes everything before it;
+	# rows only recorded earlier describe codes it no longer holds.
+	removed = frappe.get_all(
+		"Stylus Stock History",
+		filters={"name": ["in", remove_names]},
+		fields=["name", "snapshot_type"],
+		order_by="creation asc",
+	)
+	keyframes = [position for position, row in enumerate(removed) if (row.snapshot_type or FULL) != DELTA]
+	candidates = [row.name for row in removed[keyframes[-1] if keyframes else 0 :]]
+	if not candidates:
+		return
+
+	to_move = frappe.db.sql_list(
+		"""
+			SELECT `name`
+			FROM (
+				SELECT
+					`name`,
+					`code`,
+					ROW_NUMBER() OVER (PARTITION BY `code` ORDER BY `creation` DESC) AS `rn`
+				FROM `tabStylus Stock History Item`
+				WHERE `parent` IN %(removed)s
+					AND IFNULL(`code`, '') != ''
+			) `latest`
+			WHERE `rn` = 1
+				AND `code` NOT IN (
+					SELECT `code`
+					FROM `tabStylus Stock History Item`
+					WHERE `parent` = %(keep)s
+						AND `code` IS NOT NULL
+				)
+		""",
+		{"removed": tuple(candidates), "keep": keep},
+	)
+	# Moved rows get a new `modified` so the archive export appends them again.
+	modified = now()
+	for start in range(0, len(to_move), MOVE_BATCH_SIZE):
+		batch = to_move[start : start + MOVE_BATCH_SIZE]
+		frappe.db.sql(
+			"""
+				UPDATE `tabStylus Stock History Item`
+				SET `parent` = %(keep)s, `creation` = %(creation)s, `modified` = %(modified)s
+				WHERE `name` IN %(names)s
+			""",
+			{"keep": keep, "creation": keep_doc.creation, "modified": modified, "names": tuple(batch)},
+		)
+
+	updates = {
+		"stored_count": frappe.db.count("Stylus Stock History Item", {"parent": keep}),
+	}
+	if keyframes:
+		updates["snapshot_type"] = FULL
+	frappe.db.set_value("Stylus Stock History", keep, updates)
+
+
+def _get_creation(history):
+	if isinstance(history, dict):
+		return history.get("creation")
+	return frappe.db.get_value("Stylus Stock History", history, "creation")
+
+
+def _get_name(history):
+	return history.get("name") if isinstance(history, dict) else history
@@ -0,0 +1,206 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Write one Stylus catalog download into Stylus Stock History.
+
+By default every sync inserts a new history and same-day duplicates are
+collapsed afterwards. With "Upsert Same-Day Snapshot" enabled, a sync on a day
+that already has a history updates that history in place: only changed rows
+are written and codes that disappeared are dropped or marked removed.
+
+Both paths keep Stylus Current Stock, Stylus Stock Series and Stylus Stock
+Daily in step, see stylus.current_stock, stylus.series and stylus.rollup.
+History stored before the series existed is backfilled in the background."""
+
+from datetime import datetime, time
+
+import frappe
+from frappe.utils import cint, getdate
+
+from itec_integrations.itec_integrations.stylus.blobs import BlobStore
+from itec_integrations.itec_integrations.stylus.current_stock import (
+	CurrentStockUpdater,
+	ensure_current_stock,
+)
+from itec_integrations.itec_integrations.stylus.ingest import (
+	HISTORY_ITEM_DOCTYPE,
+	insert_history_items,
+	upsert_history_items,
+)
+from itec_integrations.itec_integrations.stylus.price_changes import (
+	PriceChangeRecorder,
+	drop_reverted_logs,
+)
+from itec_integrations.itec_integrations.stylus.price_stats import refresh_price_change_stats
+from itec_integrations.itec_integrations.stylus.rollup import DailyRollupWriter, ensure_history_backfill
+from itec_integrations.itec_integrations.stylus.series import SeriesWriter
+from itec_integrations.itec_integrations.stylus.snapshots import (
+	DELTA,
+	FULL,
+	MOVE_BATCH_SIZE,
+	SnapshotWriter,
+	choose_snapshot_type,
+	get_latest_history,
+	get_state_index,
+)
+from itec_integrations.itec_integrations.utils import chunked
+
+
+HISTORY_DOCTYPE = "Stylus Stock History"
+
+
+def ingest_catalog(setting, rows):
+	"""Persist the streamed catalog `rows`. Returns (history name, inserted),
+	where `inserted` is False when an existing same-day history was updated."""
+	ensure_history_backfill()
+	if cint(setting.get("daily_snapshot_upsert")):
+		today = get_history_for_day(getdate())
+		if today:
+			upsert_daily_snapshot(today, rows)
+			return today.name, False
+	return insert_snapshot(setting, rows), True
+
+
+def get_history_for_day(day):
+	"""Latest history created on `day`, if any."""
+	day = getdate(day)
+	rows = frappe.get_all(
+		HISTORY_DOCTYPE,
+		filters={
+			"creation": ["between", (datetime.combine(day, time.min), datetime.combine(day, time.max))]
+		},
+		fields=["name", "creation", "modified", "owner", "snapshot_type"],
+		order_by="creation desc",
+		limit=1,
+	)
+	return rows[0] if rows else None
+
+
+def insert_snapshot(setting, rows):
+	"""Stream `rows` into a new history. The parent is inserted empty and items
+	are written in multi-row chunks, so the full payload is never held in
+	memory or pushed through the ORM."""
+	previous = get_latest_history()
+	previous_index = get_state_index(previous.name) if previous else {}
+	ensure_current_stock(previous.name if previous else None)
+	history_doc = frappe.get_doc(
+		{
+			"doctype": HISTORY_DOCTYPE,
+			"snapshot_type": choose_snapshot_type(setting, previous),
+		}
+	)
+	history_doc.insert(ignore_permissions=True)
+	writer = SnapshotWriter(history_doc.snapshot_type, previous_index)
+	blobs = BlobStore()
+	price_changes = PriceChangeRecorder(
+		history_doc,
+		previous.name if previous else None,
+		_prices(previous_index),
+	)
+	current_stock = CurrentStockUpdater(history_doc, previous_index)
+	series = SeriesWriter(history_doc, previous_index)
+	rollup = DailyRollupWriter(previous_index)
+
+	idx = 0
+	for chunk in chunked(rows):
+		stored = blobs.extract(writer.prepare(chunk))
+		idx = insert_history_items(history_doc, stored, idx)
+		# A price change always changes the row fingerprint, so the stored
+		# rows are enough even for delta snapshots.
+		price_changes.collect(stored)
+		current_stock.apply(stored)
+		rollup.apply(series.apply(stored))
+	insert_history_items(history_doc, writer.removed_rows(), idx)
+	current_stock.remove(writer.removed_codes())
+	rollup.apply(series.remove(writer.removed_codes()))
+	if price_changes.flush():
+		refresh_price_change_stats([history_doc.creation])
+
+	frappe.db.set_value(
+		HISTORY_DOCTYPE,
+		history_doc.name,
+		{"item_count": writer.item_count, "stored_count": writer.stored_count},
+		update_modified=False,
+	)
+	return history_doc.name
+
+
+def upsert_daily_snapshot(history, rows):
+	"""Bring today's `history` up to date with `rows` in place.
+
+	Rows are compared with the state at `history`; only changed codes are
+	written, updating the existing item row or appending one. Price change logs
+	stay relative to the last history before today and are merged on the
+	(stock_history, code) key, so an intraday change back to the earlier price
+	leaves no log behind."""
+	current_index = get_state_index(history.name)
+	ensure_current_stock(history.name)
+	previous = get_latest_history(before=history.creation)
+	previous_prices = _prices(get_state_index(previous.name)) if previous else {}
+
+	existing = frappe.get_all(
+		HISTORY_ITEM_DOCTYPE,
+		filters={"parent": history.name},
+		fields=["code", "name", "idx"],
+	)
+	existing_names = {row.code: row.name for row in existing if row.code}
+	idx = max((cint(row.idx) for row in existing), default=0)
+
+	# Compare as a delta against the current state whatever the history's
+	# own type, so unchanged codes are not rewritten.
+	writer = SnapshotWriter(DELTA, current_index)
+	blobs = BlobStore()
+	price_changes = PriceChangeRecorder(
+		history,
+		previous.name if previous else None,
+		previous_prices,
+		merge_duplicates=True,
+	)
+	current_stock = CurrentStockUpdater(history, current_index)
+	series = SeriesWriter(history, current_index)
+	rollup = DailyRollupWriter(current_index)
+
+	for chunk in chunked(rows):
+		changed = blobs.extract(writer.prepare(chunk))
+		idx = upsert_history_items(history, changed, existing_names, idx)
+		price_changes.collect(changed)
+		drop_reverted_logs(history.name, previous_prices, changed)
+		current_stock.apply(changed)
+		rollup.apply(series.apply(changed))
+
+	removed = writer.removed_rows()
+	if (history.snapshot_type or FULL) == DELTA:
+		upsert_history_items(history, removed, existing_names, idx)
+	else:
+		_delete_items(
+			history.name,
+			[existing_names[row["code"]] for row in removed if row["code"] in existing_names],
+		)
+
+	current_stock.remove(writer.removed_codes())
+	rollup.apply(series.remove(writer.removed_codes()))
+	price_changes.flush()
+	# Merged and dropped logs change the day's stats even when nothing new
+	# was written.
+	refresh_price_change_stats([history.creation])
+
+	frappe.db.set_value(
+		HISTORY_DOCTYPE,
+		history.name,
+		{
+			"item_count": writer.item_count,
+			"stored_count": frappe.db.count(HISTORY_ITEM_DOCTYPE, {"parent": history.name}),
+		},
+	)
+
+
+def _delete_items(history_name, names):
+	for start in range(0, len(names), MOVE_BATCH_SIZE):
+		frappe.db.delete(
+			HISTORY_ITEM_DOCTYPE,
+			{"parent": history_name, "name": ["in", names[start : start + MOVE_BATCH_SIZE]]},
+		)
+
+
+def _prices(index):
+	return {code: values[1] for code, values in index.items()}
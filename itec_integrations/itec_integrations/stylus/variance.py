@@ -0,0 +1,148 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Columnar stock variance engine.
+
+Series points are loaded as parallel arrays sorted by (code, ts). Per-code
+segments are found from the code boundaries, and differences, positive and
+negative totals and run-length compression are computed with NumPy over the
+whole range at once. Labels are only formatted for the points a caller
+actually returns."""
+
+import numpy as np
+
+import frappe
+from frappe.utils import get_datetime
+
+from itec_integrations.itec_integrations.stylus.series import SERIES_DOCTYPE, get_values_at
+
+
+DIFF_PRECISION = 3
+LABEL_FORMAT = "%Y-%m-%d %H:%M"
+DATE_FORMAT = "%d-%m-%Y"
+
+
+class VarianceColumns:
+	"""Stock series for a set of codes in a date range, as columns."""
+
+	def __init__(self, codes, ts, stock, price, opening, opening_price=None):
+		self.codes = codes
+		self.ts = ts
+		self.stock = stock
+		self.price = price
+		self.opening = opening
+		self.opening_price = opening_price or {}
+		self._compute()
+
+	@classmethod
+	def load(cls, codes, start, end):
+		"""Load the points of `codes` (None for every code) in [start, end],
+		skipping removal markers, with each code's opening stock and price.
+		Explicit codes get their opening values even without points in range."""
+		conditions = ["`ts` BETWEEN %(start)s AND %(end)s", "`is_removed` = 0"]
+		params = {"start": get_datetime(start), "end": get_datetime(end)}
+		if codes is not None:
+			if not codes:
+				return cls.empty()
+			conditions.append("`code` IN %(codes)s")
+			params["codes"] = tuple(codes)
+
+		rows = frappe.db.sql(
+			f"""
+				SELECT `code`, `ts`, `stock`, `price`
+				FROM `tab{SERIES_DOCTYPE}`
+				WHERE {" AND ".join(conditions)}
+				ORDER BY `code`, `ts`
+			""",
+			params,
+		)
+		if not rows and codes is None:
+			return cls.empty()
+
+		code_column = np.array([row[0] for row in rows], dtype=object)
+		opening_values = get_values_at(
+			codes if codes is not None else list(dict.fromkeys(code_column)), start, before=True
+		)
+		return cls(
+			code_column,
+			[row[1] for row in rows],
+			np.fromiter((row[2] or 0.0 for row in rows), dtype=float, count=len(rows)),
+			np.fromiter((row[3] or 0.0 for row in rows), dtype=float, count=len(rows)),
+			{code: float(point.stock or 0.0) for code, point in opening_values.items()},
+			{code: float(point.price or 0.0) for code, point in opening_values.items()},
+		)
+
+	@classmethod
+	def empty(cls):
+		return cls(np.array([], dtype=object), [], np.array([], dtype=float), np.array([], dtype=float), {})
+
+	def _compute(self):
+		size = len(self.codes)
+		if not size:
+			self.starts = self.ends = np.array([], dtype=int)
+			self.unique_codes = []
+			self.diff = self.previous_stock = np.array([], dtype=float)
+			self.is_first = self.keep = np.array([], dtype=bool)
+			self.positive = self.negative = np.array([], dtype=float)
+			return
+
+		boundary = np.empty(size, dtype=bool)
+		boundary[0] = True
+		boundary[1:] = self.codes[1:] != self.codes[:-1]
+		self.is_first = boundary
+		self.starts = np.flatnonzero(boundary)
+		self.ends = np.append(self.starts[1:], size)
+		self.unique_codes = list(self.codes[self.starts])
+
+		# The first point of each code is compared with its opening stock
+		# (0 for codes with no earlier history), the others with their
+		# predecessor.
+		opening = np.array([self.opening.get(code, 0.0) for code in self.unique_codes], dtype=float)
+		previous = np.empty(size, dtype=float)
+		previous[1:] = self.stock[:-1]
+		previous[self.starts] = opening
+		self.previous_stock = previous
+		self.diff = np.round(self.stock - previous, DIFF_PRECISION)
+
+		self.positive = np.round(np.add.reduceat(np.where(self.diff > 0, self.diff, 0.0), self.starts), DIFF_PRECISION)
+		self.negative = np.round(np.add.reduceat(np.where(self.diff < 0, self.diff, 0.0), self.starts), DIFF_PRECISION)
+
+		# Run-length compression: keep a point when its rounded stock or its
+		# price differs from the point before; the first point of a code is
+		# always kept since the opening entry carries no price.
+		rounded = np.round(self.stock, DIFF_PRECISION)
+		changed = np.ones(size, dtype=bool)
+		changed[1:] = (rounded[1:] != rounded[:-1]) | (self.price[1:] != self.price[:-1])
+		self.keep = changed | boundary
+
+	def segments(self):
+		"""Yield (position, code, start, end) per code."""
+		for position, code in enumerate(self.unique_codes):
+			yield position, code, int(self.starts[position]), int(self.ends[position])
+
+	def label(self, index):
+		return get_datetime(self.ts[index]).strftime(LABEL_FORMAT)
+
+	def date(self, index):
+		return get_datetime(self.ts[index]).strftime(DATE_FORMAT)
+
+	def summary(self):
+		"""Totals per code: opening, closing, positive, negative and net
+		movement, number of changes and the time of the last change."""
+		counts = np.add.reduceat((self.diff != 0).astype(int), self.starts) if len(self.codes) else []
+		result = []
+		for position, code, start, end in self.segments():
+			last_change = np.flatnonzero(self.diff[start:end])
+			result.append(
+				{
+					"code": code,
+					"opening": round(self.opening.get(code, 0.0), DIFF_PRECISION),
+					"closing": round(float(self.stock[end - 1]), DIFF_PRECISION),
+					"positive": float(self.positive[position]),
+					"negative": float(self.negative[position]),
+					"net": round(float(self.positive[position] + self.negative[position]), DIFF_PRECISION),
+					"changes": int(counts[position]),
+					"last_change": self.ts[start + int(last_change[-1])] if len(last_change) else None,
+				}
+			)
+		return result
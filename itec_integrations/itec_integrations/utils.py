@@ -0,0 +1,505 @@
+# Copyright (c) 2026, Abbass Chokor and contributors
+# For license information, please see license.txt
+
+"""Shared HTTP client for partner integrations.
+
+`get_client(name)` returns one long-lived client per integration. Its
+adapter keeps a keep-alive connection pool per host that every thread of the
+process reuses; each thread gets its own Session over that adapter, since a
+Session is not guaranteed thread-safe. Requests always carry a connect and
+read timeout and accept gzip. Connection errors, timeouts and retryable
+statuses are retried with backoff while the client's retry budget allows,
+and every request's timing is recorded per host.
+
+`CircuitBreaker` and `SharedRetryBudget` keep their state in Redis per
+upstream host, so every web and background worker of the site sees the same
+breaker and draws retries from the same budget. They use the site cache, so
+call them from the request or job thread, not from pool threads.
+
+`AIMDController` sizes batches from observed latency and errors: it grows
+additively while requests are fast and successful, and halves on an error or
+a slow response.
+
+`bulk_upsert` writes rows with multi-row `INSERT ... ON DUPLICATE KEY UPDATE`
+statements, for the tables integrations keep in step with their upstream."""
+
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import frappe
+from frappe.utils import cint, flt
+
+
+DEFAULT_TIMEOUT = (5, 30)
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.3
+RETRY_STATUS = (429, 500, 502, 503, 504)
+POOL_CONNECTIONS = 10
+POOL_MAXSIZE = 20
+# Retries may add at most this share of the requests of the last minute,
+# plus a small floor so a quiet client can still retry.
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN = 10
+RETRY_BUDGET_WINDOW = 60
+RETRY_BUDGET_BUCKET = 10
+BREAKER_FAILURE_THRESHOLD = 10
+BREAKER_FAILURE_WINDOW = 120
+BREAKER_RECOVERY_TIMEOUT = 60
+BREAKER_PROBE_TIMEOUT = 30
+REDIS_PREFIX = "itec_integrations"
+AIMD_TARGET_LATENCY = 5.0
+AIMD_INCREASE = 1
+AIMD_DECREASE = 0.5
+BULK_CHUNK_SIZE = 1000
+
+CLOSED = "Closed"
+OPEN = "Open"
+HALF_OPEN = "Half-Open"
+
+# KEYS: open_until, probe. ARGV: probe timeout, probe token.
+# 1: closed, 0: refused, 2: this caller holds the half-open probe.
+_ALLOW_SCRIPT = """
+local open_until = redis.call("GET", KEYS[1])
+if not open_until then
+	return 1
+end
+local now = redis.call("TIME")
+if tonumber(open_until) > tonumber(now[1]) then
+	return 0
+end
+if redis.call("SET", KEYS[2], ARGV[2], "NX", "EX", ARGV[1]) then
+	return 2
+end
+return 0
+"""
+
+# KEYS: failures, open_until, probe, trips.
+# ARGV: "success" or "failure", threshold, failure window, recovery timeout.
+# Returns the state after the outcome, "opened" when this call tripped it.
+_RECORD_SCRIPT = """
+local now = tonumber(redis.call("TIME")[1])
+local open_until = redis.call("GET", KEYS[2])
+if ARGV[1] == "success" then
+	if open_until then
+		if tonumber(open_until) > now then
+			return "open"
+		end
+		redis.call("DEL", KEYS[1], KEYS[2], KEYS[3])
+		return "closed"
+	end
+	if tonumber(redis.call("GET", KEYS[1]) or "0") > 0 then
+		redis.call("DECR", KEYS[1])
+	end
+	return "closed"
+end
+if open_until then
+	if tonumber(open_until) > now then
+		return "open"
+	end
+	redis.call("SET", KEYS[2], now + tonumber(ARGV[4]))
+	redis.call("DEL", KEYS[3])
+	redis.call("INCR", KEYS[4])
+	return "opened"
+end
+local failures = redis.call("INCR", KEYS[1])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+if failures >= tonumber(ARGV[2]) then
+	redis.call("SET", KEYS[2], now + tonumber(ARGV[4]))
+	redis.call("INCR", KEYS[4])
+	return "opened"
+end
+return "closed"
+"""
+
+# KEYS: the request buckets of the window, then the retry buckets, the
+# current one last. ARGV: ratio, minimum, bucket ttl.
+_SPEND_SCRIPT = """
+local half = #KEYS / 2
+local requests, retries = 0, 0
+for i = 1, half do
+	requests = requests + tonumber(redis.call("GET", KEYS[i]) or "0")
+	retries = retries + tonumber(redis.call("GET", KEYS[half + i]) or "0")
+end
+if retries >= math.max(tonumber(ARGV[2]), requests * tonumber(ARGV[1])) then
+	return 0
+end
+redis.call("INCR", KEYS[#KEYS])
+redis.call("EXPIRE", KEYS[#KEYS], ARGV[3])
+return 1
+"""
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class RetryBudget:
+	"""Caps retries at `ratio` of the requests made in the last `window`
+	seconds (at least `minimum`), so a failing upstream sees a bounded
+	amount of extra traffic instead of every caller retrying in full."""
+
+	def __init__(self, ratio=RETRY_BUDGET_RATIO, minimum=RETRY_BUDGET_MIN, window=RETRY_BUDGET_WINDOW):
+		self.ratio = ratio
+		self.minimum = minimum
+		self.window = window
+		self.requests = deque()
+		self.retries = deque()
+		self.lock = threading.Lock()
+
+	def record_request(self):
+		with self.lock:
+			self.requests.append(time.monotonic())
+
+	def try_spend(self):
+		with self.lock:
+			now = time.monotonic()
+			for events in (self.requests, self.retries):
+				while events and events[0] < now - self.window:
+					events.popleft()
+			if len(self.retries) >= max(self.minimum, len(self.requests) * self.ratio):
+				return False
+			self.retries.append(now)
+			return True
+
+
+class HostMetrics:
+	__slots__ = ("requests", "errors", "retries", "total_ms", "max_ms", "last_status")
+
+	def __init__(self):
+		self.requests = self.errors = self.retries = 0
+		self.total_ms = self.max_ms = 0.0
+		self.last_status = None
+
+	def as_dict(self):
+		return {
+			"requests": self.requests,
+			"errors": self.errors,
+			"retries": self.retries,
+			"avg_ms": flt(self.total_ms / self.requests, 1) if self.requests else 0.0,
+			"max_ms": flt(self.max_ms, 1),
+			"last_status": self.last_status,
+		}
+
+
+class HTTPClient:
+	def __init__(
+		self,
+		timeout=DEFAULT_TIMEOUT,
+		retries=DEFAULT_RETRIES,
+		backoff=DEFAULT_BACKOFF,
+		retry_status=RETRY_STATUS,
+		pool_maxsize=POOL_MAXSIZE,
+		budget=None,
+	):
+		self.timeout = timeout
+		self.retries = retries
+		self.backoff = backoff
+		self.retry_status = retry_status
+		self.budget = budget or RetryBudget()
+		self.adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize, max_retries=0)
+		self.local = threading.local()
+		self.metrics = {}
+		self.metrics_lock = threading.Lock()
+
+	@property
+	def session(self):
+		session = getattr(self.local, "session", None)
+		if session is None:
+			session = self.local.session = requests.Session()
+			session.headers["Accept-Encoding"] = "gzip, deflate"
+			session.mount("http://", self.adapter)
+			session.mount("https://", self.adapter)
+		return session
+
+	def request(self, method, url, retries=None, **kwargs):
+		"""Send a request, retrying connection errors, timeouts and retryable
+		statuses. Returns the last response (whatever its status) or raises
+		the last connection error."""
+		kwargs.setdefault("timeout", self.timeout)
+		retries = self.retries if retries is None else retries
+		host = urlsplit(url).netloc
+		attempt = 0
+		while True:
+			self.budget.record_request()
+			started = time.monotonic()
+			try:
+				response = self.session.request(method, url, **kwargs)
+			except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+				self._record(host, started, None, attempt)
+				if attempt < retries and self.budget.try_spend():
+					attempt += 1
+					self._sleep(attempt)
+					continue
+				raise
+
+			self._record(host, started, response.status_code, attempt)
+			if response.status_code in self.retry_status and attempt < retries and self.budget.try_spend():
+				response.close()
+				attempt += 1
+				self._sleep(attempt, response.headers.get("Retry-After"))
+				continue
+			return response
+
+	def get(self, url, **kwargs):
+		return self.request("GET", url, **kwargs)
+
+	def post(self, url, **kwargs):
+		return self.request("POST", url, **kwargs)
+
+	def _sleep(self, attempt, retry_after=None):
+		delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+		if retry_after and str(retry_after).isdigit():
+			delay = max(delay, int(retry_after))
+		time.sleep(delay)
+
+	def _record(self, host, started, status, attempt):
+		elapsed_ms = (time.monotonic() - started) * 1000
+		with self.metrics_lock:
+			metrics = self.metrics.setdefault(host, HostMetrics())
+			metrics.requests += 1
+			metrics.retries += 1 if attempt else 0
+			metrics.errors += 1 if status is None or status >= 400 else 0
+			metrics.total_ms += elapsed_ms
+			metrics.max_ms = max(metrics.max_ms, elapsed_ms)
+			metrics.last_status = status
+
+	def get_metrics(self):
+		with self.metrics_lock:
+			return {host: metrics.as_dict() for host, metrics in self.metrics.items()}
+
+
+class CircuitBreaker:
+	"""Circuit breaker for `host`, shared by every process of the site.
+
+	`threshold` failures within `failure_window` seconds open it for
+	`recovery` seconds. After that the first caller of `allow()` anywhere
+	gets to send a single probe request while everybody else is refused;
+	the probe's outcome closes the breaker or opens it again. A prober that
+	dies without reporting frees the probe after `probe_timeout` seconds."""
+
+	def __init__(
+		self,
+		host,
+		threshold=BREAKER_FAILURE_THRESHOLD,
+		failure_window=BREAKER_FAILURE_WINDOW,
+		recovery=BREAKER_RECOVERY_TIMEOUT,
+		probe_timeout=BREAKER_PROBE_TIMEOUT,
+	):
+		self.host = host
+		self.threshold = threshold
+		self.failure_window = failure_window
+		self.recovery = recovery
+		self.probe_timeout = probe_timeout
+		self.token = uuid.uuid4().hex
+
+	def _keys(self, cache):
+		prefix = f"{REDIS_PREFIX}:breaker:{self.host}"
+		return [cache.make_key(f"{prefix}:{part}") for part in ("failures", "open_until", "probe", "trips")]
+
+	def allow(self):
+		"""Whether a request may be sent now. Returns True for the half-open
+		probe too; its outcome must be reported with `record()`."""
+		cache = frappe.cache()
+		_failures, open_until, probe, _trips = self._keys(cache)
+		allowed = cint(cache.eval(_ALLOW_SCRIPT, 2, open_until, probe, self.probe_timeout, self.token))
+		if allowed == 2:
+			frappe.logger().info(f"Circuit breaker {self.host}: half-open, sending a probe request")
+		return bool(allowed)
+
+	def record(self, success):
+		"""Report the outcome of a request. Returns the breaker state after it."""
+		cache = frappe.cache()
+		outcome = frappe.safe_decode(
+			cache.eval(
+				_RECORD_SCRIPT,
+				4,
+				*self._keys(cache),
+				"success" if success else "failure",
+				self.threshold,
+				self.failure_window,
+				self.recovery,
+			)
+		)
+		if outcome == "opened":
+			frappe.logger().error(f"Circuit breaker {self.host}: opened for {self.recovery}s")
+		return CLOSED if outcome == "closed" else OPEN
+
+	def reset(self):
+		cache = frappe.cache()
+		cache.delete(*self._keys(cache)[:3])
+
+	def get_state(self):
+		cache = frappe.cache()
+		failures, open_until, probe, trips = cache.mget(self._keys(cache))
+		open_until = cint(open_until)
+		if not open_until:
+			state = CLOSED
+		elif open_until > time.time() and not probe:
+			state = OPEN
+		else:
+			state = HALF_OPEN
+		return {
+			"host": self.host,
+			"state": state,
+			"failures": cint(failures),
+			"open_until": datetime.fromtimestamp(open_until) if open_until else None,
+			"trips": cint(trips),
+		}
+
+
+class SharedRetryBudget:
+	"""`RetryBudget` kept in Redis for `host`: retries of every process
+	together stay under `ratio` of everybody's requests over the last
+	`window` seconds, so a failing upstream does not see retries multiply
+	with the number of workers. Counts are kept in `bucket`-second slices."""
+
+	def __init__(
+		self,
+		host,
+		ratio=RETRY_BUDGET_RATIO,
+		minimum=RETRY_BUDGET_MIN,
+		window=RETRY_BUDGET_WINDOW,
+		bucket=RETRY_BUDGET_BUCKET,
+	):
+		self.host = host
+		self.ratio = ratio
+		self.minimum = minimum
+		self.window = window
+		self.bucket = bucket
+
+	def _keys(self, cache, kind):
+		current = int(time.time() // self.bucket)
+		first = current - self.window // self.bucket + 1
+		prefix = f"{REDIS_PREFIX}:retry_budget:{self.host}:{kind}"
+		return [cache.make_key(f"{prefix}:{slot}") for slot in range(first, current + 1)]
+
+	def record_request(self):
+		cache = frappe.cache()
+		key = self._keys(cache, "requests")[-1]
+		pipeline = cache.pipeline()
+		pipeline.incr(key)
+		pipeline.expire(key, self.window + self.bucket)
+		pipeline.execute()
+
+	def try_spend(self):
+		cache = frappe.cache()
+		keys = self._keys(cache, "requests") + self._keys(cache, "retries")
+		return bool(
+			cint(
+				cache.eval(_SPEND_SCRIPT, len(keys), *keys, self.ratio, self.minimum, self.window + self.bucket)
+			)
+		)
+
+	def get_usage(self):
+		cache = frappe.cache()
+		requests_made = sum(cint(value) for value in cache.mget(self._keys(cache, "requests")))
+		retries = sum(cint(value) for value in cache.mget(self._keys(cache, "retries")))
+		return {
+			"requests": requests_made,
+			"retries": retries,
+			"limit": max(self.minimum, int(requests_made * self.ratio)),
+			"window": self.window,
+		}
+
+
+class AIMDController:
+	"""Additive-increase, multiplicative-decrease control of a batch size
+	between `minimum` and `maximum`.
+
+	Each fast, successful request adds `increase`; an error or a request
+	slower than `target_latency` seconds multiplies the size by `decrease`.
+	Requests started before the last decrease were sized and sent under the
+	old conditions, so their outcomes cannot trigger another one: one
+	congestion episode shrinks the size once, not once per request in
+	flight."""
+
+	def __init__(
+		self,
+		initial,
+		minimum,
+		maximum,
+		target_latency=AIMD_TARGET_LATENCY,
+		increase=AIMD_INCREASE,
+		decrease=AIMD_DECREASE,
+		clock=time.monotonic,
+	):
+		self.minimum = minimum
+		self.maximum = maximum
+		self.target_latency = target_latency
+		self.increase = increase
+		self.decrease = decrease
+		self.clock = clock
+		self.size = float(min(maximum, max(minimum, initial)))
+		self.last_decrease = None
+		self.lock = threading.Lock()
+
+	@property
+	def value(self):
+		return int(self.size)
+
+	def record(self, latency=None, ok=True, started=None):
+		"""Adjust the size from one request's outcome. `started` is the
+		controller clock when the request was sent. Returns the new size."""
+		with self.lock:
+			if ok and (latency is None or latency <= self.target_latency):
+				self.size = min(self.maximum, self.size + self.increase)
+			elif started is None or self.last_decrease is None or started >= self.last_decrease:
+				self.size = max(self.minimum, self.size * self.decrease)
+				self.last_decrease = self.clock()
+			return self.value
+
+
+def get_client(name, **kwargs):
+	"""The process-wide client for integration `name`; `kwargs` configure it
+	on first use only."""
+	with _clients_lock:
+		if name not in _clients:
+			_clients[name] = HTTPClient(**kwargs)
+		return _clients[name]
+
+
+@frappe.whitelist()
+def get_http_metrics():
+	"""Per-client, per-host request metrics of this worker process."""
+	frappe.only_for("System Manager")
+	with _clients_lock:
+		clients = dict(_clients)
+	return {name: client.get_metrics() for name, client in clients.items()}
+
+
+def chunked(iterable, size=BULK_CHUNK_SIZE):
+	iterator = iter(iterable)
+	while True:
+		chunk = list(islice(iterator, size))
+		if not chunk:
+			return
+		yield chunk
+
+
+def bulk_upsert(doctype, fields, values, update_fields, chunk_size=BULK_CHUNK_SIZE):
+	"""Multi-row `INSERT ... ON DUPLICATE KEY UPDATE`: rows whose primary (or a
+	unique) key already exists get `update_fields` overwritten, the rest are
+	inserted."""
+	if not values:
+		return
+
+	columns = ", ".join(f"`{fieldname}`" for fieldname in fields)
+	updates = ", ".join(f"`{fieldname}` = VALUES(`{fieldname}`)" for fieldname in update_fields)
+	placeholder = "(" + ", ".join(["%s"] * len(fields)) + ")"
+	for chunk in chunked(values, chunk_size):
+		frappe.db.sql(
+			f"""
+				INSERT INTO `tab{doctype}` ({columns})
+				VALUES {", ".join([placeholder] * len(chunk))}
+				ON DUPLICATE KEY UPDATE {updates}
+			""",
+			tuple(value for row in chunk for value in row),
+		)